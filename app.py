@@ -2,5 +2,6 @@ from app import create_app
 
 app = create_app()
 
+# Development server only; production runs wsgi:app under gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
     app.run(debug=True)
@@ -1,46 +1,120 @@
 import os
-from dotenv import load_dotenv
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_migrate import Migrate
+from .authz import AccessControl
+from .cache import UserCache, TaskListCache
+from .delivery import Delivery
+from .database import RoutingSession, configure_engine_options, configure_engines, init_replica_routing
+from .hashing import PasswordHasher
+from .jobs import JobQueue
+from .metrics import Metrics
+from .ratelimit import RateLimiter
+from .sharding import TaskShards
+from .writebehind import StatusWriteBuffer
 
-load_dotenv()
-
-# Initialize the database instance
-db = SQLAlchemy()
+# Initialize the database instance; its session can route GET reads to a read replica
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Initialize the login manager instance
 login_manager = LoginManager()
 
+# Initialize the user identity cache used by the user loader
+user_cache = UserCache()
+
+# Initialize the rendered task-list cache
+task_list_cache = TaskListCache()
+
+# Initialize the optional sharding of tasks and permissions across databases
+task_shards = TaskShards()
+
+# Initialize the authorization checks and their optional access index
+access_control = AccessControl()
+
+# Initialize the password hasher that offloads key derivation to a process pool
+password_hasher = PasswordHasher()
+
+# Initialize the background job queue for slow admin operations
+job_queue = JobQueue()
+
+# Initialize the optional write-behind buffer for task status changes
+status_writes = StatusWriteBuffer()
+
+# Initialize the rate limiter for login, registration, other form posts and API writes
+rate_limiter = RateLimiter()
+
+# Initialize response compression, hashed static URLs and the template bytecode cache
+delivery = Delivery()
+
+# Initialize the request instrumentation (inactive unless METRICS_ENABLED or SLOW_QUERY_THRESHOLD_MS is set)
+metrics = Metrics()
+
+# Flask-Migrate pulls in Alembic, which only the `flask db` commands (and tools driving
+# migrations directly) need
+def init_migrate(app):
+    from flask_migrate import Migrate
+    from .search import include_name
+    # Batch mode lets migrations alter constraints on SQLite; the full-text index is left to its own migration
+    Migrate(app, db, render_as_batch=True, include_name=include_name)
+
 def create_app(config_name=None):
     app = Flask(__name__)
 
-    if config_name:
-        app.config.from_object(config_name)
-    else:
-        app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
-        app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI')
-        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-        
+    # Settings come from config.py; APP_CONFIG picks the class (config.Config by default),
+    # with environment variables optionally read from .env first
+    if config_name is None:
+        from dotenv import load_dotenv
+        load_dotenv()
+    app.config.from_object(config_name or os.getenv('APP_CONFIG', 'config.Config'))
+
+    # Pool options, the replica bind and the shard binds must be in place before the engines are
+    # created, SQLite pragmas are hooked onto the engines afterwards
+    configure_engine_options(app)
+    init_replica_routing(app)
+    task_shards.init_app(app)
     db.init_app(app)
+    with app.app_context():
+        configure_engines(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'main.login'  # Ensure this is correctly prefixed
+    user_cache.init_app(app)
+    task_list_cache.init_app(app)
+    access_control.init_app(app)
+    password_hasher.init_app(app)
+    job_queue.init_app(app)
+    status_writes.init_app(app)
+    rate_limiter.init_app(app)
+    delivery.init_app(app)
 
-    migrate = Migrate(app, db)
+    # Only the CLI (create_app called by `flask ...`) sets up migrations
+    if click.get_current_context(silent=True) is not None:
+        init_migrate(app)
 
     # Import and register the main Blueprint for organizing routes
     from .routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    # Register the JSON API; unauthenticated API calls get a 401 instead of a login redirect
+    from .api import api as api_blueprint
+    app.register_blueprint(api_blueprint)
+    login_manager.blueprint_login_views['api'] = None
+
+    # Register the maintenance commands available through `flask <command>`
+    from .commands import register_commands
+    register_commands(app)
+
+    metrics.init_app(app, db)
+
     # User loader function used by Flask-Login to load a user by ID
     @login_manager.user_loader
     def load_user(user_id):
-        from .models import User
-        return User.query.get(int(user_id))  # Fetch the user from the database by ID
+        return user_cache.load(int(user_id))  # Served from the cache, falling back to the database
 
-    # Ensure that all necessary database tables are created before the app runs
-    with app.app_context():
-        db.create_all()
+    # Create missing tables on startup unless the schema is left to migrations / `flask init-db`
+    if app.config.get('AUTO_CREATE_TABLES', True):
+        with app.app_context():
+            db.create_all()
+            task_shards.create_all()
 
     return app
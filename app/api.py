@@ -0,0 +1,306 @@
+import io
+import json
+import time
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from flask_login import login_required, current_user
+from werkzeug.exceptions import HTTPException
+from .models import TaskStatus, ArchivedTask
+from .pagination import get_per_page
+from .signals import notify_tasks_changed, notify_recipients
+from .sharing import bulk_share
+from .search import search_tasks
+from .feed import changes_since, latest_event_id, wait_for_changes
+from .archive import ArchiveError, archived_status_visible, page_with_archived, restorable, restore_tasks
+from .transfer import TransferError, check_format, export_chunks, export_statement, import_tasks
+from .writebehind import StatusWriteError
+from . import db, store, status_writes, access_control
+
+DEFAULT_MAX_BATCH = 5000
+DEFAULT_LONG_POLL_TIMEOUT = 25
+DEFAULT_STREAM_SECONDS = 55
+HEARTBEAT_SECONDS = 15
+
+# Create a Blueprint for the versioned JSON API
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Raised for request bodies the API cannot accept; answered as JSON
+class APIError(Exception):
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+@api.errorhandler(APIError)
+def handle_api_error(error):
+    return jsonify(error=error.message, **error.extra), error.status
+
+@api.errorhandler(HTTPException)
+def handle_http_error(error):
+    return jsonify(error=error.name), error.code
+
+# Leaves "status" out when the user may not see it (a share without can_view_status)
+def task_to_dict(task, status_visible=True):
+    data = {
+        'id': task.id,
+        'title': task.title,
+        'description': task.description,
+        'status': task.status.name,
+        'user_id': task.user_id,
+        'timestamp': task.timestamp.isoformat() if task.timestamp else None,
+    }
+    if not status_visible:
+        del data['status']
+    return data
+
+def get_json_body():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise APIError('Expected a JSON object body.')
+    return body
+
+# Validates a list of ids or objects against the batch size limit
+def get_batch(body, key):
+    items = body.get(key)
+    if not isinstance(items, list) or not items:
+        raise APIError(f'"{key}" must be a non-empty list.')
+    max_batch = current_app.config.get('API_MAX_BATCH', DEFAULT_MAX_BATCH)
+    if len(items) > max_batch:
+        raise APIError(f'At most {max_batch} items per batch.', status=413)
+    return items
+
+def get_task_ids(body):
+    ids = get_batch(body, 'ids')
+    if not all(isinstance(task_id, int) and not isinstance(task_id, bool) for task_id in ids):
+        raise APIError('"ids" must contain integers.')
+    return set(ids)
+
+def get_status(value):
+    if value not in TaskStatus.__members__:
+        raise APIError(f'Invalid status: {value!r}.')
+    return TaskStatus[value]
+
+# Checks a whole batch with one query. Tasks that do not exist are reported the same way as
+# tasks the user may not touch, and the batch is rejected as a whole.
+def require_allowed(action, task_ids):
+    denied = task_ids - access_control.allowed(current_user, action, task_ids)
+    if denied:
+        raise APIError('You do not have permission to modify these tasks.', status=403, ids=sorted(denied))
+
+# Route to list the tasks the user owns or can view, one keyset page at a time.
+# With ?include_archived=1 archived tasks are merged in, marked with "archived": true.
+@api.route('/tasks', methods=['GET'])
+@login_required
+def list_tasks():
+    if request.args.get('include_archived', type=int):
+        page = page_with_archived(current_user, get_per_page(), after=request.args.get('after'))
+        archived = {task.id for task in page if isinstance(task, ArchivedTask)}
+        visible = access_control.can(current_user, 'view_status', [task.id for task in page if task.id not in archived])
+        visible.update(dict.fromkeys(archived_status_visible(current_user, archived), True))
+        tasks = [
+            dict(task_to_dict(task, visible.get(task.id)), archived=isinstance(task, ArchivedTask))
+            for task in page
+        ]
+        return jsonify(tasks=tasks, next=page.next_cursor)
+    page = store.visible_tasks_page(current_user, get_per_page(), after=request.args.get('after'))
+    visible = access_control.can(current_user, 'view_status', [task.id for task in page])
+    return jsonify(tasks=[task_to_dict(task, visible.get(task.id)) for task in page], next=page.next_cursor)
+
+# Route to run a ranked full-text search over the tasks the user can see
+@api.route('/tasks/search', methods=['GET'])
+@login_required
+def search():
+    terms = request.args.get('q', '').strip()
+    if not terms:
+        raise APIError('"q" is required.')
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, has_more = search_tasks(current_user, terms, page=page, per_page=get_per_page())
+    visible = access_control.can(current_user, 'view_status', [task.id for task in results])
+    return jsonify(tasks=[task_to_dict(task, visible.get(task.id)) for task in results], page=page, has_more=has_more)
+
+def get_since():
+    # EventSource sends Last-Event-ID when it reconnects; it supersedes the ?since of the first request
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if since is None:
+        return None
+    try:
+        return max(int(since), 0)
+    except ValueError:
+        raise APIError('"since" must be an event id.')
+
+# One feed entry: the task as the user may see it now, or a removal
+def change_to_dict(cursor, task_id, task, visibility):
+    if task is None:
+        return {'cursor': cursor, 'type': 'removed', 'task_id': task_id}
+    data = task_to_dict(task, visibility.get(task_id))
+    return {'cursor': cursor, 'type': 'updated', 'task_id': task_id, 'task': data}
+
+# Route to poll the change feed: the tasks that changed for this user after `since`.
+# With `wait` the request is held until there is a change (long poll, capped by
+# FEED_LONG_POLL_TIMEOUT). Without `since` it only returns the current cursor.
+@api.route('/events', methods=['GET'])
+@login_required
+def poll_events():
+    since = get_since()
+    if since is None:
+        return jsonify(events=[], cursor=latest_event_id(current_user.id))
+    wait = min(request.args.get('wait', 0, type=float),
+               current_app.config.get('FEED_LONG_POLL_TIMEOUT', DEFAULT_LONG_POLL_TIMEOUT))
+    changes, visibility = wait_for_changes(current_user, since, wait) if wait > 0 else changes_since(current_user, since)
+    events = [change_to_dict(*change, visibility) for change in changes]
+    return jsonify(events=events, cursor=events[-1]['cursor'] if events else since)
+
+# Route to follow the change feed as Server-Sent Events. The stream ends after
+# FEED_STREAM_SECONDS; EventSource reconnects on its own and resumes from Last-Event-ID.
+@api.route('/events/stream', methods=['GET'])
+@login_required
+def stream_events():
+    since = get_since()
+    if since is None:
+        since = latest_event_id(current_user.id)
+    user = current_user._get_current_object()
+    duration = current_app.config.get('FEED_STREAM_SECONDS', DEFAULT_STREAM_SECONDS)
+
+    def generate(since):
+        yield 'retry: 3000\n\n'
+        deadline = time.monotonic() + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            changes, visibility = wait_for_changes(user, since, min(HEARTBEAT_SECONDS, remaining))
+            db.session.close()
+            if not changes:
+                yield ': keep-alive\n\n'
+            for change in changes:
+                event = change_to_dict(*change, visibility)
+                since = event['cursor']
+                yield f'id: {since}\ndata: {json.dumps(event)}\n\n'
+
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # Let nginx pass events through unbuffered
+    return response
+
+# Route to set the status of one owned task; answers 204 instead of redirecting to the list
+@api.route('/tasks/<int:task_id>/status', methods=['PATCH'])
+@login_required
+def update_task_status(task_id):
+    status = get_status(get_json_body().get('status'))
+    require_allowed('update_status', {task_id})
+    try:
+        status_writes.write(task_id, status)
+    except StatusWriteError as error:
+        raise APIError(str(error), status=503)
+    return '', 204
+
+# Route to create many tasks with a single bulk INSERT (one per shard with TASK_SHARDS)
+@api.route('/tasks/batch', methods=['POST'])
+@login_required
+def create_tasks():
+    rows = []
+    for item in get_batch(get_json_body(), 'tasks'):
+        if not isinstance(item, dict) or not isinstance(item.get('title'), str) or not item['title'].strip():
+            raise APIError('Every task needs a non-empty "title".')
+        if not isinstance(item.get('description'), (str, type(None))):
+            raise APIError('"description" must be a string or null.')
+        rows.append({
+            'title': item['title'][:150],
+            'description': item.get('description'),
+            'status': get_status(item.get('status', 'NOT_STARTED')),
+            'user_id': current_user.id,
+        })
+    task_ids = store.create_tasks(rows)
+    notify_tasks_changed({current_user.id}, task_ids)
+    return jsonify(created=task_ids), 201
+
+# Route to set the status of many owned tasks with a single UPDATE (or one buffered write)
+@api.route('/tasks/status', methods=['PATCH'])
+@login_required
+def update_tasks_status():
+    body = get_json_body()
+    task_ids = get_task_ids(body)
+    status = get_status(body.get('status'))
+    require_allowed('update_status', task_ids)
+    try:
+        status_writes.write_many(task_ids, status)
+    except StatusWriteError as error:
+        raise APIError(str(error), status=503)
+    return jsonify(updated=len(task_ids))
+
+# Route to delete many tasks and their permissions in one transaction
+@api.route('/tasks', methods=['DELETE'])
+@login_required
+def delete_tasks():
+    task_ids = get_task_ids(get_json_body())
+    require_allowed('delete', task_ids)
+    notify_recipients(store.delete_tasks(task_ids))
+    return jsonify(deleted=len(task_ids))
+
+# Route to share many tasks with many users in one bulk upsert
+@api.route('/tasks/share', methods=['POST'])
+@login_required
+def share_tasks():
+    body = get_json_body()
+    task_ids = get_task_ids(body)
+    usernames = get_batch(body, 'usernames')
+    if not all(isinstance(username, str) for username in usernames):
+        raise APIError('"usernames" must contain strings.')
+    require_allowed('share', task_ids)
+    return jsonify(bulk_share(task_ids, usernames, actor=current_user).as_dict())
+
+# Route to move archived tasks back to the task table. Returns the live id of each restored task.
+@api.route('/tasks/restore', methods=['POST'])
+@login_required
+def restore_archived_tasks():
+    task_ids = get_task_ids(get_json_body())
+    denied = task_ids - restorable(current_user, task_ids)
+    if denied:
+        raise APIError('You do not have permission to restore these tasks.', status=403, ids=sorted(denied))
+    try:
+        restored = restore_tasks(task_ids)
+    except ArchiveError as error:
+        raise APIError(str(error))
+    return jsonify(restored={str(archived_id): task_id for archived_id, task_id in restored.items()})
+
+EXPORT_MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+def get_format(default='ndjson'):
+    fmt = request.args.get('format')
+    if fmt is None and request.mimetype == 'text/csv':
+        fmt = 'csv'
+    try:
+        return check_format(fmt or default)
+    except TransferError as error:
+        raise APIError(str(error))
+
+# Route to download tasks as CSV or NDJSON (?format=), streamed batch by batch.
+# ?scope= is owned, shared, visible (default) or, for admins, all.
+@api.route('/tasks/export', methods=['GET'])
+@login_required
+def export_tasks():
+    fmt = get_format()
+    scope = request.args.get('scope', 'visible')
+    try:
+        export_statement(scope, current_user) # Validates the scope before the response starts
+    except TransferError as error:
+        raise APIError(str(error), status=403 if scope == 'all' and not current_user.is_administrator() else 400)
+    response = Response(stream_with_context(export_chunks(fmt, scope, current_user)), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=tasks-{scope}.{fmt}'
+    return response
+
+# Route to create tasks from an export-formatted request body, read and inserted in batches.
+# The tasks belong to the caller; admins can pass ?keep_owners=1 to use each record's owner.
+@api.route('/tasks/import', methods=['POST'])
+@login_required
+def import_tasks_route():
+    fmt = get_format()
+    keep_owners = request.args.get('keep_owners', type=int) == 1
+    if keep_owners and not current_user.is_administrator():
+        raise APIError('Only admins can import tasks for other users.', status=403)
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        result = import_tasks(stream, fmt, owner=None if keep_owners else current_user)
+    except UnicodeDecodeError:
+        raise APIError('The body must be UTF-8 encoded.')
+    return jsonify(result.as_dict())
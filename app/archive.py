@@ -0,0 +1,159 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.orm import joinedload
+from .jobs import job
+from .models import Task, Permission, TaskStatus, ArchivedTask, ArchivedPermission
+from .pagination import Page, encode_cursor, keyset_page, visible_tasks_query
+from .signals import notify_tasks_changed, notify_recipients
+from .utils import task_audience, task_recipients
+from . import db, access_control, task_shards
+
+DEFAULT_AFTER_DAYS = 90
+DEFAULT_STATUSES = ('COMPLETED',)
+DEFAULT_BATCH = 1000
+
+TASK_COLUMNS = ('id', 'title', 'description', 'status', 'user_id', 'timestamp')
+PERMISSION_COLUMNS = ('user_id', 'task_id', 'can_view', 'can_view_status')
+
+# Hot/cold split of the task table. Tasks matching the archive policy (ARCHIVE_STATUSES, created
+# more than ARCHIVE_AFTER_DAYS ago) move with their shares to archived_task/archived_permission,
+# ARCHIVE_BATCH_SIZE tasks per transaction, so the live table and its indexes only grow with
+# current work. Archived tasks keep their id; every listing, search, permission check and the
+# dashboard counters see live tasks only, and the archive is read through archived_tasks_query
+# or `?include_archived=1` on the API listing. To their audience an archived task looks deleted
+# (tasks_changed is sent) until it is restored.
+
+def archive_policy(days=None, statuses=None):
+    days = current_app.config.get('ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS) if days is None else days
+    statuses = statuses or current_app.config.get('ARCHIVE_STATUSES', DEFAULT_STATUSES)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    # The task with the highest id always stays live: SQLite gives a new task max(id) + 1, which
+    # would otherwise hand out an archived task's id again
+    newest = select(func.max(Task.id)).scalar_subquery()
+    return Task.status.in_([TaskStatus[status] for status in statuses]) & (Task.timestamp < cutoff) & (Task.id < newest)
+
+# Raised when the archive cannot be used; the message is shown to the user
+class ArchiveError(RuntimeError):
+    pass
+
+def check_archive():
+    if task_shards.enabled:
+        # The archive tables are in the global database, the live tasks on the shards
+        raise ArchiveError('Archiving is not available with TASK_SHARDS yet.')
+
+def _columns(model, names):
+    return [getattr(model, name) for name in names]
+
+# Moves every task matching the policy into the archive; returns the tasks and shares moved
+def archive_tasks(days=None, statuses=None, batch_size=None):
+    check_archive()
+    policy = archive_policy(days, statuses)
+    batch_size = batch_size or current_app.config.get('ARCHIVE_BATCH_SIZE', DEFAULT_BATCH)
+    moved = {'tasks': 0, 'permissions': 0}
+    while True:
+        # Locked until the commit (PostgreSQL), so no share or status change slips in between
+        task_ids = list(db.session.scalars(
+            select(Task.id).where(policy).order_by(Task.id).limit(batch_size).with_for_update()
+        ))
+        if not task_ids:
+            break
+        recipients = task_recipients(task_ids) # Collected first: the permissions move with the tasks
+        now = datetime.utcnow()
+        db.session.execute(insert(ArchivedTask).from_select(
+            TASK_COLUMNS + ('archived_at',),
+            select(*_columns(Task, TASK_COLUMNS), literal(now, db.DateTime)).where(Task.id.in_(task_ids)),
+        ))
+        shares = db.session.execute(insert(ArchivedPermission).from_select(
+            PERMISSION_COLUMNS,
+            select(*_columns(Permission, PERMISSION_COLUMNS)).where(Permission.task_id.in_(task_ids)),
+        )).rowcount
+        db.session.execute(delete(Permission).where(Permission.task_id.in_(task_ids)))
+        db.session.execute(delete(Task).where(Task.id.in_(task_ids)))
+        db.session.commit()
+        notify_recipients(recipients) # A batch spans many owners
+        moved['tasks'] += len(task_ids)
+        moved['permissions'] += shares
+    return moved
+
+# Moves archived tasks back into the task table; returns {archived id: live id}. A task gets its
+# old id back unless a new task has taken it meanwhile (on SQLite, once the tasks above it were
+# deleted), in which case it and its shares get one above every live and archived id.
+def restore_tasks(task_ids):
+    check_archive()
+    task_ids = set(db.session.scalars(select(ArchivedTask.id).where(ArchivedTask.id.in_(list(task_ids)))))
+    if not task_ids:
+        return {}
+    taken = set(db.session.scalars(select(Task.id).where(Task.id.in_(task_ids))))
+    free = task_ids - taken
+    restored = {task_id: task_id for task_id in free}
+    if free:
+        db.session.execute(insert(Task).from_select(
+            TASK_COLUMNS, select(*_columns(ArchivedTask, TASK_COLUMNS)).where(ArchivedTask.id.in_(free)),
+        ))
+        db.session.execute(insert(Permission).from_select(
+            PERMISSION_COLUMNS,
+            select(*_columns(ArchivedPermission, PERMISSION_COLUMNS)).where(ArchivedPermission.task_id.in_(free)),
+        ))
+    for archived in db.session.scalars(select(ArchivedTask).where(ArchivedTask.id.in_(taken)).order_by(ArchivedTask.id)):
+        task_id = max(
+            db.session.scalar(select(func.max(Task.id))) or 0,
+            db.session.scalar(select(func.max(ArchivedTask.id))) or 0,
+        ) + 1
+        db.session.execute(insert(Task).values(
+            id=task_id, title=archived.title, description=archived.description, status=archived.status,
+            user_id=archived.user_id, timestamp=archived.timestamp,
+        ))
+        db.session.execute(insert(Permission).from_select(
+            PERMISSION_COLUMNS,
+            select(ArchivedPermission.user_id, literal(task_id), ArchivedPermission.can_view, ArchivedPermission.can_view_status)
+            .where(ArchivedPermission.task_id == archived.id),
+        ))
+        restored[archived.id] = task_id
+    db.session.execute(delete(ArchivedPermission).where(ArchivedPermission.task_id.in_(task_ids)))
+    db.session.execute(delete(ArchivedTask).where(ArchivedTask.id.in_(task_ids)))
+    db.session.commit()
+    live_ids = list(restored.values())
+    notify_tasks_changed(task_audience(live_ids), live_ids)
+    return restored
+
+# The archived tasks among `task_ids` the user may restore: their owner's, or any for admins
+def restorable(user, task_ids):
+    query = select(ArchivedTask.id).where(ArchivedTask.id.in_(list(task_ids)))
+    if not user.is_administrator():
+        query = query.where(ArchivedTask.user_id == user.id)
+    return set(db.session.scalars(query))
+
+# Archived tasks the user owned or could view, like visible_tasks_query for the live table
+def archived_tasks_query(user):
+    query = ArchivedTask.query.options(joinedload(ArchivedTask.owner))
+    condition = access_control.view_condition(user, ArchivedTask, ArchivedPermission)
+    return query if condition is None else query.filter(condition)
+
+# Ids of archived tasks whose status the user may see (owner, admin or can_view_status)
+def archived_status_visible(user, task_ids):
+    task_ids = list(task_ids)
+    if user.is_administrator():
+        return set(task_ids)
+    owned = select(ArchivedTask.id).where(ArchivedTask.id.in_(task_ids), ArchivedTask.user_id == user.id)
+    shared = select(ArchivedPermission.task_id).where(
+        ArchivedPermission.task_id.in_(task_ids),
+        ArchivedPermission.user_id == user.id,
+        ArchivedPermission.can_view_status == True
+    )
+    return set(db.session.scalars(owned.union(shared)))
+
+# One keyset page over the live and archived tasks the user can see, newest first: a page of each
+# from the same cursor, merged. Both are ordered on the same (timestamp, id) key the cursor holds.
+def page_with_archived(user, per_page, after=None):
+    live = keyset_page(visible_tasks_query(user), per_page, after=after)
+    archived = keyset_page(archived_tasks_query(user), per_page, after=after, model=ArchivedTask)
+    items = sorted(live.items + archived.items, key=lambda task: (task.timestamp, task.id), reverse=True)
+    has_more = len(items) > per_page or live.has_next or archived.has_next
+    items = items[:per_page]
+    next_cursor = encode_cursor(items[-1]) if items and has_more else None
+    return Page(items, next_cursor=next_cursor, per_page=per_page)
+
+@job('archive-tasks')
+def archive_tasks_job(days=None, statuses=None):
+    return archive_tasks(days, statuses)
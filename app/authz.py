@@ -0,0 +1,187 @@
+from flask import current_app, g, has_app_context
+from .cache import make_cache
+from .signals import tasks_changed
+
+# What a user may do with a task:
+#   view, view_status  the owner, admins, and users it is shared with (can_view / can_view_status)
+#   update_status      the owner only
+#   edit, share, delete the owner and admins
+ACTIONS = ('view', 'view_status', 'update_status', 'edit', 'share', 'delete')
+OWNER_ONLY = ('update_status',)
+SHARED = {'view': 0, 'view_status': 1}
+
+def decide(user, action, access):
+    if action not in ACTIONS:
+        raise ValueError(f'Unknown action: {action!r}')
+    if access is None:
+        return False # No such task
+    owner_id, shared = access
+    if owner_id == user.id:
+        return True
+    if action in OWNER_ONLY:
+        return False
+    if user.is_administrator():
+        return True
+    return action in SHARED and shared is not None and bool(shared[SHARED[action]])
+
+# Answers every permission question about tasks for the current user from one query per batch.
+# A task's access (its owner plus the user's (can_view, can_view_status) share, if any) is
+# memoized on `g` for the rest of the request. With AUTHZ_INDEX_ENABLED, each task's whole access
+# list (owner and every share) is also kept in a process-wide index on the cache backend, so
+# repeated checks skip the database; it is invalidated through tasks_changed, which every share,
+# delete and task edit sends. Admin rights are read from the user object itself (see UserCache),
+# so a toggled admin flag applies on the next request without touching the index.
+class AccessControl:
+    def init_app(self, app):
+        app.extensions['access_index'] = {
+            'backend': make_cache(
+                app,
+                prefix='acl:',
+                maxsize=app.config.get('AUTHZ_INDEX_SIZE', 100000),
+                ttl=app.config.get('AUTHZ_INDEX_TTL', 300),
+            ),
+            'enabled': app.config.get('AUTHZ_INDEX_ENABLED', False),
+            'hits': 0,
+            'misses': 0,
+        }
+
+        # `g` outlives the request when the app context is pushed separately (tests, CLI)
+        app.teardown_request(lambda exc: self.forget())
+
+    @property
+    def _state(self):
+        return current_app.extensions['access_index']
+
+    # {task_id: (owner_id, (can_view, can_view_status) or None) or None} for one user
+    def access(self, user, task_ids):
+        memo = g.setdefault('_access', {})
+        found = {}
+        missing = []
+        for task_id in set(task_ids):
+            key = (user.id, task_id)
+            if key in memo:
+                found[task_id] = memo[key]
+            else:
+                missing.append(task_id)
+        if missing:
+            loaded = self._load_indexed(user, missing) if self._state['enabled'] else self._load(user, missing)
+            for task_id in missing:
+                memo[(user.id, task_id)] = found[task_id] = loaded.get(task_id)
+        return found
+
+    def _load(self, user, task_ids):
+        from sqlalchemy import and_, select
+        from .models import Task, Permission
+        from . import db, task_shards
+        if task_shards.enabled:
+            return task_shards.access(user.id, task_ids)
+        rows = db.session.execute(
+            select(Task.id, Task.user_id, Permission.can_view, Permission.can_view_status)
+            .outerjoin(Permission, and_(Permission.task_id == Task.id, Permission.user_id == user.id))
+            .where(Task.id.in_(task_ids))
+        )
+        return {
+            task_id: (owner_id, (can_view, can_view_status) if can_view is not None else None)
+            for task_id, owner_id, can_view, can_view_status in rows
+        }
+
+    def _load_indexed(self, user, task_ids):
+        state = self._state
+        backend = state['backend']
+        entries = {}
+        misses = []
+        for task_id in task_ids:
+            entry = backend.get(str(task_id))
+            if entry is None:
+                misses.append(task_id)
+            else:
+                entries[task_id] = entry
+        state['hits'] += len(entries)
+        state['misses'] += len(misses)
+        if misses:
+            for task_id, entry in self._load_entries(misses).items():
+                backend.set(str(task_id), entry)
+                entries[task_id] = entry
+        shares_key = str(user.id)
+        return {
+            task_id: (entry['owner'], entry['shares'].get(shares_key))
+            for task_id, entry in entries.items()
+        }
+
+    # Index entries hold every share of the task, keyed by user id as a string (JSON for Redis)
+    def _load_entries(self, task_ids):
+        from sqlalchemy import select
+        from .models import Task, Permission
+        from . import db, task_shards
+        if task_shards.enabled:
+            return task_shards.access_entries(task_ids)
+        entries = {}
+        rows = db.session.execute(
+            select(Task.id, Task.user_id, Permission.user_id, Permission.can_view, Permission.can_view_status)
+            .outerjoin(Permission, Permission.task_id == Task.id)
+            .where(Task.id.in_(task_ids))
+        )
+        for task_id, owner_id, user_id, can_view, can_view_status in rows:
+            entry = entries.setdefault(task_id, {'owner': owner_id, 'shares': {}})
+            if user_id is not None:
+                entry['shares'][str(user_id)] = [bool(can_view), bool(can_view_status)]
+        return entries
+
+    # The view rule of `decide` as a SQL condition, for listings and searches that filter in the
+    # query itself. `task` and `permission` are Task and Permission, the archive models or a
+    # shard's table columns. None for admins, who may view every task.
+    def view_condition(self, user, task, permission):
+        from sqlalchemy import or_, select
+        if user.is_administrator():
+            return None
+        shared_ids = select(permission.task_id).where(permission.user_id == user.id, permission.can_view == True)
+        return or_(task.user_id == user.id, task.id.in_(shared_ids))
+
+    # {task_id: bool} for each of `task_ids`
+    def can(self, user, action, task_ids):
+        return {task_id: decide(user, action, access) for task_id, access in self.access(user, task_ids).items()}
+
+    # The subset of `task_ids` the user may act on
+    def allowed(self, user, action, task_ids):
+        return {task_id for task_id, permitted in self.can(user, action, task_ids).items() if permitted}
+
+    # {action: {task_id: bool}} for a page of tasks, e.g. to decide which controls a list shows
+    def permissions(self, user, task_ids, actions=ACTIONS):
+        access = self.access(user, task_ids)
+        return {action: {task_id: decide(user, action, entry) for task_id, entry in access.items()} for action in actions}
+
+    # Must run after the write has been committed (tasks_changed does this for every write)
+    def invalidate(self, task_ids):
+        task_ids = set(task_ids)
+        backend = self._state['backend']
+        for task_id in task_ids:
+            backend.delete(str(task_id))
+        memo = g.get('_access')
+        if memo:
+            for key in [key for key in memo if key[1] in task_ids]:
+                del memo[key]
+
+    # Drops the request's memo
+    def forget(self):
+        g.pop('_access', None)
+
+    def clear(self):
+        self._state['backend'].clear()
+        self.forget()
+
+    def stats(self):
+        state = self._state
+        backend = state['backend']
+        return {
+            'enabled': state['enabled'],
+            'hits': state['hits'],
+            'misses': state['misses'],
+            'size': len(backend) if hasattr(backend, '__len__') else None,
+        }
+
+# AccessControl keeps no state of its own, so a fresh instance works on the current app
+def _invalidate_access(app, task_ids, **extra):
+    if task_ids and 'access_index' in app.extensions and has_app_context():
+        AccessControl().invalidate(task_ids)
+
+tasks_changed.connect(_invalidate_access)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app
+from .signals import tasks_changed
+
+try:
+    import redis
+except ImportError: # Only needed for the shared backend
+    redis = None
+
+# In-process cache: least recently used entries are evicted past maxsize, entries expire after ttl seconds
+class LRUCache:
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# Shared cache backed by Redis (or anything speaking its protocol), so every worker sees the same entries
+class RedisCache:
+    def __init__(self, url, prefix='taskmanager:', ttl=300):
+        if redis is None:
+            raise RuntimeError('The redis cache backend requires the "redis" package.')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+# Picks the backend from CACHE_BACKEND ('memory' or 'redis')
+def make_cache(app, prefix, maxsize, ttl):
+    backend = app.config.get('CACHE_BACKEND', 'memory')
+    if backend == 'redis':
+        return RedisCache(app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'), prefix=prefix, ttl=ttl)
+    if backend == 'memory':
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    raise ValueError(f'Unknown CACHE_BACKEND: {backend}')
+
+# The memory backend is invalidated only in the process that made the change, so with several
+# server processes the caches built on it would serve stale users, task lists and permissions.
+# Turns them off unless CACHE_BACKEND is shared; returns the names of those turned off
+# (called by gunicorn.conf.py in each worker).
+def disable_process_caches(app, processes):
+    if processes <= 1 or app.config.get('CACHE_BACKEND', 'memory') != 'memory':
+        return []
+    disabled = []
+    for name in ('user_cache', 'task_list_cache', 'access_index'):
+        if app.extensions[name]['enabled']:
+            app.extensions[name]['enabled'] = False
+            disabled.append(name)
+    return disabled
+
+# Caches the columns Flask-Login needs so authenticated requests skip the user SELECT.
+# The password hash is deliberately not cached; it is lazy-loaded if a route needs it.
+class UserCache:
+    def init_app(self, app):
+        app.extensions['user_cache'] = {
+            'backend': make_cache(
+                app,
+                prefix='user:',
+                maxsize=app.config.get('USER_CACHE_SIZE', 10000),
+                ttl=app.config.get('USER_CACHE_TTL', 300),
+            ),
+            'enabled': app.config.get('USER_CACHE_ENABLED', True),
+            'hits': 0,
+            'misses': 0,
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['user_cache']
+
+    def load(self, user_id):
+        from . import db
+        from .models import User
+        from sqlalchemy.orm import make_transient_to_detached
+
+        state = self._state
+        if not state['enabled']:
+            user = db.session.get(User, user_id)
+            return user if user is not None and not user.deleting else None
+
+        snapshot = state['backend'].get(str(user_id))
+        if snapshot is None:
+            state['misses'] += 1
+            # The snapshot outlives the request, so read it from the primary: a lagging replica
+            # could still return the columns an invalidation just discarded
+            user = db.session.get(User, user_id, bind_arguments={'bind': db.engine})
+            # Users being deleted are logged out at once and never cached
+            if user is None or user.deleting:
+                return None
+            state['backend'].set(str(user_id), {
+                'id': user.id,
+                'username': user.username,
+                'is_admin': user.is_admin,
+                'deleting': False,
+            })
+            return user
+
+        state['hits'] += 1
+        user = User(**snapshot)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False) # Attach to the session without a round trip
+
+    # Must be called whenever a user's cached columns change or the user is removed
+    def invalidate(self, user_id):
+        self._state['backend'].delete(str(user_id))
+
+    def clear(self):
+        self._state['backend'].clear()
+
+    def stats(self):
+        state = self._state
+        backend = state['backend']
+        return {
+            'backend': type(backend).__name__,
+            'enabled': state['enabled'],
+            'hits': state['hits'],
+            'misses': state['misses'],
+            'size': len(backend) if hasattr(backend, '__len__') else None,
+        }
+
+# Rendered task-list fragments keyed on a per-user "task list version".
+# A version is a random token, so replacing it orphans every fragment built from older data,
+# even if the token itself was evicted. Admins list every task and share a global version.
+class TaskListCache:
+    def init_app(self, app):
+        app.extensions['task_list_cache'] = {
+            'backend': make_cache(
+                app,
+                prefix='tasklist:',
+                maxsize=app.config.get('TASK_LIST_CACHE_SIZE', 10000),
+                ttl=app.config.get('TASK_LIST_CACHE_TTL', 600),
+            ),
+            'enabled': app.config.get('TASK_LIST_CACHE_ENABLED', True),
+            'hits': 0,
+            'misses': 0,
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['task_list_cache']
+
+    @property
+    def enabled(self):
+        return self._state['enabled']
+
+    def version(self, user):
+        backend = self._state['backend']
+        key = 'version:all' if user.is_administrator() else f'version:{user.id}'
+        version = backend.get(key)
+        if version is None:
+            version = f'{time.time():.3f}-{uuid.uuid4().hex}'
+            backend.set(key, version)
+        return version
+
+    # Seconds since the user's current version was created, which is never before the last
+    # write that bumped it
+    def version_age(self, user):
+        return time.time() - float(self.version(user).split('-', 1)[0])
+
+    # Must run after the write has been committed, or a concurrent reader could cache
+    # the old rows under the new version
+    def bump(self, user_ids):
+        backend = self._state['backend']
+        backend.delete('version:all')
+        for user_id in user_ids:
+            backend.delete(f'version:{user_id}')
+
+    # Cache key and ETag for one page of one user's list
+    def key(self, user, args):
+        parts = [self.version(user), user.id, user.is_administrator(),
+                 args.get('after', ''), args.get('before', ''), args.get('per_page', '')]
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def get(self, key):
+        state = self._state
+        fragment = state['backend'].get(f'fragment:{key}')
+        if fragment is None:
+            state['misses'] += 1
+        else:
+            state['hits'] += 1
+        return fragment
+
+    def set(self, key, fragment):
+        self._state['backend'].set(f'fragment:{key}', fragment)
+
+    def stats(self):
+        state = self._state
+        return {'enabled': state['enabled'], 'hits': state['hits'], 'misses': state['misses']}
+
+# TaskListCache keeps no state of its own, so a fresh instance works on the current app
+def _bump_task_list_versions(app, user_ids, **extra):
+    if 'task_list_cache' in app.extensions:
+        TaskListCache().bump(user_ids)
+
+tasks_changed.connect(_bump_task_list_versions)
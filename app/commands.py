@@ -0,0 +1,187 @@
+import json
+import sys
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .archive import ArchiveError, archive_tasks, check_archive, restore_tasks
+from .delivery import build_assets
+from .sharing import bulk_share
+from .feed import prune_events
+from .models import User, TaskStatus
+from .stats import rebuild_stats
+from .transfer import FORMATS, SCOPES, TransferError, export_chunks, export_statement, import_tasks
+from . import db, job_queue, task_shards
+
+def split_values(values):
+    return [item for value in values for item in value.replace(',', ' ').split()]
+
+# flask share-tasks --task 1 --task 2 --user alice,bob
+@click.command('share-tasks')
+@click.option('--task', 'tasks', multiple=True, required=True, help='Task id(s), repeatable or comma separated.')
+@click.option('--user', 'users', multiple=True, required=True, help='Username(s), repeatable or comma separated.')
+@with_appcontext
+def share_tasks_command(tasks, users):
+    """Share every given task with every given user."""
+    try:
+        task_ids = [int(task_id) for task_id in split_values(tasks)]
+    except ValueError:
+        raise click.BadParameter('task ids must be integers', param_hint='--task')
+    result = bulk_share(task_ids, split_values(users))
+    click.echo(json.dumps(result.as_dict()))
+
+# flask prune-task-events --days 7
+@click.command('prune-task-events')
+@click.option('--days', default=7, show_default=True, help='Delete change feed events older than this.')
+@with_appcontext
+def prune_task_events_command(days):
+    """Delete old change feed events."""
+    click.echo(f'Deleted {prune_events(days)} events.')
+
+# flask init-db
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create the tables of a new database and mark it as migrated to the latest revision."""
+    from flask_migrate import stamp
+    db.create_all()
+    task_shards.create_all()
+    stamp()
+    click.echo('Database initialized.')
+
+# flask run-jobs [--burst]
+@click.command('run-jobs')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+@with_appcontext
+def run_jobs_command(burst):
+    """Run queued background jobs in this process."""
+    if burst:
+        click.echo(f'Ran {job_queue.run_pending()} jobs.')
+    else:
+        job_queue.work(current_app._get_current_object())
+
+# flask rebuild-task-stats
+@click.command('rebuild-task-stats')
+@with_appcontext
+def rebuild_task_stats_command():
+    """Recompute the dashboard counters from the task and permission tables."""
+    click.echo(json.dumps(rebuild_stats()))
+
+# flask build-assets
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Write precompressed copies of the static files and fill the template bytecode cache."""
+    click.echo(json.dumps(build_assets(current_app._get_current_object())))
+
+# flask archive-tasks --days 90 --status COMPLETED
+@click.command('archive-tasks')
+@click.option('--days', type=int, help='Archive tasks created more than this many days ago (ARCHIVE_AFTER_DAYS).')
+@click.option('--status', 'statuses', multiple=True, type=click.Choice(list(TaskStatus.__members__)), help='Status to archive, repeatable (ARCHIVE_STATUSES).')
+@click.option('--batch-size', type=int, help='Tasks moved per transaction (ARCHIVE_BATCH_SIZE).')
+@click.option('--enqueue', is_flag=True, help='Run it as a background job instead of in this process.')
+@with_appcontext
+def archive_tasks_command(days, statuses, batch_size, enqueue):
+    """Move old tasks and their shares to the archive tables."""
+    try:
+        check_archive()
+    except ArchiveError as error:
+        raise click.UsageError(str(error))
+    if enqueue:
+        job = job_queue.enqueue('archive-tasks', days=days, statuses=list(statuses) or None)
+        click.echo(f'Enqueued job {job.id}.')
+    else:
+        click.echo(json.dumps(archive_tasks(days, list(statuses) or None, batch_size)))
+
+# flask restore-tasks --task 1,2,3
+@click.command('restore-tasks')
+@click.option('--task', 'tasks', multiple=True, required=True, help='Archived task id(s), repeatable or comma separated.')
+@with_appcontext
+def restore_tasks_command(tasks):
+    """Move archived tasks back to the task list."""
+    try:
+        task_ids = [int(task_id) for task_id in split_values(tasks)]
+    except ValueError:
+        raise click.BadParameter('task ids must be integers', param_hint='--task')
+    try:
+        restored = restore_tasks(task_ids)
+    except ArchiveError as error:
+        raise click.UsageError(str(error))
+    click.echo(json.dumps({str(archived_id): task_id for archived_id, task_id in restored.items()}))
+
+# flask rebalance-task-shards --batch-size 500
+@click.command('rebalance-task-shards')
+@click.option('--batch-size', type=int, help='Tasks moved per batch (TASK_SHARD_REBALANCE_BATCH).')
+@with_appcontext
+def rebalance_task_shards_command(batch_size):
+    """Create missing shard tables and move tasks to their owner's shard after shards were added."""
+    if not task_shards.enabled:
+        raise click.UsageError('TASK_SHARDS is not configured.')
+    task_shards.create_all()
+    click.echo(json.dumps({'moved': task_shards.rebalance(batch_size)}))
+
+def find_user(username, option):
+    if username is None:
+        return None
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.BadParameter(f'no user named {username!r}', param_hint=option)
+    return user
+
+# Format from the file extension unless given explicitly
+def guess_format(fmt, path):
+    return fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+# flask export-tasks --format csv --scope all --output tasks.csv
+@click.command('export-tasks')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the output file extension, else ndjson.')
+@click.option('--scope', type=click.Choice(SCOPES), default='all', show_default=True)
+@click.option('--user', 'username', help='Export as this user (required for owned, shared and visible).')
+@click.option('--output', default='-', show_default=True, help='File to write, - for stdout.')
+@with_appcontext
+def export_tasks_command(fmt, scope, username, output):
+    """Stream tasks to a CSV or NDJSON file."""
+    fmt = guess_format(fmt, output)
+    user = find_user(username, '--user')
+    try:
+        export_statement(scope, user)
+    except TransferError as error:
+        raise click.UsageError(str(error))
+    out = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+    try:
+        for chunk in export_chunks(fmt, scope, user):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+# flask import-tasks tasks.csv [--owner alice]
+@click.command('import-tasks')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension, else ndjson.')
+@click.option('--owner', help='Give every task to this user instead of the owner named in each record.')
+@click.option('--batch-size', type=int, help='Records per INSERT batch (IMPORT_BATCH_SIZE).')
+@with_appcontext
+def import_tasks_command(path, fmt, owner, batch_size):
+    """Create tasks (and their shares) from a CSV or NDJSON export, - for stdin."""
+    fmt = guess_format(fmt, path)
+    owner = find_user(owner, '--owner')
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    try:
+        result = import_tasks(stream, fmt, owner=owner, batch_size=batch_size)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    click.echo(json.dumps(result.as_dict()))
+
+def register_commands(app):
+    app.cli.add_command(share_tasks_command)
+    app.cli.add_command(prune_task_events_command)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(run_jobs_command)
+    app.cli.add_command(export_tasks_command)
+    app.cli.add_command(import_tasks_command)
+    app.cli.add_command(rebuild_task_stats_command)
+    app.cli.add_command(build_assets_command)
+    app.cli.add_command(archive_tasks_command)
+    app.cli.add_command(restore_tasks_command)
+    app.cli.add_command(rebalance_task_shards_command)
@@ -0,0 +1,125 @@
+import time
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+# Pragmas run on every new SQLite connection. WAL lets readers run alongside the single writer,
+# synchronous=NORMAL is durable in WAL mode short of a power loss, busy_timeout makes a writer
+# wait for the lock instead of failing with "database is locked", and mmap avoids read syscalls.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'SQLITE_JOURNAL_MODE', 'WAL'),
+    ('synchronous', 'SQLITE_SYNCHRONOUS', 'NORMAL'),
+    ('busy_timeout', 'SQLITE_BUSY_TIMEOUT_MS', 5000),
+    ('mmap_size', 'SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+)
+
+# Pool settings for server databases (PostgreSQL, MySQL); SQLite keeps Flask-SQLAlchemy's defaults
+POOL_OPTIONS = (
+    ('pool_size', 'DB_POOL_SIZE', 10),
+    ('max_overflow', 'DB_MAX_OVERFLOW', 20),
+    ('pool_timeout', 'DB_POOL_TIMEOUT', 30),
+    ('pool_recycle', 'DB_POOL_RECYCLE', 1800),
+    ('pool_pre_ping', 'DB_POOL_PRE_PING', True),
+)
+
+def is_sqlite(uri):
+    return uri is not None and make_url(uri).get_backend_name() == 'sqlite'
+
+# Fills in SQLALCHEMY_ENGINE_OPTIONS before db.init_app creates the engines.
+# Options set explicitly in the config win over the DB_* settings.
+def configure_engine_options(app):
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri is None or is_sqlite(uri):
+        return
+    options = {key: app.config.get(name, default) for key, name, default in POOL_OPTIONS}
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+def sqlite_pragmas(app):
+    pragmas = []
+    for pragma, name, default in SQLITE_PRAGMAS:
+        value = app.config.get(name, default)
+        if value is not None: # None leaves SQLite's own default in place
+            pragmas.append(f'PRAGMA {pragma}={value}')
+    return pragmas
+
+# Must run after db.init_app, inside an app context
+def configure_engines(app, db):
+    pragmas = sqlite_pragmas(app)
+    for engine in db.engines.values():
+        if engine.dialect.name != 'sqlite' or not pragmas:
+            continue
+
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for statement in pragmas:
+                cursor.execute(statement)
+            cursor.close()
+
+        event.listen(engine, 'connect', set_pragmas)
+
+# For forked workers: drop the pooled connections inherited from the parent without closing
+# them, since the parent still owns them
+def dispose_engines(app):
+    db = app.extensions['sqlalchemy']
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+REPLICA_BIND = 'replica'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Sends reads made while handling a GET to the read replica, when one is configured. Flushes and
+# INSERT/UPDATE/DELETE statements always go to the primary, as does everything outside a request
+# (CLI commands, migrations, background work).
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None or self._flushing or isinstance(clause, UpdateBase):
+            return engine
+        if not reads_from_replica():
+            return engine
+        engines = self._db.engines
+        if engine is not engines.get(None):
+            return engine # Models with their own bind key are not replicated
+        return engines.get(REPLICA_BIND, engine)
+
+def reads_from_replica():
+    return has_request_context() and g.get('_read_from_replica', False)
+
+# How long after a write reads from the replica may still miss it (0 when reading from the primary)
+def replica_lag_window():
+    return current_app.config.get('REPLICA_STICKY_SECONDS', 5) if reads_from_replica() else 0
+
+# Adds the replica bind before db.init_app creates the engines (REPLICA_DATABASE_URI or an
+# explicit 'replica' entry in SQLALCHEMY_BINDS)
+def configure_replica_bind(app):
+    uri = app.config.get('REPLICA_DATABASE_URI')
+    if uri:
+        # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS, so pass the primary's pool settings along
+        options = {} if is_sqlite(uri) else dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, dict(options, url=uri))
+        app.config['SQLALCHEMY_BINDS'] = binds
+    return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+# Reads go to the replica for GET requests, except for REPLICA_STICKY_SECONDS after the same
+# browser session made a write, so users read their own writes despite replication lag
+def init_replica_routing(app):
+    if not configure_replica_bind(app):
+        return
+
+    @app.before_request
+    def choose_read_bind():
+        g._read_from_replica = (
+            request.method in SAFE_METHODS and session.get('_primary_until', 0) <= time.time()
+        )
+
+    @app.after_request
+    def stick_to_primary(response):
+        sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        if request.method not in SAFE_METHODS and sticky_seconds:
+            session['_primary_until'] = time.time() + sticky_seconds
+        return response
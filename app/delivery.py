@@ -0,0 +1,216 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from flask import current_app, request, send_from_directory
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError: # Optional: gzip only without it
+    brotli = None
+
+DEFAULT_MIN_SIZE = 500
+DEFAULT_MIMETYPES = (
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+    'application/json', 'application/x-ndjson', 'image/svg+xml',
+)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+# Content encodings with the suffix of their precompressed files, most preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+logger = logging.getLogger('app.delivery')
+
+# style.css -> style.0123456789ab.css
+HASHED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<digest>[0-9a-f]{12})(?P<suffix>\.[^./]+)$')
+
+def available_encodings():
+    return [encoding for encoding, _ in ENCODINGS if encoding != 'br' or brotli is not None]
+
+def compress(data, encoding, level):
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+# Creates the bytecode cache directory readable by this user only. Compiled templates are
+# executed as code, so a directory someone else owns or can write to is not used; returns
+# whether the directory can be used.
+def secure_cache_dir(path):
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.stat(path)
+    except OSError:
+        logger.exception('Cannot create the template bytecode cache %s; compiling in memory.', path)
+        return False
+    if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+        logger.warning('The template bytecode cache %s is owned or writable by another user; compiling in memory.', path)
+        return False
+    return True
+
+def hashed_name(filename, digest):
+    stem, dot, suffix = filename.rpartition('.')
+    if not dot or '/' in suffix:
+        return f'{filename}.{digest}'
+    return f'{stem}.{digest}.{suffix}'
+
+# Response compression, content-hashed static URLs and the Jinja bytecode cache.
+#
+# Responses of a compressible type and at least COMPRESS_MIN_SIZE bytes are compressed with
+# brotli (when installed) or gzip, whichever the client prefers. Streamed responses (exports,
+# the event stream) and files are left alone: static files are served from the .br/.gz copies
+# `flask build-assets` writes next to them. url_for('static', ...) adds the file's content hash
+# to its name, and hashed URLs are cached for a year since new content gets a new URL.
+class Delivery:
+    def init_app(self, app):
+        app.extensions['delivery'] = {
+            'compress': app.config.get('COMPRESS_ENABLED', True),
+            'min_size': app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE),
+            'mimetypes': set(app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)),
+            'gzip_level': app.config.get('COMPRESS_GZIP_LEVEL', 6),
+            'brotli_quality': app.config.get('COMPRESS_BROTLI_QUALITY', 5),
+            'hash_static': app.config.get('STATIC_HASHED_URLS', True),
+            'digests': {},
+        }
+        app.after_request(self.compress_response)
+        if app.extensions['delivery']['hash_static'] and app.has_static_folder:
+            app.url_defaults(self.add_static_hash)
+            app.view_functions['static'] = self.send_static
+
+        # Compiled templates are shared through the directory by every worker and restart;
+        # Jinja keys them by the template source's checksum, so edits are picked up
+        cache_dir = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+        if cache_dir:
+            cache_dir = os.path.join(app.instance_path, cache_dir)
+            if secure_cache_dir(cache_dir):
+                app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    @property
+    def _state(self):
+        return current_app.extensions['delivery']
+
+    def compress_response(self, response):
+        state = self._state
+        if not state['compress'] or response.mimetype not in state['mimetypes']:
+            return response
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or 'Content-Encoding' in response.headers):
+            return response
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < state['min_size']:
+            return response
+        level = state['brotli_quality'] if encoding == 'br' else state['gzip_level']
+        response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body is a different representation; a strong ETag must not match both
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    # The content hash of a static file, computed once per process (on every change in debug mode)
+    def digest(self, filename):
+        digests = self._state['digests']
+        path = safe_join(current_app.static_folder, filename)
+        if path is None:
+            return None
+        entry = digests.get(filename)
+        if entry is None or current_app.debug:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+            if entry is None or entry[0] != mtime:
+                entry = digests[filename] = (mtime, file_digest(path))
+        return entry[1]
+
+    def add_static_hash(self, endpoint, values):
+        if endpoint != 'static' or 'filename' not in values:
+            return
+        digest = self.digest(values['filename'])
+        if digest is not None:
+            values['filename'] = hashed_name(values['filename'], digest)
+
+    def send_static(self, filename):
+        immutable = False
+        match = HASHED_NAME.match(filename)
+        if match:
+            original = match['stem'] + match['suffix']
+            digest = self.digest(original)
+            if digest is not None:
+                # An outdated hash (a page from before a deploy) still gets the file, uncached
+                immutable = digest == match['digest']
+                filename = original
+
+        folder = current_app.static_folder
+        source = safe_join(folder, filename)
+        encoding, served = None, filename
+        if self._state['compress'] and source and os.path.isfile(source):
+            for candidate, suffix in ENCODINGS:
+                precompressed = os.path.join(folder, filename + suffix)
+                if (request.accept_encodings[candidate] and os.path.isfile(precompressed)
+                        and os.path.getmtime(precompressed) >= os.path.getmtime(source)):
+                    encoding, served = candidate, filename + suffix
+                    break
+
+        response = send_from_directory(folder, served, max_age=current_app.get_send_file_max_age(filename))
+        if encoding:
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        if immutable:
+            response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+# Writes a .gz (and with brotli installed a .br) copy of every compressible static file of at
+# least `min_size` bytes, at maximum compression. Returns the files written.
+def precompress_static(static_folder, min_size=DEFAULT_MIN_SIZE, types=DEFAULT_MIMETYPES):
+    written = []
+    suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    for root, _, files in os.walk(static_folder):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if name.endswith(suffixes) or mimetypes.guess_type(name)[0] not in types:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < min_size:
+                continue
+            for encoding, suffix in ENCODINGS:
+                if encoding not in available_encodings():
+                    continue
+                compressed = compress(data, encoding, 11 if encoding == 'br' else 9)
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                written.append(os.path.relpath(path + suffix, static_folder))
+    return written
+
+# Compiles every template into the bytecode cache, so the first workers find them there
+def compile_templates(app):
+    if app.jinja_env.bytecode_cache is None:
+        return 0
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+# The deploy-time steps: precompressed static files and a warm template bytecode cache
+def build_assets(app):
+    min_size = app.config.get('COMPRESS_MIN_SIZE', DEFAULT_MIN_SIZE)
+    types = app.config.get('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+    return {
+        'precompressed': precompress_static(app.static_folder, min_size, types) if app.has_static_folder else [],
+        'templates_compiled': compile_templates(app),
+    }
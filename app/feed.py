@@ -0,0 +1,94 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, insert, delete, union, func
+from .models import Task, Permission, TaskEvent
+from .signals import tasks_changed
+from . import db, store, access_control, task_shards
+
+DEFAULT_BATCH = 500
+
+# Wakes long polls and streams in this process as soon as events are written. Other processes
+# pick new events up on their next poll (FEED_POLL_INTERVAL seconds).
+_new_events = threading.Condition()
+
+# One event per (recipient, task): the owner and every user the task is shared with, computed
+# in the INSERT itself (read from the shards first with TASK_SHARDS). Tasks that no longer exist
+# go to the whole audience of the write, so deletes signal each recipient on its own
+# (signals.notify_recipients).
+def record_events(user_ids, task_ids):
+    task_ids = list(task_ids)
+    if task_shards.enabled:
+        pairs = [{'user_id': user_id, 'task_id': task_id}
+                 for user_id, ids in task_shards.recipients(task_ids).items() for task_id in ids]
+        existing = {pair['task_id'] for pair in pairs}
+        if pairs:
+            db.session.execute(insert(TaskEvent), pairs)
+    else:
+        existing = set(db.session.scalars(select(Task.id).where(Task.id.in_(task_ids))))
+        if existing:
+            recipients = union(
+                select(Task.user_id, Task.id.label('task_id')).where(Task.id.in_(existing)),
+                select(Permission.user_id, Permission.task_id).where(Permission.task_id.in_(existing)),
+            ).subquery()
+            db.session.execute(insert(TaskEvent).from_select(
+                ['user_id', 'task_id'], select(recipients.c.user_id, recipients.c.task_id)
+            ))
+    gone = [{'user_id': user_id, 'task_id': task_id}
+            for task_id in task_ids if task_id not in existing for user_id in user_ids]
+    if gone:
+        db.session.execute(insert(TaskEvent), gone)
+    db.session.commit()
+    with _new_events:
+        _new_events.notify_all()
+
+def _record_task_events(app, user_ids, task_ids, **extra):
+    if task_ids and app.config.get('TASK_EVENTS_ENABLED', True):
+        record_events(user_ids, task_ids)
+
+tasks_changed.connect(_record_task_events)
+
+# Cursor to hand to a client that starts following the feed now
+def latest_event_id(user_id):
+    return db.session.scalar(select(func.max(TaskEvent.id)).where(TaskEvent.user_id == user_id)) or 0
+
+# The user's changes after `since`, collapsed to one entry per task in the order of its latest
+# event: (cursor, task_id, task or None when the user can no longer see it). Also returns the map
+# of which of those tasks' status the user may see.
+def changes_since(user, since, limit=None):
+    limit = limit or current_app.config.get('FEED_BATCH_SIZE', DEFAULT_BATCH)
+    rows = db.session.execute(
+        select(TaskEvent.id, TaskEvent.task_id)
+        .where(TaskEvent.user_id == user.id, TaskEvent.id > since)
+        .order_by(TaskEvent.id)
+        .limit(limit)
+    ).all()
+    if not rows:
+        return [], {}
+    latest = {}
+    for event_id, task_id in rows:
+        latest[task_id] = event_id
+    tasks = store.visible_tasks(user, list(latest))
+    changes = sorted((event_id, task_id, tasks.get(task_id)) for task_id, event_id in latest.items())
+    return changes, access_control.can(user, 'view_status', list(tasks))
+
+# Blocks until the user has changes after `since` or `timeout` seconds pass. The session is
+# closed between checks so a waiting request does not hold a database connection.
+def wait_for_changes(user, since, timeout):
+    deadline = time.monotonic() + timeout
+    poll_interval = current_app.config.get('FEED_POLL_INTERVAL', 1.0)
+    while True:
+        changes, visibility = changes_since(user, since)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes, visibility
+        db.session.close()
+        with _new_events:
+            _new_events.wait(min(poll_interval, remaining))
+
+def prune_events(older_than_days):
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    result = db.session.execute(delete(TaskEvent).where(TaskEvent.timestamp < cutoff))
+    db.session.commit()
+    return result.rowcount
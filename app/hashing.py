@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash
+from .signals import password_hashed
+
+DEFAULT_METHOD = 'scrypt'
+
+# Never fork a (possibly threaded) request worker directly: forkserver forks hashing
+# processes from a clean single-threaded server, spawn is the portable fallback
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Raised when no hashing slot frees up within PASSWORD_HASH_TIMEOUT
+class HashingBusy(RuntimeError):
+    pass
+
+# Key derivation is CPU bound, so it runs in a dedicated, fixed-size process pool instead of on
+# the request workers. A semaphore caps in-flight jobs; callers wait at most `timeout` for one.
+class PasswordHasher:
+    def init_app(self, app):
+        workers = app.config.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1))
+        app.extensions['password_hasher'] = {
+            'method': app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+            'workers': workers,
+            'slots': threading.BoundedSemaphore(app.config.get('PASSWORD_HASH_CONCURRENCY', max(workers, 1) * 2)),
+            'timeout': app.config.get('PASSWORD_HASH_TIMEOUT', 5),
+            'pool': None,
+            'pool_pid': None,
+            'pool_lock': threading.Lock(),
+            'current_prefix': None,
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['password_hasher']
+
+    # Pools do not survive a fork, so each worker process lazily builds its own
+    def _pool(self, state):
+        with state['pool_lock']:
+            if state['pool'] is None or state['pool_pid'] != os.getpid():
+                state['pool'] = ProcessPoolExecutor(
+                    max_workers=state['workers'],
+                    mp_context=multiprocessing.get_context(START_METHOD),
+                )
+                state['pool_pid'] = os.getpid()
+            return state['pool']
+
+    # Other threads may have hit the same broken pool and replaced it already
+    def _discard(self, state, pool):
+        with state['pool_lock']:
+            if state['pool'] is pool:
+                state['pool'] = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        if not has_app_context():
+            return fn(*args) # e.g. scripts building models outside the app
+        if not password_hashed.receivers:
+            return self._execute(fn, *args)
+        started = time.perf_counter()
+        try:
+            return self._execute(fn, *args)
+        finally:
+            password_hashed.send(current_app._get_current_object(), seconds=time.perf_counter() - started)
+
+    def _execute(self, fn, *args):
+        state = self._state
+        if not state['workers']:
+            return fn(*args)
+        if not state['slots'].acquire(timeout=state['timeout']):
+            raise HashingBusy('Too many password hashing requests in flight.')
+        try:
+            pool = self._pool(state)
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                # A hashing process died (e.g. OOM-killed): replace the pool and retry once
+                self._discard(state, pool)
+                return self._pool(state).submit(fn, *args).result()
+        finally:
+            state['slots'].release()
+
+    @property
+    def method(self):
+        return self._state['method'] if has_app_context() else DEFAULT_METHOD
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    # A stored hash is out of date when its method/cost prefix differs from what the
+    # configured method produces today (e.g. after raising the pbkdf2 iteration count)
+    def needs_rehash(self, pwhash):
+        if not has_app_context():
+            return False
+        state = self._state
+        if state['current_prefix'] is None:
+            state['current_prefix'] = generate_password_hash('', state['method']).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != state['current_prefix']
+
+    # Every server worker process has its own pool: unless PASSWORD_HASH_WORKERS is set, the
+    # host's cores are split between them, which is one hashing process each with gunicorn's
+    # default of a worker per core (called by gunicorn.conf.py in each worker)
+    def share_host(self, app, processes):
+        if 'PASSWORD_HASH_WORKERS' in app.config:
+            return
+        state = app.extensions['password_hasher']
+        state['workers'] = max(1, (os.cpu_count() or 1) // max(processes, 1))
+        state['slots'] = threading.BoundedSemaphore(app.config.get('PASSWORD_HASH_CONCURRENCY', state['workers'] * 2))
+
+    def shutdown(self):
+        state = self._state
+        with state['pool_lock']:
+            if state['pool'] is not None and state['pool_pid'] == os.getpid():
+                state['pool'].shutdown()
+            state['pool'] = None
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, update, delete, and_, or_
+from .signals import notify_tasks_changed, notify_recipients
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 5
+DEFAULT_TIMEOUT = 3600
+DEFAULT_DELETE_BATCH = 1000
+
+logger = logging.getLogger('app.jobs')
+
+# Models and db are imported inside the functions: this module is loaded while the app package
+# itself is still initializing.
+
+# Job name -> function called with the job's payload as keyword arguments. Its return value
+# (JSON serializable) is stored as the job's result.
+handlers = {}
+
+def job(name):
+    def register(fn):
+        handlers[name] = fn
+        return fn
+    return register
+
+# Runs slow operations outside the request. The job table is the queue: any process sharing the
+# database can claim a job, so the web workers' threads and `flask run-jobs` processes cooperate.
+# A failing job is retried with exponential backoff up to JOB_MAX_ATTEMPTS times; a job left
+# running for JOB_TIMEOUT seconds (its worker died) is claimed again.
+class JobQueue:
+    def init_app(self, app):
+        app.extensions['job_queue'] = {
+            'workers': app.config.get('JOB_WORKERS', DEFAULT_WORKERS),
+            'poll_interval': app.config.get('JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+            'max_attempts': app.config.get('JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+            'retry_delay': app.config.get('JOB_RETRY_DELAY', DEFAULT_RETRY_DELAY),
+            'timeout': app.config.get('JOB_TIMEOUT', DEFAULT_TIMEOUT),
+            'threads': [],
+            'threads_pid': None,
+            'lock': threading.Lock(),
+            'wakeup': threading.Condition(),
+            'stopping': threading.Event(),
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['job_queue']
+
+    def enqueue(self, name, max_attempts=None, **payload):
+        if name not in handlers:
+            raise KeyError(f'Unknown job: {name}')
+        from .models import Job
+        from . import db
+        state = self._state
+        job = Job(name=name, payload=json.dumps(payload), max_attempts=max_attempts or state['max_attempts'])
+        db.session.add(job)
+        db.session.commit()
+        self.start(current_app._get_current_object())
+        with state['wakeup']:
+            state['wakeup'].notify()
+        return job
+
+    # Starts this process's worker threads (none with JOB_WORKERS=0, leaving the jobs to
+    # `flask run-jobs`). Threads do not survive a fork, so each worker process starts its own.
+    def start(self, app):
+        state = app.extensions['job_queue']
+        with state['lock']:
+            if state['threads_pid'] == os.getpid():
+                return
+            state['stopping'].clear()
+            state['threads'] = [
+                threading.Thread(target=self.work, args=(app,), name=f'job-worker-{number}', daemon=True)
+                for number in range(state['workers'])
+            ]
+            state['threads_pid'] = os.getpid()
+            for thread in state['threads']:
+                thread.start()
+
+    # Worker loop: runs whatever is due, then sleeps until woken by an enqueue in this process
+    # or JOB_POLL_INTERVAL passes (jobs enqueued by other processes, retries coming due)
+    def work(self, app):
+        state = app.extensions['job_queue']
+        while not state['stopping'].is_set():
+            with app.app_context():
+                try:
+                    ran = self.run_pending()
+                except Exception:
+                    logger.exception('Job worker failed to claim a job.')
+                    ran = 0
+            if not ran:
+                with state['wakeup']:
+                    state['wakeup'].wait(state['poll_interval'])
+
+    # Runs due jobs until there are none left; returns how many ran
+    def run_pending(self):
+        ran = 0
+        while not self._state['stopping'].is_set():
+            job = self.claim()
+            if job is None:
+                return ran
+            self.run(job)
+            ran += 1
+        return ran
+
+    def claim(self):
+        from .models import Job
+        from . import db
+        timeout = self._state['timeout']
+        while True:
+            now = datetime.utcnow()
+            claimable = or_(
+                and_(Job.status == QUEUED, Job.run_after <= now),
+                and_(Job.status == RUNNING, Job.started < now - timedelta(seconds=timeout)),
+            )
+            job_id = db.session.scalar(select(Job.id).where(claimable).order_by(Job.run_after, Job.id).limit(1))
+            if job_id is None:
+                db.session.commit()
+                return None
+            # Compare-and-set: only one worker wins the row, the others look for the next one
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, claimable)
+                .values(status=RUNNING, attempts=Job.attempts + 1, started=now, error=None)
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+
+    def run(self, job):
+        from .models import Job
+        from . import db
+        job_id = job.id
+        try:
+            result = handlers[job.name](**json.loads(job.payload))
+        except Exception as error:
+            db.session.rollback()
+            logger.exception('Job %s (%s) failed.', job_id, job.name)
+            job = db.session.get(Job, job_id)
+            job.error = f'{type(error).__name__}: {error}'
+            if job.attempts < job.max_attempts:
+                job.status = QUEUED
+                job.run_after = datetime.utcnow() + timedelta(seconds=self._state['retry_delay'] * 2 ** (job.attempts - 1))
+            else:
+                job.status = FAILED
+                job.finished = datetime.utcnow()
+        else:
+            job = db.session.get(Job, job_id)
+            job.status = SUCCEEDED
+            job.result = json.dumps(result)
+            job.finished = datetime.utcnow()
+        db.session.commit()
+
+    # Stops this process's worker threads after their current job
+    def shutdown(self, timeout=None):
+        state = self._state
+        with state['lock']:
+            if state['threads_pid'] != os.getpid():
+                return
+            state['stopping'].set()
+            with state['wakeup']:
+                state['wakeup'].notify_all()
+            for thread in state['threads']:
+                thread.join(timeout)
+            state['threads'] = []
+            state['threads_pid'] = None
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'name': job.name,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'result': json.loads(job.result) if job.result else None,
+        'error': job.error,
+        'created': job.created.isoformat() if job.created else None,
+        'finished': job.finished.isoformat() if job.finished else None,
+    }
+
+# Deletes a user with set-based DELETEs instead of loading every task and permission through
+# the ORM cascade. Tasks go in batches of JOB_DELETE_BATCH, each in its own short transaction,
+# so a retry after a failure picks up where the last batch left off.
+@job('delete-user')
+def delete_user(user_id):
+    from .models import User, Task, Permission, TaskEvent, ArchivedTask, ArchivedPermission
+    from .utils import task_recipients
+    from . import db, user_cache, task_shards
+    if db.session.get(User, user_id) is None:
+        return {'tasks': 0} # Already deleted by an earlier attempt
+    batch_size = current_app.config.get('JOB_DELETE_BATCH', DEFAULT_DELETE_BATCH)
+    # With TASK_SHARDS the tasks and shares live on the shards; the tables below are then empty
+    deleted = task_shards.delete_user_tasks(user_id, batch_size) if task_shards.enabled else 0
+    while True:
+        task_ids = list(db.session.scalars(
+            select(Task.id).where(Task.user_id == user_id).order_by(Task.id).limit(batch_size)
+        ))
+        if not task_ids:
+            break
+        recipients = task_recipients(task_ids) # Collected first: the permissions are deleted with the tasks
+        db.session.execute(delete(Permission).where(Permission.task_id.in_(task_ids)))
+        db.session.execute(delete(Task).where(Task.id.in_(task_ids)))
+        db.session.commit()
+        notify_recipients(recipients)
+        deleted += len(task_ids)
+    # Tasks shared with the user, the user's archived tasks and shares, the user's own feed, then the user
+    shared_ids = set(db.session.scalars(select(Permission.task_id).where(Permission.user_id == user_id)))
+    db.session.execute(delete(Permission).where(Permission.user_id == user_id))
+    archived_ids = select(ArchivedTask.id).where(ArchivedTask.user_id == user_id)
+    db.session.execute(delete(ArchivedPermission).where(
+        (ArchivedPermission.user_id == user_id) | ArchivedPermission.task_id.in_(archived_ids)
+    ))
+    db.session.execute(delete(ArchivedTask).where(ArchivedTask.user_id == user_id))
+    db.session.execute(delete(TaskEvent).where(TaskEvent.user_id == user_id))
+    db.session.execute(delete(User).where(User.id == user_id))
+    db.session.commit()
+    user_cache.invalidate(user_id)
+    if shared_ids:
+        notify_tasks_changed({user_id}, shared_ids) # Drops the shares from the access index
+    return {'tasks': deleted}
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from flask import Response, current_app, g, has_request_context, request
+from flask.signals import before_render_template, template_rendered
+from sqlalchemy import event
+from .signals import password_hashed
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+slow_query_logger = logging.getLogger('app.slow_queries')
+
+# Per-endpoint counters for one process. Updated once per request under a lock; everything
+# measured during the request is first accumulated on `g`.
+class Registry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.requests = defaultdict(lambda: {
+            'buckets': [0] * len(self.buckets),
+            'count': 0,
+            'sum': 0.0,
+            'sql_count': 0,
+            'sql_seconds': 0.0,
+            'template_seconds': 0.0,
+            'hash_seconds': 0.0,
+        })
+        self.slow_queries = 0
+
+    def observe(self, endpoint, seconds, sample):
+        with self.lock:
+            entry = self.requests[endpoint]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+            entry['count'] += 1
+            entry['sum'] += seconds
+            entry['sql_count'] += sample['sql_count']
+            entry['sql_seconds'] += sample['sql_seconds']
+            entry['template_seconds'] += sample['template_seconds']
+            entry['hash_seconds'] += sample['hash_seconds']
+
+    def snapshot(self):
+        with self.lock:
+            return {endpoint: dict(entry, buckets=list(entry['buckets'])) for endpoint, entry in self.requests.items()}
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+# Prometheus text exposition format (version 0.0.4)
+def render_prometheus(registry, extra_counters=()):
+    lines = [
+        '# HELP http_request_duration_seconds Request latency by endpoint.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    snapshot = registry.snapshot()
+    for endpoint, entry in sorted(snapshot.items()):
+        label = f'endpoint="{_label(endpoint)}"'
+        for bound, count in zip(registry.buckets, entry['buckets']):
+            lines.append(f'http_request_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+        lines.append(f'http_request_duration_seconds_bucket{{{label},le="+Inf"}} {entry["count"]}')
+        lines.append(f'http_request_duration_seconds_sum{{{label}}} {entry["sum"]:.6f}')
+        lines.append(f'http_request_duration_seconds_count{{{label}}} {entry["count"]}')
+
+    for name, key, help_text in (
+        ('db_statements_total', 'sql_count', 'SQL statements executed by endpoint.'),
+        ('db_statement_seconds_total', 'sql_seconds', 'Time spent in SQL statements by endpoint.'),
+        ('template_render_seconds_total', 'template_seconds', 'Time spent rendering templates by endpoint.'),
+        ('password_hash_seconds_total', 'hash_seconds', 'Time spent hashing or verifying passwords by endpoint.'),
+    ):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for endpoint, entry in sorted(snapshot.items()):
+            value = entry[key]
+            value = f'{value:.6f}' if isinstance(value, float) else value
+            lines.append(f'{name}{{endpoint="{_label(endpoint)}"}} {value}')
+
+    lines.append('# HELP db_slow_statements_total SQL statements slower than SLOW_QUERY_THRESHOLD_MS.')
+    lines.append('# TYPE db_slow_statements_total counter')
+    lines.append(f'db_slow_statements_total {registry.slow_queries}')
+
+    for name, help_text, value in extra_counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+def _sample():
+    if not has_request_context():
+        return None
+    return g.get('_metrics_sample')
+
+# Request timings, SQL counts/time (engine events), template render time and password hash time
+# per endpoint, served on /metrics. Nothing is hooked in unless METRICS_ENABLED is set, and the
+# slow query log only hooks the engine when SLOW_QUERY_THRESHOLD_MS is set.
+class Metrics:
+    def init_app(self, app, db):
+        enabled = app.config.get('METRICS_ENABLED', False)
+        threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+        if not enabled and threshold_ms is None:
+            return
+
+        registry = Registry(app.config.get('METRICS_BUCKETS', DEFAULT_BUCKETS))
+        app.extensions['metrics'] = registry
+        threshold = threshold_ms / 1000 if threshold_ms is not None else None
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('_metrics_started', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['_metrics_started'].pop()
+            sample = _sample()
+            if sample is not None:
+                sample['sql_count'] += 1
+                sample['sql_seconds'] += elapsed
+            if threshold is not None and elapsed >= threshold:
+                registry.slow_queries += 1
+                slow_query_logger.warning(
+                    'Slow query (%.1f ms) in %s: %s',
+                    elapsed * 1000,
+                    request.endpoint if has_request_context() else '-',
+                    statement,
+                )
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+        if not enabled:
+            return
+
+        @app.before_request
+        def start_request_timer():
+            g._metrics_sample = {
+                'started': time.perf_counter(),
+                'sql_count': 0,
+                'sql_seconds': 0.0,
+                'template_seconds': 0.0,
+                'hash_seconds': 0.0,
+                'template_started': [],
+            }
+
+        @app.teardown_request
+        def record_request(exc):
+            sample = g.pop('_metrics_sample', None)
+            if sample is None or request.endpoint == 'metrics':
+                return
+            registry.observe(request.endpoint or 'unmatched', time.perf_counter() - sample['started'], sample)
+
+        def template_started(sender, template, context, **extra):
+            sample = _sample()
+            if sample is not None:
+                sample['template_started'].append(time.perf_counter())
+
+        def template_finished(sender, template, context, **extra):
+            sample = _sample()
+            if sample is not None and sample['template_started']:
+                sample['template_seconds'] += time.perf_counter() - sample['template_started'].pop()
+
+        def hash_timed(sender, seconds, **extra):
+            sample = _sample()
+            if sample is not None:
+                sample['hash_seconds'] += seconds
+
+        # Keep strong references: blinker holds receivers weakly
+        app.extensions['metrics_receivers'] = (template_started, template_finished, hash_timed)
+        before_render_template.connect(template_started, app)
+        template_rendered.connect(template_finished, app)
+        password_hashed.connect(hash_timed, app)
+
+        app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+def metrics_view():
+    counters = []
+    for name in ('user_cache', 'task_list_cache'):
+        state = current_app.extensions.get(name)
+        if state is not None:
+            counters.append((f'{name}_hits_total', f'{name} hits.', state['hits']))
+            counters.append((f'{name}_misses_total', f'{name} misses.', state['misses']))
+    state = current_app.extensions.get('rate_limiter')
+    if state is not None:
+        counters.append(('ratelimit_checked_total', 'Requests checked against a rate limit.', state['checked']))
+        counters.append(('ratelimit_rejected_total', 'Requests rejected with 429 by a rate limit.', sum(state['rejected'].values())))
+    body = render_prometheus(current_app.extensions['metrics'], counters)
+    return Response(body, mimetype='text/plain; version=0.0.4')
@@ -1,6 +1,5 @@
-from app import db
+from app import db, password_hasher
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 import enum
 from datetime import datetime
 
@@ -11,9 +10,14 @@ class User(db.Model, UserMixin):
     _password = db.Column("password", db.String(120), nullable=False) # Password is stored as a hashed value
     tasks = db.relationship('Task', back_populates='owner', lazy='dynamic', cascade="all, delete-orphan") # One-to-many relationship with tasks
     is_admin = db.Column(db.Boolean, default=False) # Indicates if the user has admin privileges
+    deleting = db.Column(db.Boolean, default=False, nullable=False, server_default=db.false()) # Set when the delete-user job is queued; the account is disabled from then on
 
     def is_administrator(self):
         return self.is_admin
+
+    @property
+    def is_active(self):
+        return not self.deleting # Flask-Login refuses to log in inactive users
     
     @property
     def password(self):
@@ -21,10 +25,13 @@ class User(db.Model, UserMixin):
 
     @password.setter
     def password(self, password):
-        self._password = generate_password_hash(password)  # Hashes the password before storing it
+        self._password = password_hasher.hash(password)  # Hashes the password (in the hashing pool) before storing it
 
     def verify_password(self, password):
-        return check_password_hash(self._password, password) # Verifies a password against the stored hash
+        return password_hasher.verify(self._password, password) # Verifies a password against the stored hash
+
+    def password_needs_rehash(self):
+        return password_hasher.needs_rehash(self._password) # True when the hash predates the configured method/cost
 
 # Task Model
 class TaskStatus(enum.Enum):
@@ -39,9 +46,13 @@ class Task(db.Model):
     status = db.Column(db.Enum(TaskStatus), default=TaskStatus.NOT_STARTED, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Foreign key linking task to user
     owner = db.relationship('User', back_populates='tasks') # Relationship back to the user who owns the task
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow) # Timestamp when the task was created
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False) # Timestamp when the task was created; part of every page cursor
     permissions = db.relationship('Permission', back_populates='task', cascade="all, delete-orphan") # Relationship to permissions with cascading deletes
-    
+
+    __table_args__ = (
+        db.Index('ix_task_user_id_timestamp', 'user_id', 'timestamp'), # Owned-task listing, newest first
+        db.Index('ix_task_timestamp_id', 'timestamp', 'id'), # Keyset pagination over all tasks
+    )
 
 # Permission Model
 class Permission(db.Model):
@@ -52,6 +63,103 @@ class Permission(db.Model):
     user = db.relationship('User') # Relationship back to the user
     can_view = db.Column(db.Boolean, default=False)
     can_view_status = db.Column(db.Boolean, default=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'task_id', name='uq_permission_user_task'), # One permission per user per task; also serves lookups by user
+        db.Index('ix_permission_task_id', 'task_id'), # Permissions of a task (sharing, cascading deletes)
+    )
+
+# Cold storage for old tasks (see app/archive.py). Rows keep the id, owner and timestamp they had
+# in the task table; their shares move to archived_permission with them.
+class ArchivedTask(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False) # The task's id while it was live
+    title = db.Column(db.String(150), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    status = db.Column(db.Enum(TaskStatus), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    owner = db.relationship('User')
+    timestamp = db.Column(db.DateTime, nullable=False) # Creation time, as in the task table
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_archived_task_user_id_timestamp', 'user_id', 'timestamp'), # A user's archived tasks, newest first
+        db.Index('ix_archived_task_timestamp_id', 'timestamp', 'id'), # Keyset pagination over the archive
+    )
+
+class ArchivedPermission(db.Model):
+    id = db.Column(db.Integer, primary_key=True) # Restored shares get new permission ids
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('archived_task.id'), nullable=False)
+    can_view = db.Column(db.Boolean, default=False)
+    can_view_status = db.Column(db.Boolean, default=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'task_id', name='uq_archived_permission_user_task'),
+        db.Index('ix_archived_permission_task_id', 'task_id'),
+    )
+
+# Where each task lives when tasks are sharded (TASK_SHARDS, see app/sharding.py). Kept in the
+# global database with the users; inserting a row allocates the task's id for every shard.
+class TaskLocation(db.Model):
+    id = db.Column(db.Integer, primary_key=True) # The task's id
+    user_id = db.Column(db.Integer, nullable=False) # Owner; no foreign key, like the shard rows
+    shard = db.Column(db.Integer, nullable=False) # Index into TASK_SHARDS
+
+    __table_args__ = (
+        db.Index('ix_task_location_user_id_shard', 'user_id', 'shard'), # Shards holding a user's tasks
+        {'sqlite_autoincrement': True}, # Ids of deleted tasks are never handed out again
+    )
+
+# Change feed entry: task `task_id` changed (or went away) for user `user_id`. One row per
+# recipient, written after each committed task/permission write; the id is the feed cursor.
+class TaskEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False) # Recipient; no foreign keys, events outlive deleted tasks
+    task_id = db.Column(db.Integer, nullable=False)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True) # Used to prune old events
+
+    __table_args__ = (
+        db.Index('ix_task_event_user_id_id', 'user_id', 'id'), # A user's events after a cursor
+    )
+
+# Background job (see app/jobs.py). The row is the queue entry and the status clients poll.
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False) # Registered handler, e.g. "delete-user"
+    payload = db.Column(db.Text, nullable=False, default='{}') # JSON keyword arguments for the handler
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued, running, succeeded or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # Delays retries
+    result = db.Column(db.Text, nullable=True) # JSON return value of the handler
+    error = db.Column(db.Text, nullable=True) # Last failure
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    started = db.Column(db.DateTime, nullable=True)
+    finished = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'), # Next job to claim
+    )
+
+# Precomputed task statistics for the admin dashboard, kept up to date by database triggers on
+# task and permission (see app/stats.py). No foreign keys: the triggers own these rows.
+class TaskStatusCount(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True) # TaskStatus name
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class TaskDailyCount(db.Model):
+    day = db.Column(db.Date, primary_key=True) # Creation day of the tasks (from Task.timestamp)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class TaskShareCount(db.Model):
+    task_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0) # Permissions with can_view
+
+    __table_args__ = (
+        db.Index('ix_task_share_count_count_task_id', 'count', 'task_id'), # Most shared tasks, read straight off the index
+    )
+
 '''
 
 +------------------+         +------------------+        +------------------+
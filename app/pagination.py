@@ -0,0 +1,111 @@
+import base64
+import binascii
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+from .models import Task, Permission
+
+DEFAULT_PER_PAGE = 50
+DEFAULT_MAX_PER_PAGE = 200
+
+# A single page of results plus the cursors needed to move around it
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None, per_page=DEFAULT_PER_PAGE):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+# Cursors are opaque to the client: "<timestamp>|<id>" in URL-safe base64
+def encode_cursor(task):
+    raw = f'{task.timestamp.isoformat()}|{task.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, task_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(task_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None # A tampered or stale cursor simply restarts from the first page
+
+# Page size comes from TASKS_PER_PAGE, optionally overridden by ?per_page= up to MAX_TASKS_PER_PAGE
+def get_per_page():
+    per_page = current_app.config.get('TASKS_PER_PAGE', DEFAULT_PER_PAGE)
+    max_per_page = current_app.config.get('MAX_TASKS_PER_PAGE', DEFAULT_MAX_PER_PAGE)
+    requested = request.args.get('per_page', type=int)
+    if requested:
+        per_page = requested
+    return max(1, min(per_page, max_per_page))
+
+# Listing queries eager-load the owner so rendering a page never lazy-loads per row
+def tasks_query():
+    return Task.query.options(joinedload(Task.owner))
+
+# Owned-or-shared tasks for a user as one query instead of two concatenated lists
+def visible_tasks_query(user):
+    from . import access_control
+    condition = access_control.view_condition(user, Task, Permission)
+    return tasks_query() if condition is None else tasks_query().filter(condition)
+
+# Keyset pagination on (timestamp, id), newest first.
+# Only per_page + 1 rows are ever fetched, whatever the size of the table.
+# `model` is the queried model (Task, or ArchivedTask for the archive).
+def keyset_page(query, per_page, after=None, before=None, model=Task):
+    key = tuple_(model.timestamp, model.id)
+    after = decode_cursor(after)
+    before = decode_cursor(before) if not after else None
+
+    if before:
+        # Walking backwards: read ascending from the cursor, then flip
+        rows = query.filter(key > before).order_by(
+            model.timestamp.asc(), model.id.asc()
+        ).limit(per_page + 1).all()
+    else:
+        if after:
+            query = query.filter(key < after)
+        rows = query.order_by(
+            model.timestamp.desc(), model.id.desc()
+        ).limit(per_page + 1).all()
+    return page_from_rows(rows, per_page, after=after, backwards=bool(before))
+
+# Turns the up to per_page + 1 rows read from a cursor into a Page: newest first, or oldest first
+# when walking backwards from a `before` cursor
+def page_from_rows(rows, per_page, after=None, backwards=False):
+    has_more = len(rows) > per_page
+    if backwards:
+        items = list(reversed(rows[:per_page]))
+        next_cursor = encode_cursor(items[-1]) if items else None
+        prev_cursor = encode_cursor(items[0]) if items and has_more else None
+    else:
+        items = rows[:per_page]
+        next_cursor = encode_cursor(items[-1]) if items and has_more else None
+        prev_cursor = encode_cursor(items[0]) if items and after else None
+    return Page(items, next_cursor=next_cursor, prev_cursor=prev_cursor, per_page=per_page)
+
+# Reads the cursor arguments from the current request
+def paginate_tasks(query, model=Task):
+    return keyset_page(
+        query,
+        get_per_page(),
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        model=model,
+    )
@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from flask import current_app, jsonify, request, session
+from .database import SAFE_METHODS
+
+try:
+    import redis
+except ImportError: # Only needed for the shared backend
+    redis = None
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# Limits per endpoint and key: 'ip' is the client address, 'username' the username posted in
+# the form and 'user' the logged-in user id (the client address for anonymous requests).
+# RATELIMITS in the config is merged over these; map an endpoint to None to lift its limits.
+DEFAULT_LIMITS = {
+    'main.login': {'ip': '30/minute', 'username': '10/minute'},
+    'main.register': {'ip': '20/hour'},
+}
+# Applies to every other POST in the main blueprint and every POST, PATCH and DELETE in the JSON
+# API (a batch request counts once), per user
+DEFAULT_WRITE_LIMIT = '120/minute'
+
+# '10/minute' -> (capacity, tokens refilled per second): bursts of up to 10, then one every 6 s
+def parse_limit(limit):
+    count, _, period = limit.partition('/')
+    try:
+        count = int(count)
+        seconds = PERIODS[period.strip().rstrip('s')]
+    except (ValueError, KeyError):
+        raise ValueError(f'Invalid rate limit: {limit!r}') from None
+    if count < 1:
+        raise ValueError(f'Invalid rate limit: {limit!r}')
+    return count, count / seconds
+
+# In-process token buckets, one (tokens, last update) pair per key. Least recently used keys
+# are dropped past maxsize; a dropped key simply starts again from a full bucket.
+class MemoryBuckets:
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Takes one token if there is one. Returns (allowed, seconds until a token is available).
+    def take(self, key, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+# Refill and take in one atomic step on the Redis server, timed by its clock, so every worker
+# (and host) draws from the same bucket. Idle buckets expire once they would be full again.
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+# Shared token buckets in Redis (or anything speaking its protocol)
+class RedisBuckets:
+    def __init__(self, url, prefix='taskmanager:ratelimit:'):
+        if redis is None:
+            raise RuntimeError('The redis rate limit backend requires the "redis" package.')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, capacity, rate):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[capacity, rate])
+        allowed = bool(int(allowed))
+        return allowed, 0.0 if allowed else (1 - float(tokens)) / rate
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+# Picks the backend from RATELIMIT_BACKEND ('memory' or 'redis'), like make_cache
+def make_buckets(app):
+    backend = app.config.get('RATELIMIT_BACKEND', 'memory')
+    if backend == 'redis':
+        url = app.config.get('RATELIMIT_REDIS_URL') or app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+        return RedisBuckets(url)
+    if backend == 'memory':
+        return MemoryBuckets(maxsize=app.config.get('RATELIMIT_MAX_KEYS', 100000))
+    raise ValueError(f'Unknown RATELIMIT_BACKEND: {backend}')
+
+# Token bucket rate limits on the main blueprint's and the API's writes, checked in an app-wide
+# before_request hook (which Flask runs ahead of the blueprints' own): a rejected request never
+# reaches the user loader, a database query or the password hasher. The keys come from the
+# client address, the posted form and the session cookie only.
+class RateLimiter:
+    def init_app(self, app):
+        limits = dict(DEFAULT_LIMITS)
+        limits.update(app.config.get('RATELIMITS', {}))
+        write_limit = app.config.get('RATELIMIT_WRITE_LIMIT', DEFAULT_WRITE_LIMIT)
+        app.extensions['rate_limiter'] = {
+            'backend': make_buckets(app),
+            'enabled': app.config.get('RATELIMIT_ENABLED', True),
+            'limits': {
+                endpoint: [(key, *parse_limit(limit)) for key, limit in (rules or {}).items() if limit]
+                for endpoint, rules in limits.items()
+            },
+            'write_limit': parse_limit(write_limit) if write_limit else None,
+            'lock': threading.Lock(),
+            'checked': 0,
+            'rejected': defaultdict(int),
+        }
+        app.before_request(self.check)
+
+    @property
+    def _state(self):
+        return current_app.extensions['rate_limiter']
+
+    def rules(self, state, endpoint):
+        if endpoint in state['limits']:
+            return state['limits'][endpoint]
+        if state['write_limit'] and endpoint.startswith(('main.', 'api.')):
+            return [('user', *state['write_limit'])]
+        return []
+
+    def key(self, kind):
+        if kind == 'username':
+            username = request.form.get('username', '').strip().lower()
+            return f'username:{username}' if username else None
+        if kind == 'user':
+            user_id = session.get('_user_id') # Set by Flask-Login; reading it loads no user
+            if user_id is not None:
+                return f'user:{user_id}'
+        return f'ip:{request.remote_addr}'
+
+    def check(self):
+        state = self._state
+        if not state['enabled'] or request.method in SAFE_METHODS or request.endpoint is None:
+            return None
+        rules = self.rules(state, request.endpoint)
+        if not rules:
+            return None
+        with state['lock']:
+            state['checked'] += 1
+        retry_after = 0.0
+        for kind, capacity, rate in rules:
+            key = self.key(kind)
+            if key is None:
+                continue
+            allowed, wait = state['backend'].take(f'{request.endpoint}:{key}', capacity, rate)
+            if not allowed:
+                with state['lock']:
+                    state['rejected'][(request.endpoint, kind)] += 1
+                retry_after = max(retry_after, wait)
+        if retry_after:
+            return self.reject(retry_after)
+        return None
+
+    def reject(self, retry_after):
+        seconds = max(1, int(retry_after + 0.999))
+        message = f'Too many requests. Please try again in {seconds} seconds.'
+        if request.blueprint == 'api':
+            response = jsonify(error=message)
+        else:
+            response = current_app.response_class(message, mimetype='text/plain')
+        response.status_code = 429
+        response.headers['Retry-After'] = str(seconds)
+        return response
+
+    def reset(self):
+        state = self._state
+        state['backend'].clear()
+        with state['lock']:
+            state['checked'] = 0
+            state['rejected'].clear()
+
+    def stats(self):
+        state = self._state
+        with state['lock']:
+            rejected = {f'{endpoint}:{kind}': count for (endpoint, kind), count in sorted(state['rejected'].items())}
+            checked = state['checked']
+        backend = state['backend']
+        return {
+            'backend': type(backend).__name__,
+            'enabled': state['enabled'],
+            'checked': checked,
+            'rejected': rejected,
+            'rejected_total': sum(rejected.values()),
+            'keys': len(backend) if hasattr(backend, '__len__') else None,
+        }
@@ -1,8 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, make_response, session, current_app
+from markupsafe import Markup
 from flask_login import login_user, logout_user, login_required, current_user
-from .models import User, Task, Permission, TaskStatus
-from .utils import admin_required
-from . import db
+from .models import User, TaskStatus, Job, ArchivedTask
+from .utils import admin_required, task_audience
+from .pagination import get_per_page, paginate_tasks
+from .signals import notify_tasks_changed, notify_recipients
+from .hashing import HashingBusy
+from .sharing import bulk_share
+from .search import search_tasks
+from .database import replica_lag_window
+from .feed import latest_event_id
+from .jobs import job_to_dict
+from .stats import dashboard_stats
+from .archive import ArchiveError, archived_tasks_query, archived_status_visible, check_archive, restorable, restore_tasks
+from .writebehind import StatusWriteError
+from . import db, store, status_writes, user_cache, task_list_cache, job_queue, rate_limiter, access_control
 
 # Create a Blueprint named 'main'
 main = Blueprint('main', __name__)
@@ -23,9 +35,18 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        user = User.query.filter_by(username=username).first()
+        user = User.query.filter_by(username=username, deleting=False).first()
 
-        if user and user.verify_password(password):
+        try:
+            verified = user is not None and user.verify_password(password)
+            if verified and user.password_needs_rehash():
+                user.password = password # Transparently upgrade hashes made with older settings
+                db.session.commit()
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('login.html'), 503
+
+        if verified:
             login_user(user, remember=True)
             next_page = request.args.get('next')
             return redirect(next_page or url_for('main.index'))
@@ -53,7 +74,12 @@ def register():
             flash('Username already exists. Please choose a different one.')
             return render_template('register.html')
 
-        user = User(username=username, password=password)
+        try:
+            user = User(username=username, password=password)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('register.html'), 503
+
         try:
             db.session.add(user)
             db.session.commit()
@@ -70,18 +96,59 @@ def register():
 @main.route('/tasks')
 @login_required
 def tasks():
-    all_tasks = []
-    if current_user.is_administrator():
-        all_tasks = Task.query.all()
+    # Read before the list so the page's feed cursor never runs ahead of what it shows
+    feed_cursor = latest_event_id(current_user.id)
+    if not task_list_cache.enabled:
+        return render_tasks_page(render_task_list(), feed_cursor)
+
+    # The key changes whenever a write touches this user's tasks, so it doubles as the ETag.
+    # Pages carrying flash messages are one-offs and are never answered with a 304.
+    key = task_list_cache.key(current_user, request.args)
+    conditional = not session.get('_flashes')
+    if conditional and request.if_none_match.contains_weak(key):
+        response = make_response('', 304)
     else:
-        owned_tasks = Task.query.filter_by(user_id=current_user.id).all()
-        shared_tasks = Task.query.join(Permission).filter(
-            Permission.user_id == current_user.id,
-            Permission.can_view == True
-        ).all()
-        all_tasks = owned_tasks + shared_tasks
-
-    return render_template('tasks.html', tasks=all_tasks, TaskStatus=TaskStatus)
+        fragment = task_list_cache.get(key)
+        if fragment is None:
+            fragment = render_task_list()
+            # Rows read from a replica shortly after a write may be stale; do not keep them
+            if task_list_cache.version_age(current_user) >= replica_lag_window():
+                task_list_cache.set(key, fragment)
+        response = make_response(render_tasks_page(fragment, feed_cursor))
+    if conditional:
+        response.set_etag(key, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# The task page around a rendered list. LIVE_UPDATES picks how tasks.js follows the change feed:
+# 'poll' (short polls every FEED_CLIENT_POLL_INTERVAL seconds or less often, holding no server
+# thread), 'stream' (an open stream per page) or 'off'.
+def render_tasks_page(fragment, feed_cursor):
+    return render_template(
+        'tasks.html',
+        task_list=Markup(fragment),
+        feed_cursor=feed_cursor,
+        live_updates=current_app.config.get('LIVE_UPDATES', 'poll'),
+        poll_interval=current_app.config.get('FEED_CLIENT_POLL_INTERVAL', 10),
+    )
+
+# Renders the current page of the user's task list as an HTML fragment
+def render_task_list():
+    page = store.visible_tasks_page(
+        current_user, get_per_page(), after=request.args.get('after'), before=request.args.get('before')
+    )
+    allowed = access_control.permissions(current_user, [task.id for task in page.items])
+    return render_template('task_list.html', tasks=page.items, page=page, allowed=allowed, TaskStatus=TaskStatus)
+
+# Route to search the titles and descriptions of the tasks the user can see
+@main.route('/tasks/search')
+@login_required
+def search():
+    terms = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, has_more = search_tasks(current_user, terms, page=page) if terms else ([], False)
+    allowed = access_control.permissions(current_user, [task.id for task in results])
+    return render_template('search.html', q=terms, results=results, page=page, has_more=has_more, allowed=allowed)
 
 # Route for editing/creating a task
 @main.route('/task/edit/<int:task_id>', methods=['GET', 'POST'])
@@ -90,21 +157,20 @@ def tasks():
 def edit_task(task_id=None):
     task = None
     if task_id:
-        task = db.session.get(Task, task_id)
-        if not task or (task.user_id != current_user.id and not current_user.is_administrator()):
+        if not access_control.can(current_user, 'edit', [task_id])[task_id]:
             flash('You do not have permission to edit this task.')
             return redirect(url_for('main.tasks'))
+        task = store.get_task(task_id)
 
     if request.method == 'POST':
         title = request.form['title']
         description = request.form['description']
         if task:
-            task.title = title
-            task.description = description
+            task_id = task.id
+            store.update_tasks([task_id], title=title, description=description)
         else:
-            new_task = Task(title=title, description=description, user_id=current_user.id)
-            db.session.add(new_task)
-        db.session.commit()
+            task_id = store.create_task(current_user.id, title, description)
+        notify_tasks_changed(task_audience([task_id]), [task_id])
         return redirect(url_for('main.tasks'))
 
     return render_template('edit_task.html', task=task)
@@ -113,8 +179,7 @@ def edit_task(task_id=None):
 @main.route('/task/share/<int:task_id>', methods=['POST'])
 @login_required
 def share_task(task_id):
-    task = db.session.get(Task, task_id)
-    if not task or (task.user_id != current_user.id and not current_user.is_administrator()):
+    if not access_control.can(current_user, 'share', [task_id])[task_id]:
         flash('You do not have permission to share this task.', 'danger')
         return redirect(url_for('main.tasks'))
 
@@ -122,35 +187,50 @@ def share_task(task_id):
     user_to_share_with = User.query.filter_by(username=username).first()
 
     if user_to_share_with:
-        existing_permission = Permission.query.filter_by(task_id=task_id, user_id=user_to_share_with.id).first()
-        if existing_permission:
-            existing_permission.can_view = True
-            existing_permission.can_view_status = True
-            db.session.commit()
-            flash(f'Task has already been shared with {username}. Permissions updated.', 'info')
-        else:
-            permission = Permission(task_id=task_id, user_id=user_to_share_with.id, can_view=True, can_view_status=True)
-            db.session.add(permission)
-            db.session.commit()
+        created = store.share_task(task_id, user_to_share_with.id)
+        notify_tasks_changed(task_audience([task_id]), [task_id])
+        if created:
             flash('Task shared successfully with ' + username, 'success')
+        else:
+            flash(f'Task has already been shared with {username}. Permissions updated.', 'info')
     else:
         flash('User not found.', 'danger')
     return redirect(url_for('main.tasks'))
 
+# Route for sharing several tasks with several users in one operation
+@main.route('/tasks/share', methods=['POST'])
+@login_required
+def bulk_share_tasks():
+    task_ids = request.form.getlist('task_ids', type=int)
+    usernames = request.form.get('usernames', '').replace(',', ' ').split()
+    if not task_ids or not usernames:
+        flash('Select at least one task and enter at least one username.', 'danger')
+        return redirect(url_for('main.tasks'))
+
+    result = bulk_share(task_ids, usernames, actor=current_user)
+    flash(f'Sharing done: {result.created} created, {result.updated} updated, {result.skipped} unchanged.', 'success')
+    if result.unknown_users:
+        flash('Users not found: ' + ', '.join(result.unknown_users), 'danger')
+    if result.denied_tasks:
+        flash('You do not have permission to share some of the selected tasks.', 'danger')
+    return redirect(url_for('main.tasks'))
+
 # Route for updating the status of a task
 @main.route('/task/update_status/<int:task_id>', methods=['POST'])
 @login_required
 def update_task_status(task_id):
-    task = db.session.get(Task, task_id)
-    if not task or task.user_id != current_user.id:
+    if not access_control.can(current_user, 'update_status', [task_id])[task_id]:
         flash('You do not have permission to update this task.', 'danger')
         return redirect(url_for('main.tasks'))
 
     new_status = request.form.get('status')
     if new_status in TaskStatus.__members__:
-        task.status = TaskStatus[new_status]
-        db.session.commit()
-        flash('Task status updated successfully.', 'success')
+        try:
+            status_writes.write(task_id, TaskStatus[new_status])
+        except StatusWriteError:
+            flash('The task status could not be saved. Please try again.', 'danger')
+        else:
+            flash('Task status updated successfully.', 'success')
     else:
         flash('Invalid status.', 'danger')
     
@@ -160,16 +240,42 @@ def update_task_status(task_id):
 @main.route('/task/delete/<int:task_id>', methods=['POST'])
 @login_required
 def delete_task(task_id):
-    task = db.session.get(Task, task_id)
-    if not task or task.user_id != current_user.id:
+    if not access_control.can(current_user, 'delete', [task_id])[task_id]:
         flash('You do not have permission to delete this task.')
         return redirect(url_for('main.tasks'))
 
-    db.session.delete(task)
-    db.session.commit()
+    notify_recipients(store.delete_tasks([task_id]))
     flash('Task deleted successfully.')
     return redirect(url_for('main.tasks'))
 
+# Route to list the user's archived tasks (owned or shared), read-only
+@main.route('/tasks/archived')
+@login_required
+def archived_tasks():
+    page = paginate_tasks(archived_tasks_query(current_user), model=ArchivedTask)
+    task_ids = [task.id for task in page.items]
+    return render_template(
+        'archived_tasks.html', tasks=page.items, page=page,
+        status_visible=archived_status_visible(current_user, task_ids),
+        restorable=restorable(current_user, task_ids),
+    )
+
+# Route for moving an archived task back to the task list
+@main.route('/task/restore/<int:task_id>', methods=['POST'])
+@login_required
+def restore_task(task_id):
+    if task_id not in restorable(current_user, [task_id]):
+        flash('You do not have permission to restore this task.', 'danger')
+        return redirect(url_for('main.archived_tasks'))
+
+    try:
+        restore_tasks([task_id])
+    except ArchiveError as error:
+        flash(str(error), 'danger')
+    else:
+        flash('Task restored successfully.', 'success')
+    return redirect(url_for('main.archived_tasks'))
+
 # ADMIN: Manage Users and Tasks
 
 # Route to view and manage all users
@@ -200,35 +306,69 @@ def toggle_admin(user_id):
     else:
         user.is_admin = not user.is_admin
         db.session.commit()
+        user_cache.invalidate(user.id) # Revocation must apply on the user's very next request
         flash(f'Admin status for {user.username} has been {"granted" if user.is_admin else "revoked"}.', 'success')
     return redirect(url_for('main.admin_users'))
 
+# Route to inspect the user cache hit/miss counters
+@main.route('/admin/cache_stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(user_cache=user_cache.stats(), task_list_cache=task_list_cache.stats(),
+                   access_index=access_control.stats())
+
+# Route to inspect the rate limiter: requests checked and rejected per endpoint and key
+@main.route('/admin/ratelimit_stats')
+@login_required
+@admin_required
+def ratelimit_stats():
+    return jsonify(rate_limiter.stats())
+
+# Route to the admin dashboard: task counts per user and status, tasks created per day and the
+# most shared tasks, all read from the precomputed counters
+@main.route('/admin/dashboard')
+@login_required
+@admin_required
+def admin_dashboard():
+    stats = dashboard_stats(
+        days=current_app.config.get('DASHBOARD_DAYS', 30),
+        top_shared=current_app.config.get('DASHBOARD_TOP_SHARED', 20),
+    )
+    return render_template('admin_dashboard.html', stats=stats)
+
 # Route to view and manage all tasks
 @main.route('/admin/tasks')
 @login_required
 @admin_required
 def admin_tasks():
-    tasks = Task.query.all()
-    return render_template('admin_tasks.html', tasks=tasks)
+    # Every task for admins, from the shards with TASK_SHARDS
+    page = store.visible_tasks_page(
+        current_user, get_per_page(), after=request.args.get('after'), before=request.args.get('before')
+    )
+    return render_template('admin_tasks.html', tasks=page.items, page=page)
 
 # Route to edit a task
 @main.route('/admin/edit_task/<int:task_id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def admin_edit_task(task_id):
-    task = db.session.get(Task, task_id)
+    task = store.get_task(task_id)
 
     if not task:
         flash('Task not found.', 'danger')
         return redirect(url_for('main.admin_tasks'))
 
     if request.method == 'POST':
-        task.title = request.form['title']
-        task.description = request.form['description']
+        store.update_tasks([task_id], title=request.form['title'], description=request.form['description'])
+        notify_tasks_changed(task_audience([task_id]), [task_id])
 
         if 'status' in request.form and not current_user.is_administrator():
-            task.status = TaskStatus(request.form['status'])
-        db.session.commit()
+            try:
+                status_writes.write(task_id, TaskStatus(request.form['status']))
+            except StatusWriteError:
+                flash('The task status could not be saved. Please try again.', 'danger')
+                return redirect(url_for('main.admin_tasks'))
 
         flash('Task updated successfully.', 'success')
         return redirect(url_for('main.admin_tasks'))
@@ -240,13 +380,12 @@ def admin_edit_task(task_id):
 @login_required
 @admin_required
 def admin_delete_task(task_id):
-    task = db.session.get(Task, task_id)
+    task = store.get_task(task_id)
     if not task:
         flash('Task not found.', 'danger')
         return redirect(url_for('main.admin_tasks'))
 
-    db.session.delete(task)
-    db.session.commit()
+    notify_recipients(store.delete_tasks([task_id]))
     flash('Task deleted successfully.', 'success')
     return redirect(url_for('main.admin_tasks'))
 
@@ -264,8 +403,36 @@ def delete_user(user_id):
     if user.username.lower() == "sinan":
         flash('The user "sinan" cannot be deleted.', 'danger')
     else:
-        db.session.delete(user)
+        # The account is disabled right away, in every process, and removed by the job: users
+        # with many tasks take too long to delete inside the request
+        user.deleting = True
         db.session.commit()
-        flash(f'User "{user.username}" has been deleted successfully.', 'success')
+        user_cache.invalidate(user_id)
+        job = job_queue.enqueue('delete-user', user_id=user_id)
+        flash(f'User "{user.username}" is being deleted (job {job.id}).', 'success')
 
     return redirect(url_for('main.admin_users'))
+
+# Route to archive the tasks matching the archive policy, in a background job
+@main.route('/admin/archive', methods=['POST'])
+@login_required
+@admin_required
+def archive_tasks():
+    try:
+        check_archive()
+    except ArchiveError as error:
+        flash(str(error), 'danger')
+        return redirect(url_for('main.admin_tasks'))
+    job = job_queue.enqueue('archive-tasks')
+    flash(f'Old tasks are being archived (job {job.id}).', 'success')
+    return redirect(url_for('main.admin_tasks'))
+
+# Route to poll the status of a background job
+@main.route('/admin/jobs/<int:job_id>')
+@login_required
+@admin_required
+def job_status(job_id):
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify(error='Job not found.'), 404
+    return jsonify(job_to_dict(job))
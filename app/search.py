@@ -0,0 +1,98 @@
+import re
+from sqlalchemy import Column, Integer, MetaData, Table, event, func, literal_column, or_
+from .models import Task
+from .pagination import visible_tasks_query
+from . import db, task_shards
+
+# SQLite: an external-content FTS5 index over task.title/description. Triggers keep it in sync
+# with every insert, update and delete, whichever code path (ORM, bulk statements, imports) runs it.
+# The migrations carry a copy of this DDL for databases managed by Alembic.
+SQLITE_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5("
+    "title, description, content='task', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ad AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_au AFTER UPDATE OF title, description ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS task_fts_ai",
+    "DROP TRIGGER IF EXISTS task_fts_ad",
+    "DROP TRIGGER IF EXISTS task_fts_au",
+    "DROP TABLE IF EXISTS task_fts",
+]
+
+# PostgreSQL: a GIN index over the same tsvector expression the search query uses
+POSTGRES_TSVECTOR = "to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, ''))"
+POSTGRES_FTS_DDL = [f"CREATE INDEX IF NOT EXISTS ix_task_fts ON task USING gin ({POSTGRES_TSVECTOR})"]
+POSTGRES_FTS_DROP = ["DROP INDEX IF EXISTS ix_task_fts"]
+
+# The FTS table is managed here and in migrations, not by the models' metadata
+task_fts = Table('task_fts', MetaData(), Column('rowid', Integer), Column('rank'))
+
+def fts_ddl(dialect):
+    return {'sqlite': SQLITE_FTS_DDL, 'postgresql': POSTGRES_FTS_DDL}.get(dialect, [])
+
+def fts_drop(dialect):
+    return {'sqlite': SQLITE_FTS_DROP, 'postgresql': POSTGRES_FTS_DROP}.get(dialect, [])
+
+# Keep db.create_all()/drop_all() (and so the tests) in step with the migrations
+@event.listens_for(Task.__table__, 'after_create')
+def create_fts_index(target, connection, **kw):
+    for statement in fts_ddl(connection.dialect.name):
+        connection.exec_driver_sql(statement)
+
+@event.listens_for(Task.__table__, 'before_drop')
+def drop_fts_index(target, connection, **kw):
+    for statement in fts_drop(connection.dialect.name):
+        connection.exec_driver_sql(statement)
+
+# Used by Flask-Migrate so autogenerate does not try to drop the FTS5 shadow tables
+def include_name(name, type_, parent_names):
+    return not (type_ == 'table' and name.startswith('task_fts'))
+
+# Turns free text into an FTS5 query: every word must match, the last one as a prefix.
+# User input never reaches the MATCH syntax unquoted.
+def fts_query(terms):
+    words = re.findall(r'\w+', terms)
+    if not words:
+        return None
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+# How to search `task` (the global table or a shard's) for the terms: (join onto the FTS table
+# or None, match condition, rank, whether a higher rank is better), or None when nothing can match
+def search_clauses(task, dialect, terms):
+    if dialect == 'sqlite':
+        match = fts_query(terms)
+        if match is None:
+            return None
+        return (task_fts, task_fts.c.rowid == task.c.id), literal_column('task_fts').op('MATCH')(match), task_fts.c.rank, False
+    if dialect == 'postgresql':
+        tsquery = func.plainto_tsquery('simple', terms)
+        vector = literal_column(POSTGRES_TSVECTOR)
+        return None, vector.op('@@')(tsquery), func.ts_rank(vector, tsquery), True
+    # No full-text index available: fall back to a LIKE scan, newest first
+    match = or_(task.c.title.icontains(terms, autoescape=True), task.c.description.icontains(terms, autoescape=True))
+    return None, match, task.c.timestamp, True
+
+# Ranked full-text search restricted to the tasks the user owns or can view (on every shard
+# with TASK_SHARDS). Returns (tasks, has_more) for 1-based `page`.
+def search_tasks(user, terms, page=1, per_page=20):
+    if task_shards.enabled:
+        return task_shards.search(user, terms, page, per_page)
+    clauses = search_clauses(Task.__table__, db.session.get_bind().dialect.name, terms)
+    if clauses is None:
+        return [], False
+    join, match, rank, descending = clauses
+    query = visible_tasks_query(user)
+    if join is not None:
+        query = query.join(*join)
+    query = query.filter(match).order_by(rank.desc() if descending else rank, Task.id.desc())
+
+    rows = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return rows[:per_page], len(rows) > per_page
@@ -0,0 +1,494 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import MetaData, and_, delete, insert, inspect, select, tuple_, union, update
+from .database import is_sqlite
+from .signals import notify_tasks_changed, notify_recipients
+
+DEFAULT_REBALANCE_BATCH = 500
+
+# Models and db are imported inside the functions: this module is loaded while the app package
+# itself is still initializing.
+
+_shard_metadata = None
+
+# The task and permission tables as every shard has them: the same columns and indexes, without
+# the foreign keys to user, which stays in the global database. Built on first use from the models.
+# The metadata also holds each shard's dashboard counters (see app/stats.py).
+def shard_tables():
+    global _shard_metadata
+    if _shard_metadata is None:
+        from .models import Task, Permission, TaskStatusCount, TaskDailyCount, TaskShareCount
+        metadata = MetaData()
+        for table in (Task.__table__, Permission.__table__, TaskStatusCount.__table__, TaskDailyCount.__table__, TaskShareCount.__table__):
+            copy = table.to_metadata(metadata)
+            for constraint in list(copy.foreign_key_constraints):
+                if constraint.elements[0].target_fullname.startswith('user.'):
+                    copy.constraints.discard(constraint)
+                    for element in constraint.elements:
+                        element.parent.foreign_keys.discard(element)
+                        copy.foreign_keys.discard(element)
+        _shard_metadata = metadata
+    return _shard_metadata.tables['task'], _shard_metadata.tables['permission']
+
+# A task read from a shard, with the attributes of Task that templates and the API use. `owner`
+# is the User, loaded from the global database.
+class ShardTask:
+    def __init__(self, id, title, description, status, user_id, timestamp, owner=None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.status = status
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.owner = owner
+
+# Spreads tasks and their permissions over the databases listed in TASK_SHARDS, by owner:
+# a user's tasks go to shard user_id % len(TASK_SHARDS), and their shares go with them. Users,
+# jobs, the change feed and every other table stay in the global database (SQLALCHEMY_DATABASE_URI),
+# together with the task_location directory, which hands out task ids and records each task's shard.
+#
+# Lookups by task id read the directory, then the task's shard. A user's own tasks are read from
+# the shards the directory lists for them (normally one); tasks shared with them can be on any
+# shard, so listings query every shard in parallel on a thread pool (TASK_SHARD_WORKERS threads,
+# one per shard by default) and merge the pages by (timestamp, id). Without TASK_SHARDS nothing
+# changes: the task and permission tables of the global database are used as before.
+class TaskShards:
+    # Adds a bind per shard, so it must run before db.init_app creates the engines
+    def init_app(self, app):
+        uris = app.config.get('TASK_SHARDS') or []
+        if isinstance(uris, str):
+            uris = uris.replace(',', ' ').split()
+        keys = [f'shard{number}' for number in range(len(uris))]
+        if keys:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            for key, uri in zip(keys, uris):
+                # Binds do not inherit SQLALCHEMY_ENGINE_OPTIONS, so pass the pool settings along
+                options = {} if is_sqlite(uri) else dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+                binds.setdefault(key, dict(options, url=uri))
+            app.config['SQLALCHEMY_BINDS'] = binds
+        app.extensions['task_shards'] = {
+            'keys': keys,
+            'workers': app.config.get('TASK_SHARD_WORKERS') or len(keys),
+            'pool': None,
+            'pool_pid': None,
+            'lock': threading.Lock(),
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['task_shards']
+
+    @property
+    def enabled(self):
+        return bool(self._state['keys'])
+
+    @property
+    def count(self):
+        return len(self._state['keys'])
+
+    def engine(self, shard):
+        from . import db
+        return db.engines[self._state['keys'][shard]]
+
+    def shard_for(self, user_id):
+        return user_id % self.count
+
+    # Creates the task and permission tables, the full-text index and the dashboard counters
+    # with their triggers on every shard that lacks them
+    def create_all(self):
+        from .search import fts_ddl
+        from .stats import rebuild_counters, stats_ddl
+        if not self.enabled:
+            return
+        task, _ = shard_tables()
+        for shard in range(self.count):
+            engine = self.engine(shard)
+            with engine.begin() as connection:
+                indexed = inspect(connection).has_table('task_fts')
+                counted = inspect(connection).has_table('task_status_count')
+            task.metadata.create_all(engine)
+            with engine.begin() as connection:
+                dialect = connection.dialect.name
+                for statement in fts_ddl(dialect) + stats_ddl(dialect):
+                    connection.exec_driver_sql(statement)
+                # Tasks written before the index and the counters existed
+                if dialect == 'sqlite' and not indexed:
+                    connection.exec_driver_sql("INSERT INTO task_fts(task_fts) VALUES ('rebuild')")
+                if not counted:
+                    rebuild_counters(connection, task.metadata.tables, dialect)
+
+    # Threads do not survive a fork, so each worker process creates its own pool
+    def _pool(self):
+        state = self._state
+        with state['lock']:
+            if state['pool_pid'] != os.getpid():
+                state['pool'] = ThreadPoolExecutor(max_workers=state['workers'], thread_name_prefix='task-shard')
+                state['pool_pid'] = os.getpid()
+            return state['pool']
+
+    def shutdown(self):
+        state = self._state
+        with state['lock']:
+            if state['pool'] is not None and state['pool_pid'] == os.getpid():
+                state['pool'].shutdown()
+            state['pool'] = state['pool_pid'] = None
+
+    # Runs {shard: fn(connection)} and returns {shard: result}; several shards run in parallel,
+    # each in its own transaction
+    def gather(self, calls):
+        engines = {shard: self.engine(shard) for shard in calls}
+        def run(shard):
+            with engines[shard].begin() as connection:
+                return calls[shard](connection)
+        if len(calls) <= 1:
+            return {shard: run(shard) for shard in calls}
+        pool = self._pool()
+        futures = {shard: pool.submit(run, shard) for shard in calls}
+        return {shard: future.result() for shard, future in futures.items()}
+
+    # {shard: [task ids]} from the directory; ids it does not know are left out
+    def locate(self, task_ids):
+        from .models import TaskLocation
+        from . import db
+        shards = {}
+        rows = db.session.execute(
+            select(TaskLocation.id, TaskLocation.shard).where(TaskLocation.id.in_(list(task_ids)))
+        )
+        for task_id, shard in rows:
+            shards.setdefault(shard, []).append(task_id)
+        return shards
+
+    # Shards holding the user's tasks: the one they are placed on, plus the one they are being
+    # moved from during a rebalance
+    def owner_shards(self, user_id):
+        from .models import TaskLocation
+        from . import db
+        return set(db.session.scalars(select(TaskLocation.shard.distinct()).where(TaskLocation.user_id == user_id)))
+
+    # {task_id: ShardTask} for the given ids that exist, with their owners loaded
+    def get_tasks(self, task_ids):
+        task, _ = shard_tables()
+        calls = {
+            shard: lambda connection, ids=ids: connection.execute(select(task).where(task.c.id.in_(ids))).mappings().all()
+            for shard, ids in self.locate(task_ids).items()
+        }
+        tasks = [ShardTask(**row) for rows in self.gather(calls).values() for row in rows]
+        self._load_owners(tasks)
+        return {item.id: item for item in tasks}
+
+    def _load_owners(self, tasks):
+        from .models import User
+        owner_ids = {item.user_id for item in tasks}
+        owners = {user.id: user for user in User.query.filter(User.id.in_(owner_ids))} if owner_ids else {}
+        for item in tasks:
+            item.owner = owners.get(item.user_id)
+
+    # Allocates the id in the directory, then writes the task to its owner's shard
+    def create_task(self, user_id, **values):
+        return self.create_tasks([dict(values, user_id=user_id)])[0]
+
+    # Like create_task for many tasks (rows of column values with user_id): one INSERT into the
+    # directory, then one per shard. Returns the ids in the order of `rows`.
+    def create_tasks(self, rows):
+        from .models import TaskLocation
+        from . import db
+        locations = [{'user_id': row['user_id'], 'shard': self.shard_for(row['user_id'])} for row in rows]
+        task_ids = db.session.scalars(
+            insert(TaskLocation).returning(TaskLocation.id, sort_by_parameter_order=True), locations
+        ).all()
+        db.session.commit()
+        by_shard = {}
+        for task_id, location, row in zip(task_ids, locations, rows):
+            by_shard.setdefault(location['shard'], []).append(dict(row, id=task_id))
+        task, _ = shard_tables()
+        try:
+            self.gather({
+                shard: lambda connection, rows=rows: connection.execute(insert(task), rows)
+                for shard, rows in by_shard.items()
+            })
+        except Exception:
+            self.delete_tasks(task_ids) # Also from the shards that did take their rows
+            raise
+        return task_ids
+
+    # Locks the tasks' rows on this shard until the transaction ends (on SQLite, the whole shard:
+    # a no-op UPDATE takes its write lock). Writers and rebalance moves take it first.
+    def _lock(self, connection, task_ids):
+        task, _ = shard_tables()
+        if connection.dialect.name == 'sqlite':
+            connection.execute(update(task).where(task.c.id.in_(task_ids)).values(id=task.c.id))
+        else:
+            connection.execute(select(task.c.id).where(task.c.id.in_(task_ids)).with_for_update())
+
+    # Runs write(connection, ids) on the shards of the given tasks and returns the results. Each
+    # shard locks the rows, then reads the directory again: a rebalance holds the same locks
+    # until the old copies of the tasks it moves are gone, so tasks that moved meanwhile are
+    # written on their new shard instead, and no write lands on a copy about to be deleted.
+    def _write(self, task_ids, write):
+        from .models import TaskLocation
+        from . import db
+        directory = db.engine
+        def run(connection, shard, ids):
+            self._lock(connection, ids)
+            with directory.connect() as reader:
+                moved = set(reader.execute(
+                    select(TaskLocation.id).where(TaskLocation.id.in_(ids), TaskLocation.shard != shard)
+                ).scalars())
+            ids = [task_id for task_id in ids if task_id not in moved]
+            return (write(connection, ids) if ids else None), moved
+        results = []
+        pending = list(task_ids)
+        while pending:
+            outcomes = self.gather({
+                shard: lambda connection, shard=shard, ids=ids: run(connection, shard, ids)
+                for shard, ids in self.locate(pending).items()
+            })
+            results += [result for result, _ in outcomes.values()]
+            pending = [task_id for _, moved in outcomes.values() for task_id in moved]
+        return results
+
+    def update_tasks(self, task_ids, **values):
+        task, _ = shard_tables()
+        self._write(task_ids, lambda connection, ids: connection.execute(update(task).where(task.c.id.in_(ids)).values(**values)))
+
+    # Deletes the tasks and their permissions from their shards, then from the directory
+    def delete_tasks(self, task_ids):
+        from .models import TaskLocation
+        from . import db
+        task, permission = shard_tables()
+        def remove(connection, ids):
+            connection.execute(delete(permission).where(permission.c.task_id.in_(ids)))
+            connection.execute(delete(task).where(task.c.id.in_(ids)))
+        self._write(task_ids, remove)
+        db.session.execute(delete(TaskLocation).where(TaskLocation.id.in_(list(task_ids))))
+        db.session.commit()
+
+    # Shares the task with the user (can_view and can_view_status); returns True when the
+    # permission is new, False when an existing one was updated
+    def share(self, task_id, user_id):
+        _, permission = shard_tables()
+        def upsert(connection, ids):
+            existing = connection.execute(
+                update(permission).where(permission.c.task_id == task_id, permission.c.user_id == user_id)
+                .values(can_view=True, can_view_status=True)
+            ).rowcount
+            if not existing:
+                connection.execute(insert(permission).values(task_id=task_id, user_id=user_id, can_view=True, can_view_status=True))
+            return not existing
+        return any(self._write([task_id], upsert))
+
+    # Creates or completes the permissions in `rows` ({'user_id', 'task_id', 'can_view',
+    # 'can_view_status'}) on the shards of their tasks; `existing_pairs` are the (user_id, task_id)
+    # pairs that already have a permission (see sharing.upsert_permissions)
+    def share_many(self, rows, existing_pairs=frozenset()):
+        from .sharing import upsert_permissions
+        _, permission = shard_tables()
+        def upsert(connection, ids):
+            ids = set(ids)
+            upsert_permissions(connection, connection.dialect.name, permission, [row for row in rows if row['task_id'] in ids], existing_pairs)
+        self._write({row['task_id'] for row in rows}, upsert)
+
+    # Same shape as AccessControl._load: {task_id: (owner_id, (can_view, can_view_status) or None)}
+    def access(self, user_id, task_ids):
+        task, permission = shard_tables()
+        def load(connection, ids):
+            return connection.execute(
+                select(task.c.id, task.c.user_id, permission.c.can_view, permission.c.can_view_status)
+                .outerjoin(permission, and_(permission.c.task_id == task.c.id, permission.c.user_id == user_id))
+                .where(task.c.id.in_(ids))
+            ).all()
+        results = self.gather({shard: lambda connection, ids=ids: load(connection, ids) for shard, ids in self.locate(task_ids).items()})
+        return {
+            task_id: (owner_id, (can_view, can_view_status) if can_view is not None else None)
+            for rows in results.values() for task_id, owner_id, can_view, can_view_status in rows
+        }
+
+    # Same shape as AccessControl._load_entries: every share of each task
+    def access_entries(self, task_ids):
+        task, permission = shard_tables()
+        def load(connection, ids):
+            return connection.execute(
+                select(task.c.id, task.c.user_id, permission.c.user_id, permission.c.can_view, permission.c.can_view_status)
+                .outerjoin(permission, permission.c.task_id == task.c.id)
+                .where(task.c.id.in_(ids))
+            ).all()
+        results = self.gather({shard: lambda connection, ids=ids: load(connection, ids) for shard, ids in self.locate(task_ids).items()})
+        entries = {}
+        for rows in results.values():
+            for task_id, owner_id, user_id, can_view, can_view_status in rows:
+                entry = entries.setdefault(task_id, {'owner': owner_id, 'shares': {}})
+                if user_id is not None:
+                    entry['shares'][str(user_id)] = [bool(can_view), bool(can_view_status)]
+        return entries
+
+    # Owners of the given tasks plus every user they are shared with (see utils.task_audience)
+    def audience(self, task_ids):
+        return set(self.recipients(task_ids))
+
+    # {user_id: [task ids]} for the given tasks (see utils.task_recipients)
+    def recipients(self, task_ids):
+        task, permission = shard_tables()
+        def load(connection, ids):
+            return connection.execute(union(
+                select(task.c.user_id, task.c.id).where(task.c.id.in_(ids)),
+                select(permission.c.user_id, permission.c.task_id).where(permission.c.task_id.in_(ids)),
+            )).all()
+        results = self.gather({shard: lambda connection, ids=ids: load(connection, ids) for shard, ids in self.locate(task_ids).items()})
+        recipients = {}
+        for rows in results.values():
+            for user_id, task_id in rows:
+                recipients.setdefault(user_id, []).append(task_id)
+        return recipients
+
+    # One keyset page of the tasks the user owns or can view (every task for admins), newest
+    # first. Every shard returns its own page from the cursor; the first per_page + 1 of the
+    # merged rows make the page.
+    def visible_page(self, user, per_page, after=None, before=None):
+        from .pagination import decode_cursor, page_from_rows
+        task, permission = shard_tables()
+        after_key = decode_cursor(after)
+        before_key = decode_cursor(before) if not after_key else None
+        key = tuple_(task.c.timestamp, task.c.id)
+
+        base = select(task)
+        if before_key:
+            base = base.where(key > before_key).order_by(task.c.timestamp.asc(), task.c.id.asc())
+        else:
+            if after_key:
+                base = base.where(key < after_key)
+            base = base.order_by(task.c.timestamp.desc(), task.c.id.desc())
+        base = base.limit(per_page + 1)
+
+        from . import access_control
+        condition = access_control.view_condition(user, task.c, permission.c)
+        if condition is not None:
+            base = base.where(condition)
+        queries = {shard: base for shard in range(self.count)}
+        results = self.gather({shard: lambda connection, query=query: connection.execute(query).mappings().all() for shard, query in queries.items()})
+
+        # A task caught mid-rebalance can be on two shards at once; keep one copy
+        rows = {row['id']: row for shard_rows in results.values() for row in shard_rows}
+        ordered = sorted(rows.values(), key=lambda row: (row['timestamp'], row['id']), reverse=not before_key)
+        tasks = [ShardTask(**row) for row in ordered[:per_page + 1]]
+        self._load_owners(tasks)
+        return page_from_rows(tasks, per_page, after=after if after_key else None, backwards=bool(before_key))
+
+    # One page of search_tasks: every shard returns its best page * per_page + 1 matches, merged
+    # by rank (each shard ranks against its own full-text index)
+    def search(self, user, terms, page, per_page):
+        from .search import search_clauses
+        from . import access_control
+        task, permission = shard_tables()
+        clauses = search_clauses(task, self.engine(0).dialect.name, terms)
+        if clauses is None:
+            return [], False
+        join, match, rank, descending = clauses
+        query = select(task, rank.label('search_rank'))
+        if join is not None:
+            query = query.select_from(task.join(*join))
+        query = query.where(match)
+        condition = access_control.view_condition(user, task.c, permission.c)
+        if condition is not None:
+            query = query.where(condition)
+        query = query.order_by(rank.desc() if descending else rank, task.c.id.desc()).limit(page * per_page + 1)
+        results = self.gather({shard: lambda connection: connection.execute(query).mappings().all() for shard in range(self.count)})
+
+        rows = {row['id']: row for shard_rows in results.values() for row in shard_rows} # See visible_page
+        if descending:
+            ordered = sorted(rows.values(), key=lambda row: (row['search_rank'], row['id']), reverse=True)
+        else:
+            ordered = sorted(rows.values(), key=lambda row: (row['search_rank'], -row['id']))
+        ordered = ordered[(page - 1) * per_page:page * per_page + 1]
+        tasks = [ShardTask(**{column: row[column] for column in task.c.keys()}) for row in ordered[:per_page]]
+        self._load_owners(tasks)
+        return tasks, len(ordered) > per_page
+
+    # Deletes the user's tasks from their shards, batch_size per transaction, and the user's
+    # shares of other tasks. Returns the number of tasks deleted.
+    def delete_user_tasks(self, user_id, batch_size):
+        task, permission = shard_tables()
+        deleted = 0
+        for shard in self.owner_shards(user_id):
+            while True:
+                task_ids = self.gather({shard: lambda connection: connection.execute(
+                    select(task.c.id).where(task.c.user_id == user_id).order_by(task.c.id).limit(batch_size)
+                ).scalars().all()})[shard]
+                if not task_ids:
+                    break
+                recipients = self.recipients(task_ids)
+                self.delete_tasks(task_ids)
+                notify_recipients(recipients)
+                deleted += len(task_ids)
+        shared = select(permission.c.task_id).where(permission.c.user_id == user_id)
+        shared_ids = {
+            task_id for ids in self.gather({shard: lambda connection: connection.execute(shared).scalars().all() for shard in range(self.count)}).values()
+            for task_id in ids
+        }
+        if shared_ids:
+            self._write(shared_ids, lambda connection, ids: connection.execute(
+                delete(permission).where(permission.c.user_id == user_id, permission.c.task_id.in_(ids))
+            ))
+            notify_tasks_changed({user_id}, shared_ids)
+        return deleted
+
+    # Moves every task that is not on its owner's shard (after shards were added to TASK_SHARDS)
+    # there, batch_size tasks at a time: copy to the new shard, point the directory at it, delete
+    # the old copy. Readers find each task on one shard or the other throughout; writes to the
+    # tasks of a batch wait while it moves, then go to the new shard (see _write). Returns the
+    # number of tasks moved.
+    def rebalance(self, batch_size=None):
+        from .models import TaskLocation
+        from . import db
+        batch_size = batch_size or current_app.config.get('TASK_SHARD_REBALANCE_BATCH', DEFAULT_REBALANCE_BATCH)
+        moved = 0
+        while True:
+            rows = db.session.execute(
+                select(TaskLocation.id, TaskLocation.user_id, TaskLocation.shard)
+                .where(TaskLocation.shard != TaskLocation.user_id % self.count)
+                .order_by(TaskLocation.id).limit(batch_size)
+            ).all()
+            if not rows:
+                return moved
+            moves = {}
+            for task_id, user_id, shard in rows:
+                moves.setdefault((shard, self.shard_for(user_id)), []).append(task_id)
+            for (source, target), task_ids in moves.items():
+                moved += self._move(source, target, task_ids)
+
+    def _move(self, source, target, task_ids):
+        from .models import TaskLocation
+        from . import db
+        task, permission = shard_tables()
+        def read(connection):
+            tasks = [dict(row) for row in connection.execute(select(task).where(task.c.id.in_(task_ids))).mappings()]
+            shares = [
+                {key: value for key, value in row.items() if key != 'id'} # Permission ids are per shard
+                for row in connection.execute(select(permission).where(permission.c.task_id.in_(task_ids))).mappings()
+            ]
+            return tasks, shares
+        def write(connection, tasks, shares):
+            # Clears what an interrupted earlier run may have copied already
+            connection.execute(delete(permission).where(permission.c.task_id.in_(task_ids)))
+            connection.execute(delete(task).where(task.c.id.in_(task_ids)))
+            if tasks:
+                connection.execute(insert(task), tasks)
+            if shares:
+                connection.execute(insert(permission), shares)
+        def remove(connection):
+            connection.execute(delete(permission).where(permission.c.task_id.in_(task_ids)))
+            connection.execute(delete(task).where(task.c.id.in_(task_ids)))
+
+        # The rows stay locked on the source until their copies there are gone
+        with self.engine(source).begin() as held:
+            self._lock(held, task_ids)
+            tasks, shares = read(held)
+            self.gather({target: lambda connection: write(connection, tasks, shares)})
+            found = [row['id'] for row in tasks]
+            db.session.execute(update(TaskLocation).where(TaskLocation.id.in_(found)).values(shard=target))
+            # Directory entries without a task (its write failed half way) are dropped
+            db.session.execute(delete(TaskLocation).where(TaskLocation.id.in_(set(task_ids) - set(found))))
+            db.session.commit()
+            remove(held)
+        return len(found)
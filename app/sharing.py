@@ -0,0 +1,115 @@
+from sqlalchemy import select, insert, update, and_, bindparam
+from .models import User, Task, Permission
+from .signals import notify_tasks_changed
+from . import db, task_shards
+
+# Outcome of a bulk share, also used to build the flash message / CLI output
+class ShareResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.unknown_users = []
+        self.denied_tasks = []
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'unknown_users': self.unknown_users,
+            'denied_tasks': self.denied_tasks,
+        }
+
+# One INSERT ... ON CONFLICT DO UPDATE executed over all rows on SQLite/PostgreSQL; a bulk INSERT
+# plus UPDATE elsewhere (the caller already knows which pairs exist). `executor` is the session,
+# or a shard's connection with its permission table.
+def upsert_permissions(executor, dialect, table, rows, existing_pairs):
+    if dialect in ('sqlite', 'postgresql'):
+        # Imported here: loading the PostgreSQL dialect costs startup time on SQLite deployments
+        from sqlalchemy.dialects import postgresql, sqlite
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = dialect_insert(table).on_conflict_do_update(
+            index_elements=['user_id', 'task_id'],
+            set_={'can_view': True, 'can_view_status': True},
+        )
+        executor.execute(statement, rows)
+        return
+    new_rows = [row for row in rows if (row['user_id'], row['task_id']) not in existing_pairs]
+    old_rows = [row for row in rows if (row['user_id'], row['task_id']) in existing_pairs]
+    if new_rows:
+        executor.execute(insert(table), new_rows)
+    if old_rows:
+        executor.execute(
+            update(table).where(
+                table.c.user_id == bindparam('b_user_id'), table.c.task_id == bindparam('b_task_id')
+            ).values(can_view=True, can_view_status=True),
+            [{'b_user_id': row['user_id'], 'b_task_id': row['task_id']} for row in old_rows],
+        )
+
+# Shares every task in `task_ids` with every user in `usernames` (can_view and can_view_status).
+# `actor` may only share tasks they own unless they are an admin; pass None for system use (CLI).
+# Uses one query for the tasks, one for the users, one for the existing permissions and a bulk
+# upsert, all in a single transaction. With TASK_SHARDS the tasks and their shares are read in
+# one pass over their shards and each shard is written in its own transaction.
+def bulk_share(task_ids, usernames, actor=None):
+    result = ShareResult()
+    task_ids = set(task_ids)
+    usernames = {username.strip() for username in usernames if username and username.strip()}
+    if not task_ids or not usernames:
+        return result
+
+    if task_shards.enabled:
+        entries = task_shards.access_entries(task_ids)
+        task_owners = {task_id: entry['owner'] for task_id, entry in entries.items()}
+    else:
+        task_owners = dict(db.session.execute(select(Task.id, Task.user_id).where(Task.id.in_(task_ids))).all())
+    if actor is not None and not actor.is_administrator():
+        task_owners = {task_id: owner_id for task_id, owner_id in task_owners.items() if owner_id == actor.id}
+    result.denied_tasks = sorted(task_ids - set(task_owners))
+
+    users = dict(db.session.execute(select(User.username, User.id).where(User.username.in_(usernames))).all())
+    result.unknown_users = sorted(usernames - set(users))
+    if not task_owners or not users:
+        return result
+
+    if task_shards.enabled:
+        user_ids = set(users.values())
+        existing = {
+            (int(user_id), task_id): can_view and can_view_status
+            for task_id in task_owners
+            for user_id, (can_view, can_view_status) in entries[task_id]['shares'].items()
+            if int(user_id) in user_ids
+        }
+    else:
+        existing = {
+            (user_id, task_id): can_view and can_view_status
+            for user_id, task_id, can_view, can_view_status in db.session.execute(
+                select(Permission.user_id, Permission.task_id, Permission.can_view, Permission.can_view_status).where(
+                    and_(Permission.task_id.in_(list(task_owners)), Permission.user_id.in_(list(users.values())))
+                )
+            )
+        }
+
+    rows = []
+    for task_id, owner_id in task_owners.items():
+        for user_id in users.values():
+            pair = (user_id, task_id)
+            if user_id == owner_id or existing.get(pair):
+                result.skipped += 1 # Owners need no permission; complete permissions stay as they are
+                continue
+            if pair in existing:
+                result.updated += 1
+            else:
+                result.created += 1
+            rows.append({'user_id': user_id, 'task_id': task_id, 'can_view': True, 'can_view_status': True})
+
+    if rows:
+        if task_shards.enabled:
+            task_shards.share_many(rows, set(existing))
+        else:
+            upsert_permissions(db.session, db.session.get_bind().dialect.name, Permission.__table__, rows, set(existing))
+            db.session.commit()
+        # Only the owners and the users gaining access see a different list
+        notify_tasks_changed(set(task_owners.values()) | {row['user_id'] for row in rows}, task_owners)
+    return result
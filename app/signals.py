@@ -0,0 +1,22 @@
+from blinker import Namespace
+from flask import current_app
+
+_signals = Namespace()
+
+# Sent after a write to tasks or permissions has been committed.
+# `user_ids` is everyone whose task list may look different now: the owners of the
+# affected tasks and every user the tasks are shared with.
+tasks_changed = _signals.signal('tasks-changed')
+
+# Sent after a password was hashed or verified, with the wall time it took (including
+# waiting for the hashing pool). Only sent when something is listening.
+password_hashed = _signals.signal('password-hashed')
+
+def notify_tasks_changed(user_ids, task_ids=()):
+    tasks_changed.send(current_app._get_current_object(), user_ids=set(user_ids), task_ids=set(task_ids))
+
+# One signal per user from {user_id: [task ids]} (see utils.task_recipients). Used after deletes:
+# for tasks that are gone the change feed writes an event for every user and task of a signal.
+def notify_recipients(recipients):
+    for user_id, task_ids in recipients.items():
+        notify_tasks_changed({user_id}, task_ids)
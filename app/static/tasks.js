@@ -0,0 +1,117 @@
+// Live updates for the task list: status changes are sent as JSON, and changes made by
+// collaborators arrive through the change feed. With LIVE_UPDATES=poll (the default) the feed is
+// checked every few seconds, less often while nothing changes or the page is hidden, and no
+// request is held open; with 'stream' a Server-Sent Events stream (long polling as a fallback)
+// keeps a server thread per open page; 'off' leaves the list as it was loaded.
+(function () {
+    var STATUSES = {
+        NOT_STARTED: ['Not Started', 'text-danger'],
+        IN_PROGRESS: ['In Progress', 'text-warning'],
+        COMPLETED: ['Completed', 'text-success']
+    };
+
+    window.updateTaskStatus = function (select) {
+        fetch(select.dataset.statusUrl, {
+            method: 'PATCH',
+            headers: {'Content-Type': 'application/json'},
+            credentials: 'same-origin',
+            body: JSON.stringify({status: select.value})
+        }).then(function (response) {
+            if (response.status !== 204) {
+                select.form.submit();
+            }
+        }, function () {
+            select.form.submit();
+        });
+    };
+
+    var list = document.getElementById('task-list');
+    if (!list) {
+        return;
+    }
+    var cursor = list.dataset.feedCursor;
+
+    function apply(event) {
+        cursor = event.cursor;
+        var item = list.querySelector('[data-task-id="' + event.task_id + '"]');
+        if (!item) {
+            if (event.type === 'updated') {
+                document.getElementById('feed-notice').classList.remove('d-none');
+            }
+            return;
+        }
+        if (event.type === 'removed') {
+            item.remove();
+            return;
+        }
+        var task = event.task;
+        item.querySelector('.task-title').textContent = task.title;
+        item.querySelector('.task-description').textContent = task.description || '';
+        var select = item.querySelector('select[name="status"]');
+        var status = item.querySelector('.task-status');
+        if (select && task.status) {
+            select.value = task.status;
+        } else if (status && STATUSES[task.status]) {
+            status.textContent = 'Status: ' + STATUSES[task.status][0];
+            status.className = 'task-status fst-italic ' + STATUSES[task.status][1];
+        }
+    }
+
+    var mode = list.dataset.liveUpdates;
+    var minDelay = parseFloat(list.dataset.pollInterval) * 1000;
+    var maxDelay = minDelay * 12;
+    var delay = minDelay;
+
+    function fetchEvents(query) {
+        return fetch(list.dataset.pollUrl + '?since=' + cursor + query, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            })
+            .then(function (body) {
+                body.events.forEach(apply);
+                cursor = body.cursor;
+                return body.events.length;
+            });
+    }
+
+    // Back to the shortest delay after a change, twice as long after a quiet check or an error
+    function backOff(changed) {
+        delay = changed ? minDelay : Math.min(delay * 2, maxDelay);
+    }
+
+    function check() {
+        if (document.hidden) {
+            setTimeout(check, maxDelay);
+            return;
+        }
+        fetchEvents('').then(backOff, function () {
+            backOff(0);
+        }).then(function () {
+            setTimeout(check, delay);
+        });
+    }
+
+    function longPoll() {
+        fetchEvents('&wait=25').then(function () {
+            delay = minDelay;
+            longPoll();
+        }, function () {
+            backOff(0);
+            setTimeout(longPoll, delay);
+        });
+    }
+
+    if (mode === 'stream' && window.EventSource) {
+        var source = new EventSource(list.dataset.streamUrl + '?since=' + cursor);
+        source.onmessage = function (message) {
+            apply(JSON.parse(message.data));
+        };
+    } else if (mode === 'stream') {
+        longPoll();
+    } else if (mode === 'poll') {
+        setTimeout(check, delay);
+    }
+})();
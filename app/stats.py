@@ -0,0 +1,243 @@
+from datetime import date, timedelta
+from sqlalchemy import Date, cast, delete, event, func, insert, select, text
+from .models import User, Task, TaskStatus, TaskStatusCount, TaskDailyCount, TaskShareCount
+from .sharding import shard_tables
+from . import db, task_shards
+
+DEFAULT_DAYS = 30
+DEFAULT_TOP_SHARED = 20
+
+# Triggers keep the counters in step with every insert, update and delete on task and permission,
+# whichever code path (ORM, bulk statements, imports, background jobs) runs it, in the writing
+# transaction itself. Only shares with can_view count. The migrations carry a copy of this DDL.
+SQLITE_STATS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS task_stats_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_status_count(user_id, status, count) VALUES (new.user_id, new.status, 1) "
+    "ON CONFLICT(user_id, status) DO UPDATE SET count = count + 1; "
+    "INSERT INTO task_daily_count(day, count) SELECT date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL "
+    "ON CONFLICT(day) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS task_stats_ad AFTER DELETE ON task BEGIN "
+    "UPDATE task_status_count SET count = count - 1 WHERE user_id = old.user_id AND status = old.status; "
+    "UPDATE task_daily_count SET count = count - 1 WHERE day = date(old.timestamp); "
+    "DELETE FROM task_share_count WHERE task_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS task_stats_au AFTER UPDATE OF user_id, status, timestamp ON task "
+    "WHEN old.user_id IS NOT new.user_id OR old.status IS NOT new.status OR old.timestamp IS NOT new.timestamp BEGIN "
+    "UPDATE task_status_count SET count = count - 1 WHERE user_id = old.user_id AND status = old.status; "
+    "UPDATE task_daily_count SET count = count - 1 WHERE day = date(old.timestamp); "
+    "INSERT INTO task_status_count(user_id, status, count) VALUES (new.user_id, new.status, 1) "
+    "ON CONFLICT(user_id, status) DO UPDATE SET count = count + 1; "
+    "INSERT INTO task_daily_count(day, count) SELECT date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL "
+    "ON CONFLICT(day) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS permission_stats_ai AFTER INSERT ON permission WHEN new.can_view BEGIN "
+    "INSERT INTO task_share_count(task_id, count) VALUES (new.task_id, 1) "
+    "ON CONFLICT(task_id) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS permission_stats_ad AFTER DELETE ON permission WHEN old.can_view BEGIN "
+    "UPDATE task_share_count SET count = count - 1 WHERE task_id = old.task_id; END",
+    "CREATE TRIGGER IF NOT EXISTS permission_stats_au AFTER UPDATE OF task_id, can_view ON permission "
+    "WHEN old.task_id IS NOT new.task_id OR old.can_view IS NOT new.can_view BEGIN "
+    "UPDATE task_share_count SET count = count - 1 WHERE task_id = old.task_id AND old.can_view; "
+    "INSERT INTO task_share_count(task_id, count) SELECT new.task_id, 1 WHERE new.can_view "
+    "ON CONFLICT(task_id) DO UPDATE SET count = count + 1; END",
+]
+SQLITE_STATS_DROP = [
+    "DROP TRIGGER IF EXISTS task_stats_ai",
+    "DROP TRIGGER IF EXISTS task_stats_ad",
+    "DROP TRIGGER IF EXISTS task_stats_au",
+    "DROP TRIGGER IF EXISTS permission_stats_ai",
+    "DROP TRIGGER IF EXISTS permission_stats_ad",
+    "DROP TRIGGER IF EXISTS permission_stats_au",
+]
+
+POSTGRES_STATS_DDL = [
+    """CREATE OR REPLACE FUNCTION task_stats() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE task_status_count SET count = count - 1 WHERE user_id = OLD.user_id AND status = OLD.status::text;
+        UPDATE task_daily_count SET count = count - 1 WHERE day = OLD."timestamp"::date;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM task_share_count WHERE task_id = OLD.id;
+        RETURN NULL;
+    END IF;
+    INSERT INTO task_status_count AS c (user_id, status, count) VALUES (NEW.user_id, NEW.status::text, 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET count = c.count + 1;
+    IF NEW."timestamp" IS NOT NULL THEN
+        INSERT INTO task_daily_count AS c (day, count) VALUES (NEW."timestamp"::date, 1)
+            ON CONFLICT (day) DO UPDATE SET count = c.count + 1;
+    END IF;
+    RETURN NULL;
+END $$""",
+    """CREATE OR REPLACE FUNCTION permission_stats() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.can_view THEN
+        UPDATE task_share_count SET count = count - 1 WHERE task_id = OLD.task_id;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.can_view THEN
+        INSERT INTO task_share_count AS c (task_id, count) VALUES (NEW.task_id, 1)
+            ON CONFLICT (task_id) DO UPDATE SET count = c.count + 1;
+    END IF;
+    RETURN NULL;
+END $$""",
+    "DROP TRIGGER IF EXISTS task_stats ON task",
+    "CREATE TRIGGER task_stats AFTER INSERT OR DELETE OR UPDATE OF user_id, status, timestamp ON task "
+    "FOR EACH ROW EXECUTE FUNCTION task_stats()",
+    "DROP TRIGGER IF EXISTS permission_stats ON permission",
+    "CREATE TRIGGER permission_stats AFTER INSERT OR DELETE OR UPDATE OF task_id, can_view ON permission "
+    "FOR EACH ROW EXECUTE FUNCTION permission_stats()",
+]
+POSTGRES_STATS_DROP = [
+    "DROP FUNCTION IF EXISTS task_stats() CASCADE",
+    "DROP FUNCTION IF EXISTS permission_stats() CASCADE",
+]
+
+def stats_ddl(dialect):
+    return {'sqlite': SQLITE_STATS_DDL, 'postgresql': POSTGRES_STATS_DDL}.get(dialect, [])
+
+def stats_drop(dialect):
+    return {'sqlite': SQLITE_STATS_DROP, 'postgresql': POSTGRES_STATS_DROP}.get(dialect, [])
+
+# Keep db.create_all()/drop_all() (and so the tests) in step with the migrations. Hooked on the
+# whole metadata: the triggers need task, permission and the counter tables to exist.
+@event.listens_for(db.Model.metadata, 'after_create')
+def create_stats_triggers(target, connection, **kw):
+    for statement in stats_ddl(connection.dialect.name):
+        connection.exec_driver_sql(statement)
+
+@event.listens_for(db.Model.metadata, 'before_drop')
+def drop_stats_triggers(target, connection, **kw):
+    for statement in stats_drop(connection.dialect.name):
+        connection.exec_driver_sql(statement)
+
+def _creation_day(timestamp, dialect):
+    if dialect == 'sqlite':
+        return func.date(timestamp) # SQLite would CAST a datetime string to a number
+    return cast(timestamp, Date)
+
+COUNTER_TABLES = ('task_status_count', 'task_daily_count', 'task_share_count')
+
+# Recomputes the counters in `tables` (the global metadata's or a shard's) from its task and
+# permission tables, inside the caller's transaction. Returns the rows written per table.
+def rebuild_counters(executor, tables, dialect):
+    task, permission = tables['task'], tables['permission']
+    status_count, daily_count, share_count = (tables[name] for name in COUNTER_TABLES)
+    if dialect == 'postgresql':
+        executor.execute(text('LOCK TABLE task, permission IN SHARE MODE')) # Holds writers off until the commit
+    for table in (status_count, daily_count, share_count):
+        executor.execute(delete(table))
+    day = _creation_day(task.c.timestamp, dialect)
+    statements = {
+        'task_status_count': insert(status_count).from_select(
+            ['user_id', 'status', 'count'],
+            select(task.c.user_id, task.c.status, func.count()).group_by(task.c.user_id, task.c.status),
+        ),
+        'task_daily_count': insert(daily_count).from_select(
+            ['day', 'count'],
+            select(day, func.count()).where(task.c.timestamp.is_not(None)).group_by(day),
+        ),
+        'task_share_count': insert(share_count).from_select(
+            ['task_id', 'count'],
+            select(permission.c.task_id, func.count()).where(permission.c.can_view == True).group_by(permission.c.task_id),
+        ),
+    }
+    return {name: executor.execute(statement).rowcount for name, statement in statements.items()}
+
+# Recomputes every counter from the task and permission tables in one transaction (one per
+# shard with TASK_SHARDS), e.g. after bulk changes made with the triggers disabled or on a
+# database without trigger support. Returns the number of counter rows written per table.
+def rebuild_stats():
+    if task_shards.enabled:
+        tables = shard_tables()[0].metadata.tables
+        results = task_shards.gather({
+            shard: lambda connection: rebuild_counters(connection, tables, connection.dialect.name)
+            for shard in range(task_shards.count)
+        })
+        return {name: sum(written[name] for written in results.values()) for name in COUNTER_TABLES}
+    written = rebuild_counters(db.session, db.metadata.tables, db.session.get_bind().dialect.name)
+    db.session.commit()
+    return written
+
+# The rows dashboard_stats reads, from every shard's counters: summed per user and status and
+# per day, and the most shared tasks of all shards. Usernames come from the global database.
+def _shard_counters(since, top_shared):
+    tables = shard_tables()[0].metadata.tables
+    task, status_count, daily_count, share_count = (tables[name] for name in ('task',) + COUNTER_TABLES)
+    def read(connection):
+        return (
+            connection.execute(select(status_count.c.user_id, status_count.c.status, status_count.c.count)).all(),
+            connection.execute(select(daily_count.c.day, daily_count.c.count).where(daily_count.c.day >= since)).all(),
+            connection.execute(
+                select(task.c.id, task.c.title, task.c.user_id, share_count.c.count)
+                .select_from(share_count)
+                .join(task, task.c.id == share_count.c.task_id)
+                .where(share_count.c.count > 0)
+                .order_by(share_count.c.count.desc(), share_count.c.task_id.desc())
+                .limit(top_shared)
+            ).all(),
+        )
+    counts, daily, shared = {}, {}, {}
+    for status_rows, daily_rows, shared_rows in task_shards.gather({shard: read for shard in range(task_shards.count)}).values():
+        for user_id, status, count in status_rows:
+            counts.setdefault(user_id, {})
+            counts[user_id][status] = counts[user_id].get(status, 0) + count
+        for day, count in daily_rows:
+            daily[day] = daily.get(day, 0) + count
+        for row in shared_rows:
+            shared[row.id] = row # A task caught mid-rebalance is counted on both shards; keep one
+
+    users = db.session.execute(select(User.id, User.username).order_by(User.username)).all()
+    rows = [
+        (user_id, username, status, count)
+        for user_id, username in users for status, count in (counts.get(user_id) or {None: None}).items()
+    ]
+    daily = sorted(((day, count) for day, count in daily.items() if count > 0), reverse=True)
+    usernames = dict(users)
+    most_shared = [
+        (row.id, row.title, usernames.get(row.user_id), row.count)
+        for row in sorted(shared.values(), key=lambda row: (row.count, row.id), reverse=True)[:top_shared]
+    ]
+    return rows, daily, most_shared
+
+# Everything the admin dashboard shows, read from the counter tables (of every shard with
+# TASK_SHARDS): one row per user and status, one per day and `top_shared` share counts.
+# Nothing here scans the task table.
+def dashboard_stats(days=DEFAULT_DAYS, top_shared=DEFAULT_TOP_SHARED):
+    statuses = [status.name for status in TaskStatus]
+    since = date.today() - timedelta(days=days - 1)
+    if task_shards.enabled:
+        rows, daily, most_shared = _shard_counters(since, top_shared)
+    else:
+        rows = db.session.execute(
+            select(User.id, User.username, TaskStatusCount.status, TaskStatusCount.count)
+            .outerjoin(TaskStatusCount, TaskStatusCount.user_id == User.id)
+            .order_by(User.username)
+        )
+        daily = db.session.execute(
+            select(TaskDailyCount.day, TaskDailyCount.count)
+            .where(TaskDailyCount.day >= since, TaskDailyCount.count > 0)
+            .order_by(TaskDailyCount.day.desc())
+        ).all()
+        most_shared = db.session.execute(
+            select(Task.id, Task.title, User.username, TaskShareCount.count)
+            .join(Task, Task.id == TaskShareCount.task_id)
+            .join(User, User.id == Task.user_id)
+            .where(TaskShareCount.count > 0)
+            .order_by(TaskShareCount.count.desc(), TaskShareCount.task_id.desc())
+            .limit(top_shared)
+        ).all()
+
+    users = {}
+    for user_id, username, status, count in rows:
+        entry = users.setdefault(user_id, {'username': username, 'counts': dict.fromkeys(statuses, 0), 'total': 0})
+        if status in entry['counts']:
+            entry['counts'][status] += count
+            entry['total'] += count
+    totals = {status: sum(entry['counts'][status] for entry in users.values()) for status in statuses}
+
+    return {
+        'statuses': statuses,
+        'users': list(users.values()),
+        'totals': totals,
+        'total': sum(totals.values()),
+        'daily': daily,
+        'most_shared': most_shared,
+    }
@@ -0,0 +1,96 @@
+from sqlalchemy import delete, insert, update
+from .models import Task, Permission
+from .pagination import keyset_page, visible_tasks_query
+from .utils import task_recipients
+from . import db, task_shards
+
+# Task reads and writes behind the task pages, the task list and the status updates: on the
+# global database, or with TASK_SHARDS on the shard holding each task (see app/sharding.py).
+# Tasks from a shard are ShardTask objects, which carry the same attributes as Task.
+
+def get_task(task_id):
+    if task_shards.enabled:
+        return task_shards.get_tasks([task_id]).get(task_id)
+    return db.session.get(Task, task_id)
+
+# Returns the new task's id
+def create_task(user_id, title, description):
+    if task_shards.enabled:
+        return task_shards.create_task(user_id, title=title, description=description)
+    task = Task(title=title, description=description, user_id=user_id)
+    db.session.add(task)
+    db.session.commit()
+    return task.id
+
+# Creates tasks from rows of column values (with user_id) in one bulk INSERT; returns their ids
+# in the order of `rows`
+def create_tasks(rows):
+    if task_shards.enabled:
+        return task_shards.create_tasks(rows)
+    task_ids = db.session.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), rows).all()
+    db.session.commit()
+    return task_ids
+
+def update_tasks(task_ids, **values):
+    if task_shards.enabled:
+        task_shards.update_tasks(task_ids, **values)
+        return
+    db.session.execute(update(Task).where(Task.id.in_(list(task_ids))).values(**values))
+    db.session.commit()
+
+# Sets the status of many tasks from {task_id: status}: one UPDATE per status, one commit
+def set_statuses(statuses):
+    by_status = {}
+    for task_id, status in statuses.items():
+        by_status.setdefault(status, []).append(task_id)
+    if task_shards.enabled:
+        for status, task_ids in by_status.items():
+            task_shards.update_tasks(task_ids, status=status)
+        return
+    for status, task_ids in by_status.items():
+        db.session.execute(
+            update(Task).where(Task.id.in_(task_ids)).values(status=status),
+            execution_options={'synchronize_session': False},
+        )
+    db.session.commit()
+
+# Deletes the tasks and their permissions; returns their recipients (utils.task_recipients),
+# collected before the delete, for signals.notify_recipients
+def delete_tasks(task_ids):
+    task_ids = list(task_ids)
+    recipients = task_recipients(task_ids)
+    if task_shards.enabled:
+        task_shards.delete_tasks(task_ids)
+        return recipients
+    db.session.execute(delete(Permission).where(Permission.task_id.in_(task_ids)))
+    db.session.execute(delete(Task).where(Task.id.in_(task_ids)))
+    db.session.commit()
+    return recipients
+
+# Lets the user view the task and its status; returns True for a new share, False for an update
+def share_task(task_id, user_id):
+    if task_shards.enabled:
+        return task_shards.share(task_id, user_id)
+    permission = Permission.query.filter_by(task_id=task_id, user_id=user_id).first()
+    created = permission is None
+    if created:
+        permission = Permission(task_id=task_id, user_id=user_id)
+        db.session.add(permission)
+    permission.can_view = True
+    permission.can_view_status = True
+    db.session.commit()
+    return created
+
+# One keyset page of the tasks the user owns or can view (see pagination.keyset_page)
+def visible_tasks_page(user, per_page, after=None, before=None):
+    if task_shards.enabled:
+        return task_shards.visible_page(user, per_page, after=after, before=before)
+    return keyset_page(visible_tasks_query(user), per_page, after=after, before=before)
+
+# {task_id: task} for those of `task_ids` the user owns or can view
+def visible_tasks(user, task_ids):
+    if not task_shards.enabled:
+        return {task.id: task for task in visible_tasks_query(user).filter(Task.id.in_(list(task_ids)))}
+    from . import access_control
+    viewable = access_control.allowed(user, 'view', task_ids)
+    return {task_id: task for task_id, task in task_shards.get_tasks(viewable).items()} if viewable else {}
@@ -0,0 +1,276 @@
+import csv
+import io
+import json
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import select, insert, and_, or_, case, func, null
+from sqlalchemy.orm import aliased
+from .models import User, Task, Permission, TaskStatus
+from .signals import notify_tasks_changed
+from . import db, task_shards
+
+FORMATS = ('csv', 'ndjson')
+SCOPES = ('owned', 'shared', 'visible', 'all')
+FIELDS = ('id', 'title', 'description', 'status', 'owner', 'timestamp', 'shared_with')
+MAX_ERRORS = 20
+DEFAULT_EXPORT_BATCH = 1000
+DEFAULT_IMPORT_BATCH = 1000
+
+# Raised for unusable export/import arguments; the message is shown to the user
+class TransferError(ValueError):
+    pass
+
+def check_format(fmt):
+    if fmt not in FORMATS:
+        raise TransferError(f'Unknown format: {fmt!r} (expected one of {", ".join(FORMATS)}).')
+    return fmt
+
+# Usernames a task is shared with as one comma separated string, aggregated in the database
+def _shared_with_column():
+    dialect = db.session.get_bind().dialect.name
+    sharee = aliased(User)
+    share = aliased(Permission)
+    if dialect == 'sqlite':
+        usernames = func.group_concat(sharee.username, ',')
+    elif dialect == 'postgresql':
+        usernames = func.string_agg(sharee.username, ',')
+    else:
+        return null() # No portable string aggregate; shares are left out of the export
+    return (
+        select(usernames)
+        .select_from(share)
+        .join(sharee, sharee.id == share.user_id)
+        .where(share.task_id == Task.id, share.can_view == True)
+        .scalar_subquery()
+    )
+
+# One SELECT of plain columns (no ORM objects) for the tasks in `scope`: the user's own tasks,
+# the tasks shared with them, both, or every task (admins and the CLI only). A shared task's
+# status is left out unless the permission allows it, and only owners see whom a task is shared with.
+def export_statement(scope, user=None):
+    if task_shards.enabled:
+        # The export joins tasks to their owners' and sharees' usernames, which are not on the shards
+        raise TransferError('Export is not available with TASK_SHARDS yet.')
+    if scope not in SCOPES:
+        raise TransferError(f'Unknown scope: {scope!r} (expected one of {", ".join(SCOPES)}).')
+    admin = user is None or user.is_administrator()
+    if admin and scope == 'visible':
+        scope = 'all' # Admins can see every task
+    if user is None and scope != 'all':
+        raise TransferError(f'The {scope!r} scope needs a user.')
+    if not admin and scope == 'all':
+        raise TransferError('Only admins can export all tasks.')
+
+    shared_with = _shared_with_column()
+    status = Task.status
+    statement = select(Task.id, Task.title, Task.description, Task.timestamp, User.username.label('owner'))
+    statement = statement.join(User, User.id == Task.user_id)
+    if scope == 'owned':
+        statement = statement.where(Task.user_id == user.id)
+    elif scope != 'all':
+        # At most one permission per (user, task), so the outer join never repeats a task
+        statement = statement.outerjoin(Permission, and_(Permission.task_id == Task.id, Permission.user_id == user.id))
+        shared = Permission.can_view == True
+        statement = statement.where(shared if scope == 'shared' else or_(Task.user_id == user.id, shared))
+        if not admin:
+            status = case((or_(Task.user_id == user.id, Permission.can_view_status == True), Task.status), else_=null())
+        shared_with = case((Task.user_id == user.id, shared_with), else_=null())
+    return statement.add_columns(status.label('status'), shared_with.label('shared_with')).order_by(Task.id)
+
+def _status_name(status):
+    if status is None:
+        return None
+    return status.name if isinstance(status, TaskStatus) else status
+
+# Rows of the export in batches of EXPORT_BATCH_SIZE. yield_per keeps only one batch in memory
+# and streams from a server-side cursor where the driver supports it (PostgreSQL).
+def export_batches(scope, user=None):
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', DEFAULT_EXPORT_BATCH)
+    result = db.session.execute(export_statement(scope, user).execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield [
+            {
+                'id': row.id,
+                'title': row.title,
+                'description': row.description,
+                'status': _status_name(row.status),
+                'owner': row.owner,
+                'timestamp': row.timestamp.isoformat() if row.timestamp else None,
+                'shared_with': row.shared_with.split(',') if row.shared_with else [],
+            }
+            for row in partition
+        ]
+
+# The export as text chunks, one per batch: CSV with a header row, or one JSON object per line
+def export_chunks(fmt, scope, user=None):
+    check_format(fmt)
+    batches = export_batches(scope, user)
+    if fmt == 'ndjson':
+        for rows in batches:
+            yield ''.join(json.dumps(row) + '\n' for row in rows)
+        return
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS)
+    writer.writeheader()
+    for rows in batches:
+        for row in rows:
+            writer.writerow(dict(row, shared_with=','.join(row['shared_with'])))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue() # Header of an empty export
+
+# Outcome of an import, also used for the API response / CLI output
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.shared = 0
+        self.skipped = 0
+        self.unknown_users = set()
+        self.errors = []
+
+    def error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(f'line {line}: {message}')
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'shared': self.shared,
+            'skipped': self.skipped,
+            'unknown_users': sorted(self.unknown_users),
+            'errors': self.errors,
+        }
+
+# (line number, record dict or None, parse error) for each record of a text stream
+def read_records(stream, fmt):
+    check_format(fmt)
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        try:
+            for record in reader:
+                yield reader.line_num, record, None
+        except csv.Error as error:
+            yield reader.line_num, None, str(error)
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, 'invalid JSON'
+            continue
+        if isinstance(record, dict):
+            yield number, record, None
+        else:
+            yield number, None, 'expected a JSON object'
+
+def parse_status(value):
+    if value in (None, ''):
+        return TaskStatus.NOT_STARTED
+    if value in TaskStatus.__members__:
+        return TaskStatus[value]
+    try:
+        return TaskStatus(value) # Also accept the display value, e.g. "In Progress"
+    except ValueError:
+        raise TransferError(f'invalid status {value!r}')
+
+def parse_record(record):
+    title = str(record.get('title') or '').strip()
+    if not title:
+        raise TransferError('title is required')
+    if len(title) > 150:
+        raise TransferError('title is longer than 150 characters')
+    timestamp = record.get('timestamp')
+    try:
+        timestamp = datetime.fromisoformat(timestamp) if timestamp else datetime.utcnow()
+    except (TypeError, ValueError):
+        raise TransferError(f'invalid timestamp {timestamp!r}')
+    description = record.get('description') or None
+    if not isinstance(description, (str, type(None))):
+        raise TransferError('description must be a string')
+    shared_with = record.get('shared_with') or []
+    if isinstance(shared_with, str):
+        shared_with = shared_with.split(',')
+    return {
+        'title': title,
+        'description': description,
+        'status': parse_status(record.get('status')),
+        'timestamp': timestamp,
+        'owner': record.get('owner'),
+        'shared_with': {username.strip() for username in shared_with if username and username.strip()},
+    }
+
+# Creates the tasks (and their shares) from an export-formatted stream, reading and inserting
+# IMPORT_BATCH_SIZE records at a time: per batch, one query resolves the usernames not seen yet,
+# one multi-row INSERT ... RETURNING creates the tasks and one INSERT the permissions, committed
+# together. Tasks go to `owner`, or to the user named in each record's "owner" when it is None.
+# Exported ids are not kept; imported tasks get new ones.
+def import_tasks(stream, fmt, owner=None, batch_size=None):
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', DEFAULT_IMPORT_BATCH)
+    result = ImportResult()
+    user_ids = {} # username -> id, for every username seen so far (None when unknown)
+    batch = []
+    for line, record, error in read_records(stream, fmt):
+        if error is None:
+            try:
+                batch.append((line, parse_record(record)))
+            except TransferError as invalid:
+                error = str(invalid)
+        if error is not None:
+            result.error(line, error)
+        if len(batch) >= batch_size:
+            _import_batch(batch, owner, user_ids, result)
+            batch = []
+    if batch:
+        _import_batch(batch, owner, user_ids, result)
+    return result
+
+def _import_batch(batch, owner, user_ids, result):
+    usernames = {username for _, task in batch for username in task['shared_with']}
+    if owner is None:
+        usernames.update(task['owner'] for _, task in batch if task['owner'])
+    missing = usernames - set(user_ids)
+    if missing:
+        user_ids.update(dict.fromkeys(missing))
+        user_ids.update(db.session.execute(select(User.username, User.id).where(User.username.in_(missing))).all())
+
+    tasks, shares = [], []
+    for line, task in batch:
+        owner_id = owner.id if owner is not None else user_ids.get(task['owner'])
+        if owner_id is None:
+            result.error(line, f'unknown owner {task["owner"]!r}')
+            continue
+        sharee_ids = set()
+        for username in task['shared_with']:
+            if user_ids.get(username) is None:
+                result.unknown_users.add(username)
+            elif user_ids[username] != owner_id:
+                sharee_ids.add(user_ids[username])
+        tasks.append({key: task[key] for key in ('title', 'description', 'status', 'timestamp')} | {'user_id': owner_id})
+        shares.append(sharee_ids)
+    if not tasks:
+        return
+
+    # With TASK_SHARDS the tasks, then their shares, go to the owners' shards in a transaction per shard
+    if task_shards.enabled:
+        task_ids = task_shards.create_tasks(tasks)
+    else:
+        task_ids = db.session.scalars(insert(Task).returning(Task.id, sort_by_parameter_order=True), tasks).all()
+    permissions = [
+        {'user_id': user_id, 'task_id': task_id, 'can_view': True, 'can_view_status': True}
+        for task_id, sharee_ids in zip(task_ids, shares) for user_id in sharee_ids
+    ]
+    if task_shards.enabled:
+        if permissions:
+            task_shards.share_many(permissions)
+    else:
+        if permissions:
+            db.session.execute(insert(Permission), permissions)
+        db.session.commit()
+    result.created += len(task_ids)
+    result.shared += len(permissions)
+    notify_tasks_changed({task['user_id'] for task in tasks} | {row['user_id'] for row in permissions}, task_ids)
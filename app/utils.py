@@ -1,6 +1,8 @@
 from functools import wraps
 from flask import abort
 from flask_login import current_user
+from sqlalchemy import select, union
+from . import db
 
 def admin_required(f):
     @wraps(f)
@@ -9,3 +11,36 @@ def admin_required(f):
             abort(403)
         return f(*args, **kwargs)
     return decorated_function
+
+# Owners of the given tasks plus every user they are shared with, in one query.
+# Call it before deleting tasks, since the permission rows go with them.
+def task_audience(task_ids=None, owner_id=None):
+    from .models import Task, Permission
+    from . import task_shards
+    if task_shards.enabled and task_ids is not None and owner_id is None:
+        return task_shards.audience(task_ids)
+    tasks = select(Task.id)
+    if task_ids is not None:
+        tasks = tasks.where(Task.id.in_(list(task_ids)))
+    if owner_id is not None:
+        tasks = tasks.where(Task.user_id == owner_id)
+    owners = select(Task.user_id).where(Task.id.in_(tasks))
+    shared = select(Permission.user_id).where(Permission.task_id.in_(tasks))
+    return set(db.session.execute(union(owners, shared)).scalars())
+
+# {user_id: [task ids]}: the owner and every user each task is shared with. Like task_audience,
+# call it before deleting tasks.
+def task_recipients(task_ids):
+    from .models import Task, Permission
+    from . import task_shards
+    if task_shards.enabled:
+        return task_shards.recipients(task_ids)
+    task_ids = list(task_ids)
+    rows = db.session.execute(union(
+        select(Task.user_id, Task.id).where(Task.id.in_(task_ids)),
+        select(Permission.user_id, Permission.task_id).where(Permission.task_id.in_(task_ids)),
+    ))
+    recipients = {}
+    for user_id, task_id in rows:
+        recipients.setdefault(user_id, []).append(task_id)
+    return recipients
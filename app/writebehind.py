@@ -0,0 +1,197 @@
+import atexit
+import logging
+import os
+import threading
+from flask import current_app
+from .signals import notify_tasks_changed
+
+FLUSHED = 'flushed'
+BUFFERED = 'buffered'
+
+DEFAULT_FLUSH_INTERVAL = 0.01
+DEFAULT_FLUSH_BATCH = 500
+DEFAULT_ACK_TIMEOUT = 5.0
+
+logger = logging.getLogger('app.writebehind')
+
+# Models, db and the store are imported inside the functions: this module is loaded while the
+# app package itself is still initializing.
+
+class StatusWriteError(Exception):
+    pass
+
+# The status changes waiting for one flush: {task_id: status}, the last write to a task wins.
+# `waiters` counts the requests per task still waiting for the flush ('flushed' acks).
+class Batch:
+    def __init__(self):
+        self.statuses = {}
+        self.waiters = {}
+        self.done = threading.Event()
+        self.error = None
+
+# Optional write-behind for task status changes (STATUS_WRITE_BEHIND). Instead of a commit per
+# request, changes are buffered in memory and a flusher thread writes them with one UPDATE per
+# status and one commit, once STATUS_FLUSH_INTERVAL seconds have passed since the first change of
+# the batch or STATUS_FLUSH_BATCH tasks are waiting. With STATUS_WRITE_ACK = 'flushed' a request
+# returns once its change is committed (group commit: concurrent requests share one commit); with
+# 'buffered' it returns at once, and the changes of the last interval are lost if the process
+# dies. Buffers are per process and are flushed when the process shuts down.
+class StatusWriteBuffer:
+    def init_app(self, app):
+        ack = app.config.get('STATUS_WRITE_ACK', FLUSHED)
+        if ack not in (FLUSHED, BUFFERED):
+            raise ValueError(f'STATUS_WRITE_ACK must be {FLUSHED!r} or {BUFFERED!r}, not {ack!r}')
+        app.extensions['status_writes'] = {
+            'enabled': app.config.get('STATUS_WRITE_BEHIND', False),
+            'interval': app.config.get('STATUS_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+            'batch_size': app.config.get('STATUS_FLUSH_BATCH', DEFAULT_FLUSH_BATCH),
+            'ack': ack,
+            'ack_timeout': app.config.get('STATUS_ACK_TIMEOUT', DEFAULT_ACK_TIMEOUT),
+            'batch': Batch(),
+            'wakeup': threading.Condition(),
+            'stopping': threading.Event(),
+            'thread': None,
+            'thread_pid': None,
+            'lock': threading.Lock(),
+            'flushes': 0,
+            'writes': 0,
+        }
+        if app.extensions['status_writes']['enabled']:
+            atexit.register(self._flush_at_exit, app)
+
+    @property
+    def _state(self):
+        return current_app.extensions['status_writes']
+
+    @property
+    def enabled(self):
+        return self._state['enabled']
+
+    # Sets a task's status: committed right away, or buffered with STATUS_WRITE_BEHIND. Raises
+    # StatusWriteError when a 'flushed' acknowledgement fails or times out.
+    def write(self, task_id, status):
+        self.write_many([task_id], status)
+
+    # Every status change goes through here, so a flush never overwrites a newer status with an
+    # older buffered one
+    def write_many(self, task_ids, status):
+        from .utils import task_audience
+        from . import store
+        task_ids = list(task_ids)
+        state = self._state
+        if not state['enabled']:
+            store.update_tasks(task_ids, status=status)
+            notify_tasks_changed(task_audience(task_ids), task_ids)
+            return
+        self.start(current_app._get_current_object())
+        acknowledged = state['ack'] == FLUSHED
+        with state['wakeup']:
+            batch = state['batch']
+            first = not batch.statuses
+            for task_id in task_ids:
+                batch.statuses[task_id] = status
+                if acknowledged:
+                    batch.waiters[task_id] = batch.waiters.get(task_id, 0) + 1
+            # Wakes the flusher when the batch starts (it then lingers for the interval) or is full
+            if first or len(batch.statuses) >= state['batch_size']:
+                state['wakeup'].notify()
+        if not acknowledged:
+            return
+        if not batch.done.wait(state['ack_timeout']):
+            with state['wakeup']:
+                if state['batch'] is batch:
+                    # Not picked up by the flusher yet: take the changes back, unless another
+                    # waiting request asked for the same, so none is saved after the error
+                    for task_id in task_ids:
+                        batch.waiters[task_id] -= 1
+                        if not batch.waiters[task_id] and batch.statuses.get(task_id) == status:
+                            del batch.statuses[task_id]
+                    raise StatusWriteError('Timed out waiting for the status change to be saved.')
+            # The flusher is writing the batch already; its outcome is known once the UPDATE returns
+            batch.done.wait()
+        if batch.error is not None:
+            raise StatusWriteError('The status change could not be saved.') from batch.error
+
+    # Writes the buffered changes now; returns the number of tasks written
+    def flush(self):
+        from .utils import task_audience
+        from . import db, store
+        state = self._state
+        with state['wakeup']:
+            batch, state['batch'] = state['batch'], Batch()
+        try:
+            if not batch.statuses:
+                return 0
+            task_ids = list(batch.statuses)
+            try:
+                store.set_statuses(batch.statuses)
+            except Exception as error:
+                db.session.rollback()
+                logger.exception('Failed to write %d buffered status changes.', len(task_ids))
+                batch.error = error
+                if state['ack'] == BUFFERED:
+                    # Nobody was told it failed, so keep the changes for the next flush, unless newer ones came in
+                    with state['wakeup']:
+                        for task_id, status in batch.statuses.items():
+                            state['batch'].statuses.setdefault(task_id, status)
+                return 0
+            state['flushes'] += 1
+            state['writes'] += len(task_ids)
+            # Acknowledged only after the caches were invalidated, so the page a client loads next is current
+            notify_tasks_changed(task_audience(task_ids), task_ids)
+            return len(task_ids)
+        finally:
+            batch.done.set()
+
+    # {'flushes': n, 'writes': n, 'waiting': n} for this process
+    def stats(self):
+        state = self._state
+        with state['wakeup']:
+            waiting = len(state['batch'].statuses)
+        return {'flushes': state['flushes'], 'writes': state['writes'], 'waiting': waiting}
+
+    # Starts this process's flusher thread. Threads do not survive a fork, so each worker
+    # process starts its own on its first buffered write.
+    def start(self, app):
+        state = app.extensions['status_writes']
+        with state['lock']:
+            if state['thread_pid'] == os.getpid():
+                return
+            state['stopping'].clear()
+            state['thread'] = threading.Thread(target=self._work, args=(app,), name='status-flusher', daemon=True)
+            state['thread_pid'] = os.getpid()
+            state['thread'].start()
+
+    # Sleeps until a change comes in, gives others STATUS_FLUSH_INTERVAL seconds (or until
+    # STATUS_FLUSH_BATCH are waiting) to join it, then flushes
+    def _work(self, app):
+        state = app.extensions['status_writes']
+        while True:
+            with state['wakeup']:
+                while not state['batch'].statuses and not state['stopping'].is_set():
+                    state['wakeup'].wait()
+                if not state['stopping'].is_set() and len(state['batch'].statuses) < state['batch_size']:
+                    state['wakeup'].wait(state['interval'])
+            with app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    logger.exception('Status flusher failed.')
+            if state['stopping'].is_set():
+                return
+
+    # Stops the flusher thread and writes whatever is still buffered
+    def shutdown(self, timeout=None):
+        state = self._state
+        with state['lock']:
+            if state['thread_pid'] == os.getpid():
+                state['stopping'].set()
+                with state['wakeup']:
+                    state['wakeup'].notify_all()
+                state['thread'].join(timeout)
+            state['thread'] = state['thread_pid'] = None
+        self.flush()
+
+    def _flush_at_exit(self, app):
+        with app.app_context():
+            self.shutdown()
@@ -0,0 +1,82 @@
+# Listing latency as the task history grows, with old tasks archived (app/archive.py) and without.
+#
+#   python -m benchmarks.archive --users 200 --live 20000 --history 20000 80000 320000 --runs 20
+#
+# For each history size, two databases get the same tasks: all but the newest --live of them are
+# completed. One keeps every task in the task table, the other archives the completed ones (timing
+# the archive run). Then each database is measured for the number of live rows and the median
+# latency of the task list, the admin task list and a search, as the user owning the most tasks.
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import func, select, update
+from app import create_app, db, password_hasher
+from app.archive import archive_tasks
+from app.models import Task, TaskStatus
+from .common import make_config
+from .seed import seed
+
+def median_ms(client, url, runs):
+    client.get(url) # Warm-up
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, url
+    return round(statistics.median(samples) * 1000, 2)
+
+def measure(path, history, live, users, archived, runs):
+    app = create_app(make_config(path, TASK_LIST_CACHE_ENABLED=False))
+    report = {}
+    with app.app_context():
+        seed(users, history, 0.002, random.Random(1), password_hash='x')
+        db.session.execute(update(Task).where(Task.id <= history - live).values(status=TaskStatus.COMPLETED))
+        db.session.commit()
+        if archived:
+            started = time.perf_counter()
+            moved = archive_tasks(days=0, statuses=['COMPLETED'])
+            elapsed = time.perf_counter() - started
+            report['archive'] = dict(moved, tasks_per_second=round(moved['tasks'] / elapsed) if moved['tasks'] else None)
+        report['live_tasks'] = db.session.scalar(select(func.count(Task.id)))
+        user_id = db.session.scalar(select(Task.user_id).group_by(Task.user_id).order_by(func.count().desc()).limit(1))
+        db.session.remove()
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    report['tasks_ms'] = median_ms(client, '/tasks', runs)
+    report['search_ms'] = median_ms(client, '/tasks/search?q=synthetic', runs)
+    with client.session_transaction() as session:
+        session['_user_id'] = '1' # user1 is the admin
+    report['admin_tasks_ms'] = median_ms(client, '/admin/tasks', runs)
+    with app.app_context():
+        password_hasher.shutdown()
+        db.engine.dispose()
+    report['file_mb'] = round(os.path.getsize(path) / 2 ** 20, 1)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--live', type=int, default=20000, help='Tasks that are not completed.')
+    parser.add_argument('--history', type=int, nargs='+', default=[20000, 80000, 320000], help='Total tasks created.')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for history in args.history:
+            live = min(args.live, history)
+            results[history] = {
+                'all_live': measure(os.path.join(tmp, f'live-{history}.db'), history, live, args.users, False, args.runs),
+                'archived': measure(os.path.join(tmp, f'archived-{history}.db'), history, live, args.users, True, args.runs),
+            }
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
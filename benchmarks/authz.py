@@ -0,0 +1,93 @@
+# Permission checks per second through app.authz, against one query per task as the routes
+# used to do.
+#
+#   python -m benchmarks.authz --users 1000 --tasks 100000 --batch-sizes 1 50 200
+#
+# For each batch size, a user's random mix of owned, shared and foreign tasks is checked for
+# 'view_status' repeatedly: `per_task` loads each Task and its Permission row separately,
+# `batched` is AccessControl.can with an empty request memo (one query per batch), `indexed`
+# the same with the access index enabled and warm, and `memoized` repeats the check within
+# one request.
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from sqlalchemy import select
+from app import create_app, db, access_control
+from app.models import User, Task, Permission
+from .common import make_config
+from .seed import seed
+
+def legacy_check(user, task_ids):
+    allowed = {}
+    for task_id in task_ids:
+        task = db.session.get(Task, task_id)
+        if task is None:
+            allowed[task_id] = False
+        elif task.user_id == user.id or user.is_administrator():
+            allowed[task_id] = True
+        else:
+            permission = Permission.query.filter_by(task_id=task_id, user_id=user.id).first()
+            allowed[task_id] = permission is not None and permission.can_view_status
+    return allowed
+
+def checks_per_second(app, fn, batches, seconds, new_request=True):
+    checks = 0
+    started = time.perf_counter()
+    with app.test_request_context():
+        while time.perf_counter() - started < seconds:
+            for batch in batches:
+                if new_request:
+                    access_control.forget()
+                    db.session.expire_all()
+                fn(batch)
+                checks += len(batch)
+    return round(checks / (time.perf_counter() - started))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--share-density', type=float, default=0.002)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 50, 200])
+    parser.add_argument('--seconds', type=float, default=2.0, help='Duration of each measurement.')
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, 'bench.db')))
+        with app.app_context():
+            dataset = seed(args.users, args.tasks, args.share_density, rng, password_hash='x')
+            # The user with the most shares, so the batches mix owned, shared and foreign tasks
+            user_id = db.session.scalar(
+                select(Permission.user_id).group_by(Permission.user_id).order_by(db.func.count().desc()).limit(1)
+            )
+            user = db.session.get(User, user_id)
+            owned = list(db.session.scalars(select(Task.id).where(Task.user_id == user_id)))
+            shared = list(db.session.scalars(select(Permission.task_id).where(Permission.user_id == user_id)))
+            max_id = db.session.scalar(select(db.func.max(Task.id)))
+            pool = owned + shared + [rng.randint(1, max_id) for _ in range(len(owned) + len(shared))]
+
+            results = {}
+            for size in args.batch_sizes:
+                batches = [rng.sample(pool, min(size, len(pool))) for _ in range(20)]
+                check = lambda batch: access_control.can(user, 'view_status', batch)
+                results[size] = {'per_task': checks_per_second(app, lambda batch: legacy_check(user, batch), batches, args.seconds)}
+                results[size]['batched'] = checks_per_second(app, check, batches, args.seconds)
+                app.extensions['access_index']['enabled'] = True
+                with app.test_request_context():
+                    for batch in batches:
+                        check(batch) # Warm the index
+                results[size]['indexed'] = checks_per_second(app, check, batches, args.seconds)
+                app.extensions['access_index']['enabled'] = False
+                access_control.clear()
+                results[size]['memoized'] = checks_per_second(app, check, batches, args.seconds, new_request=False)
+            db.session.remove()
+            db.engine.dispose()
+
+    print(json.dumps({'dataset': dataset, 'checks_per_second': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# Bulk sharing versus the one-task-one-user share_task route.
+#
+#   python -m benchmarks.bulk_share --tasks 50 --users 20
+#
+# Both paths share the same `--tasks` tasks with the same `--users` users on fresh databases.
+# The looped path POSTs /task/share once per (task, user) pair, as a client of the original
+# route would; the bulk path makes one bulk_share call.
+import argparse
+import json
+import os
+import tempfile
+import time
+from sqlalchemy import insert
+from app import create_app, db
+from app.models import User, Task, Permission
+from app.sharing import bulk_share
+from .common import make_config
+
+def setup(path, args):
+    app = create_app(make_config(path, PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_METHOD='pbkdf2:sha256:1000'))
+    with app.app_context():
+        owner = User(username='owner', password='password')
+        db.session.add(owner)
+        db.session.commit()
+        db.session.execute(insert(User), [
+            {'username': f'member{i}', '_password': 'x', 'is_admin': False} for i in range(args.users)
+        ])
+        db.session.execute(insert(Task), [
+            {'title': f'Task {i}', 'user_id': owner.id} for i in range(args.tasks)
+        ])
+        db.session.commit()
+        task_ids = [task_id for (task_id,) in db.session.query(Task.id)]
+    return app, task_ids
+
+def looped(app, task_ids, usernames):
+    client = app.test_client()
+    client.post('/login', data={'username': 'owner', 'password': 'password'})
+    started = time.perf_counter()
+    for task_id in task_ids:
+        for username in usernames:
+            client.post(f'/task/share/{task_id}', data={'username': username})
+    return time.perf_counter() - started
+
+def bulk(app, task_ids, usernames):
+    with app.app_context():
+        started = time.perf_counter()
+        bulk_share(task_ids, usernames)
+        return time.perf_counter() - started
+
+def run(name, path, args):
+    app, task_ids = setup(path, args)
+    usernames = [f'member{i}' for i in range(args.users)]
+    elapsed = (looped if name == 'looped' else bulk)(app, task_ids, usernames)
+    with app.app_context():
+        shared = Permission.query.count()
+        db.engine.dispose()
+    return {
+        'path': name,
+        'pairs': len(task_ids) * len(usernames),
+        'permissions': shared,
+        'seconds': round(elapsed, 4),
+        'pairs_per_second': round(len(task_ids) * len(usernames) / elapsed, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=50)
+    parser.add_argument('--users', type=int, default=20)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        report = [run(name, os.path.join(tmp, f'{name}.db'), args) for name in ('looped', 'bulk')]
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
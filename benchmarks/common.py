@@ -0,0 +1,30 @@
+# Helpers shared by the benchmark scripts
+import statistics
+
+def make_config(path, **overrides):
+    class BenchmarkConfig:
+        SECRET_KEY = 'benchmark'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+        SQLALCHEMY_TRACK_MODIFICATIONS = False
+        RATELIMIT_ENABLED = False # Load generators post from one address as fast as they can
+    for key, value in overrides.items():
+        setattr(BenchmarkConfig, key, value)
+    return BenchmarkConfig
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+# Latency summary in milliseconds for a list of durations in seconds
+def latency_summary(samples):
+    millis = [sample * 1000 for sample in samples]
+    return {
+        'count': len(millis),
+        'mean_ms': round(statistics.fmean(millis), 3) if millis else None,
+        'p50_ms': round(percentile(millis, 0.50), 3) if millis else None,
+        'p95_ms': round(percentile(millis, 0.95), 3) if millis else None,
+        'p99_ms': round(percentile(millis, 0.99), 3) if millis else None,
+    }
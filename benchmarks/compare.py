@@ -0,0 +1,50 @@
+# Compares two reports written by benchmarks.run, scenario by scenario.
+#
+#   python -m benchmarks.compare before.json after.json
+import argparse
+import json
+
+METRICS = ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+STARTUP_METRICS = ('import_ms', 'create_app_ms', 'first_request_ms', 'first_db_request_ms', 'total_ms')
+
+def change(before, after):
+    if before is None or after is None:
+        return None
+    if before == 0:
+        return None if after == 0 else float('inf')
+    return round((after - before) / before * 100, 1)
+
+def compare(before, after):
+    result = {}
+    for name, old in before['scenarios'].items():
+        new = after['scenarios'].get(name)
+        if new is None:
+            continue
+        result[name] = compare_metrics(old, new, METRICS)
+    if 'startup' in before and 'startup' in after:
+        result['startup'] = compare_metrics(before['startup'], after['startup'], STARTUP_METRICS)
+    return result
+
+def compare_metrics(old, new, metrics):
+    return {
+        metric: {'before': old.get(metric), 'after': new.get(metric), 'change_pct': change(old.get(metric), new.get(metric))}
+        for metric in metrics
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(json.dumps({
+        'before': before.get('commit'),
+        'after': after.get('commit'),
+        'scenarios': compare(before, after),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Concurrent write throughput on a SQLite file, with and without the connection pragmas.
+#
+#   python -m benchmarks.concurrent_writes --writers 8 --readers 4 --seconds 10
+#
+# "before" runs with SQLite's defaults (rollback journal, synchronous=FULL, no busy timeout beyond
+# the driver's, no mmap), "after" with the WAL/NORMAL/busy_timeout/mmap settings from config.py.
+# Writers post status updates and readers load /tasks through the test client, all at once, for a
+# fixed time; failed requests (e.g. "database is locked") are counted as errors.
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import select
+from app import create_app, db, password_hasher
+from app.models import Task, TaskStatus
+from .common import make_config, latency_summary
+from .run import TestClientSession, fetch, log_in
+from .seed import seed
+
+BEFORE = {'SQLITE_JOURNAL_MODE': None, 'SQLITE_SYNCHRONOUS': None, 'SQLITE_BUSY_TIMEOUT_MS': None, 'SQLITE_MMAP_SIZE': None}
+AFTER = {} # The defaults
+
+def measure(overrides, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(
+            os.path.join(tmp, 'bench.db'),
+            PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',
+            PASSWORD_HASH_WORKERS=0,
+            PROPAGATE_EXCEPTIONS=False,
+            **overrides,
+        ))
+        with app.app_context():
+            seed(args.writers + args.readers + 1, args.tasks, 0.01, random.Random(1))
+            journal_mode = db.session.connection().exec_driver_sql('PRAGMA journal_mode').scalar()
+            owned = {
+                user_id: list(db.session.scalars(select(Task.id).where(Task.user_id == user_id)))
+                for user_id in range(2, args.writers + args.readers + 2)
+            }
+            db.session.remove()
+
+        statuses = [status.name for status in TaskStatus]
+        results = {'write': ([], []), 'read': ([], [])}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + args.seconds
+
+        def worker(kind, user_id):
+            rng = random.Random(user_id)
+            session = TestClientSession(app)
+            log_in(session, user_id)
+            ok, failed = results[kind]
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                if kind == 'write' and owned[user_id]:
+                    status = fetch(session, 'POST', f'/task/update_status/{rng.choice(owned[user_id])}',
+                                   {'status': rng.choice(statuses)})
+                else:
+                    status = fetch(session, 'GET', '/tasks')
+                elapsed = time.perf_counter() - started
+                with lock:
+                    (ok if status < 400 else failed).append(elapsed)
+
+        threads = [threading.Thread(target=worker, args=('write', 2 + i)) for i in range(args.writers)]
+        threads += [threading.Thread(target=worker, args=('read', 2 + args.writers + i)) for i in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            password_hasher.shutdown()
+
+    report = {'journal_mode': journal_mode}
+    for kind, (ok, failed) in results.items():
+        report[kind] = {
+            'per_second': round(len(ok) / args.seconds, 1),
+            'errors': len(failed),
+            **latency_summary(ok),
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+    print(json.dumps({'before': measure(BEFORE, args), 'after': measure(AFTER, args)}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+# Admin dashboard from the precomputed counters versus aggregating the task table on each view,
+# and what maintaining the counters costs writes.
+#
+#   python -m benchmarks.dashboard --users 1000 --tasks 200000 --runs 20
+#
+# Reads: median time of dashboard_stats() against the same numbers computed with GROUP BY
+# queries over task and permission. Writes: bulk insert and status update throughput with the
+# counter triggers in place and with them dropped (median of 3 rounds after a warm-up).
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import func, insert, select, update
+from app import create_app, db
+from app.models import User, Task, Permission, TaskStatus
+from app.stats import dashboard_stats, stats_drop, DEFAULT_TOP_SHARED
+from .common import make_config
+from .seed import seed
+
+def aggregate_stats(days=30):
+    since = func.date('now', f'-{days - 1} days')
+    day = func.date(Task.timestamp)
+    return (
+        db.session.execute(
+            select(User.id, User.username, Task.status, func.count(Task.id))
+            .outerjoin(Task, Task.user_id == User.id).group_by(User.id, Task.status)
+        ).all(),
+        db.session.execute(select(day, func.count()).where(day >= since).group_by(day)).all(),
+        db.session.execute(
+            select(Permission.task_id, func.count()).where(Permission.can_view == True)
+            .group_by(Permission.task_id).order_by(func.count().desc()).limit(DEFAULT_TOP_SHARED)
+        ).all(),
+    )
+
+def median_ms(fn, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+        db.session.rollback()
+    return round(statistics.median(samples) * 1000, 2)
+
+def write_throughput(user_ids, rows):
+    batch = [{'title': f'Bench {number}', 'user_id': random.choice(user_ids)} for number in range(rows)]
+    started = time.perf_counter()
+    db.session.execute(insert(Task), batch)
+    db.session.commit()
+    inserted = time.perf_counter() - started
+    started = time.perf_counter()
+    db.session.execute(update(Task).where(Task.title.like('Bench %')).values(status=TaskStatus.COMPLETED))
+    db.session.commit()
+    updated = time.perf_counter() - started
+    db.session.execute(db.delete(Task).where(Task.title.like('Bench %')))
+    db.session.commit()
+    return {'inserts_per_second': round(rows / inserted), 'updates_per_second': round(rows / updated)}
+
+# Median of a few rounds, after a warm-up round (the first batch after seeding runs much faster)
+def median_throughput(user_ids, rows, rounds=3):
+    write_throughput(user_ids, rows)
+    samples = [write_throughput(user_ids, rows) for _ in range(rounds)]
+    return {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=200000)
+    parser.add_argument('--share-density', type=float, default=0.002)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--write-rows', type=int, default=20000)
+    args = parser.parse_args()
+    random.seed(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, 'bench.db')))
+        with app.app_context():
+            report = {'dataset': seed(args.users, args.tasks, args.share_density, random.Random(1), password_hash='x')}
+            report['read_ms'] = {
+                'counters': median_ms(dashboard_stats, args.runs),
+                'aggregate_queries': median_ms(aggregate_stats, args.runs),
+            }
+            user_ids = list(db.session.scalars(select(User.id)))
+            report['writes'] = {'with_triggers': median_throughput(user_ids, args.write_rows)}
+            connection = db.session.connection()
+            for statement in stats_drop(connection.dialect.name):
+                connection.exec_driver_sql(statement)
+            db.session.commit()
+            report['writes']['without_triggers'] = median_throughput(user_ids, args.write_rows)
+            db.session.remove()
+            db.engine.dispose()
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# Bytes on the wire and first-render latency of the task list, before and after the delivery
+# layer (app/delivery.py).
+#
+#   python -m benchmarks.delivery --tasks 50 --runs 10
+#
+# Bytes: /tasks for a user with --tasks tasks on the first page and the static files it links,
+# fetched without compression (COMPRESS_ENABLED off, the old behaviour) and with gzip (and brotli
+# when installed; static files from the copies `flask build-assets` writes). First render: a
+# fresh interpreter creates the app and times its first GET /tasks, once compiling the templates
+# in memory (no bytecode cache) and once reading them from a warm JINJA_BYTECODE_CACHE_DIR.
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from app import create_app, db, password_hasher
+from app.delivery import available_encodings, build_assets
+from .common import make_config
+from .seed import seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints the first /tasks render in milliseconds
+PROBE = '''
+import json, sys, time
+from benchmarks.common import make_config
+import app
+application = app.create_app(make_config(sys.argv[1], AUTO_CREATE_TABLES=False, JINJA_BYTECODE_CACHE_DIR=sys.argv[2] or None))
+client = application.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = '2'
+started = time.perf_counter()
+client.get('/tasks')
+first = time.perf_counter()
+client.get('/tasks')
+second = time.perf_counter()
+print(json.dumps({'first_render_ms': round((first - started) * 1000, 2), 'second_render_ms': round((second - first) * 1000, 2)}))
+'''
+
+def first_render(path, cache_dir, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, path, cache_dir or ''],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: round(statistics.median(sample[key] for sample in samples), 2) for key in samples[0]}
+
+def transferred(app, encoding):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '2'
+    links = re.findall(r'(?:href|src)="(/static/[^"]+)"', client.get('/tasks').get_data(as_text=True))
+    headers = {'Accept-Encoding': encoding} if encoding else {}
+    sizes = {'/tasks': len(client.get('/tasks', headers=headers).data)}
+    for url in links:
+        response = client.get(url, headers=headers)
+        sizes[url] = len(response.data)
+        response.close()
+    sizes['total'] = sum(sizes.values())
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--tasks', type=int, default=50, help='Tasks of the measured user.')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters per first-render measurement.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        static = os.path.join(tmp, 'static')
+        cache_dir = os.path.join(tmp, 'jinja')
+        app = create_app(make_config(path, COMPRESS_ENABLED=False, JINJA_BYTECODE_CACHE_DIR=cache_dir))
+        shutil.copytree(app.static_folder, static)
+        app.static_folder = static # Keep the precompressed copies out of the source tree
+        with app.app_context():
+            seed(args.users, args.users * args.tasks, 0.0, random.Random(1), password_hash='x')
+            report = {'bytes': {'uncompressed': transferred(app, None)}}
+            build_assets(app)
+            app.extensions['delivery']['compress'] = True
+            for encoding in available_encodings():
+                report['bytes'][encoding] = transferred(app, encoding)
+            password_hasher.shutdown()
+            db.engine.dispose()
+
+        report['first_render'] = {
+            'no_bytecode_cache': first_render(path, None, args.runs),
+            'warm_bytecode_cache': first_render(path, cache_dir, args.runs),
+        }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
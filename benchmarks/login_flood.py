@@ -0,0 +1,145 @@
+# Server CPU under a login flood, with and without rate limiting.
+#
+#   python -m benchmarks.login_flood --rate 200 --seconds 10 --workers 2
+#
+# Starts `gunicorn -c gunicorn.conf.py wsgi:app` twice on the same database, once with
+# RATELIMIT_ENABLED=false and once with it on, and sends wrong-password logins at a fixed rate
+# (an open loop: the flood does not slow down when the server does). The CPU time used by the
+# gunicorn processes and their password hashing pools comes from /proc, so this needs Linux.
+# Without the limiter every attempt costs a password hash and the workers saturate; with it
+# only the first attempts of each bucket are hashed and the rest are answered with 429.
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from app import create_app, password_hasher
+from .common import make_config, latency_summary
+from .seed import seed
+from .server_scaling import start_server
+
+TICKS = os.sysconf('SC_CLK_TCK')
+
+def descendants(pid):
+    pids = [pid]
+    for task in os.listdir(f'/proc/{pid}/task'):
+        try:
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children = [int(child) for child in f.read().split()]
+        except OSError:
+            continue
+        for child in children:
+            pids.extend(descendants(child))
+    return pids
+
+# User plus system CPU seconds of the server process tree (exited children are counted by their parent)
+def cpu_seconds(pid):
+    total = 0
+    for process in descendants(pid):
+        try:
+            with open(f'/proc/{process}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            continue
+        total += sum(int(value) for value in fields[11:15]) # utime, stime, cutime, cstime
+    return total / TICKS
+
+def post_login(url, username):
+    body = urllib.parse.urlencode({'username': username, 'password': 'wrong-password'}).encode()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url + '/login', body), timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        error.read()
+        return error.code
+    except OSError:
+        return None
+
+def flood(url, args):
+    total = args.rate * args.seconds
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    statuses = {}
+    latencies = []
+    started = time.perf_counter()
+
+    def client_loop():
+        while True:
+            with lock:
+                n = next(remaining, None)
+            if n is None:
+                return
+            delay = started + n / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent = time.perf_counter()
+            status = post_login(url, f'user{n % args.users}')
+            elapsed = time.perf_counter() - sent
+            with lock:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client_loop) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses, latencies, time.perf_counter() - started
+
+def run(path, limited, args):
+    process, url = start_server(
+        path, args.workers, args,
+        RATELIMIT_ENABLED='true' if limited else 'false',
+    )
+    try:
+        post_login(url, 'warm-up') # Starts the hashing pools before measuring
+        before = cpu_seconds(process.pid)
+        statuses, latencies, wall = flood(url, args)
+        cpu = cpu_seconds(process.pid) - before
+    finally:
+        process.terminate()
+        process.wait()
+    return {
+        'rate_limited': limited,
+        'requests': sum(statuses.values()),
+        'statuses': statuses,
+        'wall_seconds': round(wall, 2),
+        'server_cpu_seconds': round(cpu, 2),
+        'server_cores_busy': round(cpu / wall, 2),
+        'cpu_ms_per_request': round(cpu * 1000 / max(sum(statuses.values()), 1), 3),
+        'latency': latency_summary(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=int, default=200, help='Login attempts per second.')
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=64, help='Threads sending the attempts.')
+    parser.add_argument('--users', type=int, default=20, help='Usernames the attempts cycle through.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        app = create_app(make_config(path))
+        with app.app_context():
+            seed(args.users, 0, rng=random.Random(1))
+            password_hasher.shutdown()
+        results = [run(path, limited, args) for limited in (False, True)]
+
+    print(json.dumps({
+        'cpu_count': os.cpu_count(),
+        'workers': args.workers,
+        'attempts_per_second': args.rate,
+        'runs': results,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Login throughput versus the size of the password hashing pool.
+#
+#   python -m benchmarks.login_throughput --clients 16 --logins 400 --pool-sizes 0 1 2 4 8
+#
+# Every pool size gets a fresh database with the same users; `--clients` threads then log in
+# concurrently through the Flask test client until `--logins` logins have completed. Pool size 0
+# hashes inline on the request thread, which is the behaviour before the pool existed.
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import insert
+from app import create_app, db, password_hasher
+from app.models import User
+from .common import make_config, latency_summary
+
+PASSWORD = 'benchmark-password'
+
+def run(pool_size, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(
+            os.path.join(tmp, 'bench.db'),
+            PASSWORD_HASH_WORKERS=pool_size,
+            PASSWORD_HASH_CONCURRENCY=max(pool_size, 1) * 2,
+            PASSWORD_HASH_TIMEOUT=60,
+            PASSWORD_HASH_METHOD=args.method,
+        ))
+        with app.app_context():
+            pwhash = password_hasher.hash(PASSWORD)
+            db.session.execute(insert(User), [
+                {'username': f'user{i}', '_password': pwhash, 'is_admin': False}
+                for i in range(args.users)
+            ])
+            db.session.commit()
+            password_hasher.hash(PASSWORD) # Start the pool before timing
+
+        remaining = iter(range(args.logins))
+        lock = threading.Lock()
+        latencies = []
+        failures = []
+
+        def client_loop():
+            while True:
+                with lock:
+                    n = next(remaining, None)
+                if n is None:
+                    return
+                client = app.test_client()
+                started = time.perf_counter()
+                response = client.post('/login', data={'username': f'user{n % args.users}', 'password': PASSWORD})
+                elapsed = time.perf_counter() - started
+                with lock:
+                    (latencies if response.status_code == 302 else failures).append(elapsed)
+
+        threads = [threading.Thread(target=client_loop) for _ in range(args.clients)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+
+        with app.app_context():
+            password_hasher.shutdown()
+            db.engine.dispose()
+
+    return {
+        'pool_size': pool_size,
+        'logins_per_second': round(len(latencies) / wall, 2),
+        'failed': len(failures),
+        'latency': latency_summary(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[0, 1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+    print(json.dumps([run(size, args) for size in args.pool_sizes], indent=2))
+
+if __name__ == '__main__':
+    main()
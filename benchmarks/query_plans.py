@@ -0,0 +1,108 @@
+# Shows how the Task/Permission access paths are planned before and after the index migration.
+#
+#   python -m benchmarks.query_plans --users 200 --tasks 100000 --shares 50000
+#
+# The "before" database is built by migrating to the initial schema only, the "after" database
+# by migrating to head. Both get the same synthetic rows; for each query the SQLite plan and the
+# median latency are printed as JSON.
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask_migrate import upgrade
+from sqlalchemy import event, insert
+from app import create_app, db, init_migrate
+from app.models import User, Task, Permission, TaskStatus
+from app.pagination import keyset_page, visible_tasks_query
+from .common import make_config
+
+INITIAL_REVISION = '8f575bc77805'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+def seed(users, tasks, shares, rng):
+    db.session.execute(insert(User), [
+        {'id': i, 'username': f'user{i}', '_password': 'x', 'is_admin': False}
+        for i in range(1, users + 1)
+    ])
+    start = datetime(2020, 1, 1)
+    statuses = list(TaskStatus)
+    db.session.execute(insert(Task), [
+        {'id': i, 'title': f'Task {i}', 'description': '', 'status': rng.choice(statuses),
+         'user_id': rng.randint(1, users), 'timestamp': start + timedelta(seconds=i)}
+        for i in range(1, tasks + 1)
+    ])
+    pairs = set()
+    while len(pairs) < shares:
+        pairs.add((rng.randint(1, users), rng.randint(1, tasks)))
+    db.session.execute(insert(Permission), [
+        {'user_id': user_id, 'task_id': task_id, 'can_view': True, 'can_view_status': True}
+        for user_id, task_id in pairs
+    ])
+    db.session.commit()
+
+# Runs the query once while capturing the SQL it emits, then asks SQLite how it plans it
+def explain(run):
+    captured = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    statement, parameters = captured[-1]
+    rows = db.session.connection().exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+    return [row[-1] for row in rows]
+
+def timed(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        db.session.expire_all()
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+def scenarios(user_id, task_id):
+    user = db.session.get(User, user_id)
+    return {
+        'owned_or_shared_page': lambda: keyset_page(visible_tasks_query(user), 50).items,
+        'owned_tasks': lambda: Task.query.filter_by(user_id=user_id).order_by(Task.timestamp.desc()).limit(50).all(),
+        'share_lookup': lambda: Permission.query.filter_by(task_id=task_id, user_id=user_id).first(),
+        'task_permissions': lambda: Permission.query.filter_by(task_id=task_id).all(),
+    }
+
+def measure(revision, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, 'bench.db'), AUTO_CREATE_TABLES=False))
+        init_migrate(app)
+        with app.app_context():
+            upgrade(directory=MIGRATIONS_DIR, revision=revision)
+            seed(args.users, args.tasks, args.shares, random.Random(args.seed))
+            results = {}
+            for name, run in scenarios(user_id=1, task_id=args.tasks // 2).items():
+                results[name] = {'plan': explain(run), 'median_ms': timed(run, args.repeat)}
+            db.session.remove()
+            db.engine.dispose()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--shares', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    report = {
+        'before': measure(INITIAL_REVISION, args),
+        'after': measure('head', args),
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
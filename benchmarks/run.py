@@ -0,0 +1,249 @@
+# Scripted load scenarios with a JSON report that can be kept and compared across commits.
+#
+#   python -m benchmarks.run --db /tmp/bench.db --users 1000 --tasks 100000 --share-density 0.002
+#   python -m benchmarks.run --db /tmp/bench.db --url http://127.0.0.1:5000 --scenarios tasks_listing
+#   python -m benchmarks.compare before.json after.json
+#
+# The database is seeded with benchmarks.seed when the file does not exist yet. Requests go through
+# the Flask test client by default, or to a running server with `--url` (which must use the same
+# database). Query counts are only available in-process. Writes follow their redirect, as a browser
+# would, so their latency includes the task list they land on.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.cookiejar import CookieJar
+from sqlalchemy import event, func, select
+from app import create_app, db, password_hasher
+from app.models import User, Task, Permission, TaskStatus
+from .common import make_config, latency_summary
+from .seed import PASSWORD, seed
+from .startup import measure_startup
+
+SCENARIOS = ('login_storm', 'tasks_listing', 'status_updates', 'sharing', 'admin_listing')
+ADMIN_ID = 1
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.headers.get('Location')
+
+class HTTPSession:
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), self.NoRedirect)
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(urllib.request.Request(urllib.parse.urljoin(self.base_url, path), body, method=method)) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get('Location')
+
+def fetch(session, method, path, data=None, follow=False):
+    status, location = session.request(method, path, data)
+    if follow and 300 <= status < 400 and location:
+        status, location = session.request('GET', urllib.parse.urlparse(location).path)
+    return status
+
+def log_in(session, user_id):
+    status = fetch(session, 'POST', '/login', {'username': f'user{user_id}', 'password': PASSWORD})
+    if status != 302:
+        raise RuntimeError(f'Could not log in as user{user_id} (HTTP {status}).')
+
+# Users that own tasks, each with a sample of their task ids, for the worker threads
+def load_workload(app, workers):
+    with app.app_context():
+        user_ids = list(db.session.scalars(select(User.id).where(User.id != ADMIN_ID).order_by(User.id)))
+        owners = list(db.session.scalars(
+            select(Task.user_id).where(Task.user_id != ADMIN_ID).group_by(Task.user_id).order_by(Task.user_id).limit(workers)
+        ))
+        owned = {
+            owner: list(db.session.scalars(select(Task.id).where(Task.user_id == owner).order_by(Task.id).limit(200)))
+            for owner in owners
+        }
+        dataset = {
+            'users': len(user_ids) + 1,
+            'tasks': db.session.scalar(select(func.count(Task.id))),
+            'permissions': db.session.scalar(select(func.count(Permission.id))),
+        }
+    if not owned:
+        raise RuntimeError('The database has no tasks owned by non-admin users; seed it first.')
+    return user_ids, owned, dataset
+
+# One operation of each scenario: (user to log in as, callable(session, rng) -> HTTP status)
+def scenario_operation(name, user_ids, owned, owner):
+    statuses = [status.name for status in TaskStatus]
+    if name == 'login_storm':
+        return None, lambda session, rng: fetch(
+            session, 'POST', '/login', {'username': f'user{rng.choice(user_ids)}', 'password': PASSWORD}
+        )
+    if name == 'tasks_listing':
+        return owner, lambda session, rng: fetch(session, 'GET', '/tasks')
+    if name == 'status_updates':
+        return owner, lambda session, rng: fetch(
+            session, 'POST', f'/task/update_status/{rng.choice(owned[owner])}', {'status': rng.choice(statuses)}, follow=True
+        )
+    if name == 'sharing':
+        return owner, lambda session, rng: fetch(
+            session, 'POST', f'/task/share/{rng.choice(owned[owner])}', {'username': f'user{rng.choice(user_ids)}'}, follow=True
+        )
+    if name == 'admin_listing':
+        return ADMIN_ID, lambda session, rng: fetch(session, 'GET', '/admin/tasks')
+    raise ValueError(f'Unknown scenario: {name}')
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.lock = threading.Lock()
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self.record)
+
+    def record(self, *args):
+        with self.lock:
+            self.count += 1
+
+    def reset(self):
+        with self.lock:
+            self.count = 0
+
+def run_scenario(name, new_session, workload, args, counter=None):
+    user_ids, owned, _ = workload
+    owners = list(owned)
+    remaining = iter(range(args.requests))
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+    workers = []
+    for i in range(args.concurrency):
+        login_as, operation = scenario_operation(name, user_ids, owned, owners[i % len(owners)])
+        session = new_session()
+        if login_as is not None:
+            log_in(session, login_as)
+        workers.append((session, operation, random.Random(args.seed + i)))
+
+    def worker_loop(session, operation, rng):
+        while True:
+            with lock:
+                n = next(remaining, None)
+            if n is None:
+                return
+            if name == 'login_storm':
+                session = new_session() # Every login is a new visitor
+            started = time.perf_counter()
+            status = operation(session, rng)
+            elapsed = time.perf_counter() - started
+            with lock:
+                (latencies if status < 400 else errors).append(elapsed)
+
+    threads = [threading.Thread(target=worker_loop, args=worker) for worker in workers]
+    if counter is not None:
+        counter.reset()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    completed = len(latencies) + len(errors)
+    return {
+        'requests': completed,
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(completed / elapsed, 1),
+        **latency_summary(latencies + errors),
+        'queries_per_request': round(counter.count / completed, 2) if counter is not None and completed else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            overrides[key] = json.loads(value)
+        except ValueError:
+            overrides[key] = value
+    return overrides
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', help='SQLite file; seeded when missing. Defaults to a temporary file.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--share-density', type=float, default=0.01)
+    parser.add_argument('--url', help='Base URL of a running server instead of the test client.')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--config', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='App config overrides for the test client, values parsed as JSON when possible.')
+    parser.add_argument('--startup-runs', type=int, default=5, help='Cold starts to measure (0 to skip).')
+    parser.add_argument('--output', help='Write the report here as well as to stdout.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.abspath(args.db or os.path.join(tmp, 'bench.db'))
+        needs_seed = not os.path.exists(path)
+        app = create_app(make_config(path, **parse_overrides(args.config)))
+        if needs_seed:
+            with app.app_context():
+                seed(args.users, args.tasks, args.share_density, random.Random(args.seed))
+        workload = load_workload(app, args.concurrency)
+
+        if args.url:
+            new_session, counter = (lambda: HTTPSession(args.url)), None
+        else:
+            with app.app_context():
+                counter = QueryCounter(db.engine)
+            new_session = lambda: TestClientSession(app)
+
+        report = {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'target': args.url or 'test-client',
+            'dataset': workload[2],
+            'requests_per_scenario': args.requests,
+            'concurrency': args.concurrency,
+            'config': args.config,
+            'scenarios': {name: run_scenario(name, new_session, workload, args, counter) for name in args.scenarios},
+        }
+        if args.startup_runs:
+            report['startup'] = measure_startup(path, args.startup_runs)
+        with app.app_context():
+            password_hasher.shutdown()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Full-text search latency versus a LIKE '%...%' scan as the task table grows.
+#
+#   python -m benchmarks.search --tasks 1000000 --repeat 20
+#
+# Titles and descriptions are built from a fixed vocabulary, so common and rare terms both exist.
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import insert, or_
+from app import create_app, db
+from app.models import User, Task
+from app.pagination import visible_tasks_query
+from app.search import search_tasks
+from .common import make_config
+
+VOCABULARY = [f'word{i}' for i in range(5000)]
+BATCH = 50000
+
+def seed(tasks, rng):
+    db.session.execute(insert(User), [{'id': 1, 'username': 'user1', '_password': 'x', 'is_admin': False}])
+    for start in range(0, tasks, BATCH):
+        db.session.execute(insert(Task), [
+            {'title': ' '.join(rng.choices(VOCABULARY, k=4)),
+             'description': ' '.join(rng.choices(VOCABULARY, k=20)),
+             'user_id': 1}
+            for _ in range(start, min(start + BATCH, tasks))
+        ])
+    db.session.commit()
+
+def like_search(user, term, per_page=20):
+    pattern = f'%{term}%'
+    return visible_tasks_query(user).filter(
+        or_(Task.title.ilike(pattern), Task.description.ilike(pattern))
+    ).order_by(Task.timestamp.desc(), Task.id.desc()).limit(per_page + 1).all()
+
+def timed(run, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_app(make_config(os.path.join(tmp, 'bench.db')))
+        with app.app_context():
+            seed(args.tasks, rng)
+            user = db.session.get(User, 1)
+            report = {'tasks': args.tasks, 'terms': {}}
+            for term in ('word7', 'word4242', 'word99 word100'):
+                report['terms'][term] = {
+                    'fts_median_ms': timed(lambda: search_tasks(user, term), args.repeat),
+                    'like_median_ms': timed(lambda: like_search(user, term), args.repeat),
+                }
+            db.engine.dispose()
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
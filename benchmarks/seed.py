@@ -0,0 +1,100 @@
+# Synthetic data generator: N users, M tasks and a share graph of configurable density,
+# written with bulk INSERTs in batches.
+#
+#   python -m benchmarks.seed --db /tmp/bench.db --users 1000 --tasks 100000 --share-density 0.002
+#
+# Every user's password is PASSWORD; user1 is an admin. `--share-density` is the probability that a
+# task is shared with any given other user, so a task gets about density * (users - 1) shares.
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import insert, func
+from app import create_app, db, password_hasher
+from app.models import User, Task, Permission, TaskStatus
+from .common import make_config
+
+PASSWORD = 'password'
+BATCH = 20000
+START = datetime(2020, 1, 1)
+
+def batched(rows, size=BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Must run inside an app context. Returns the number of rows written per table.
+def seed(users, tasks, share_density=0.0, rng=None, password_hash=None):
+    rng = rng or random.Random(1)
+    password_hash = password_hash or password_hasher.hash(PASSWORD)
+    first_user = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    first_task = (db.session.query(func.max(Task.id)).scalar() or 0) + 1
+    user_ids = range(first_user, first_user + users)
+    statuses = list(TaskStatus)
+
+    for batch in batched(
+        {'id': user_id, 'username': f'user{user_id}', '_password': password_hash, 'is_admin': user_id == 1}
+        for user_id in user_ids
+    ):
+        db.session.execute(insert(User), batch)
+
+    task_owners = {}
+    def task_rows():
+        for offset in range(tasks):
+            task_id = first_task + offset
+            owner = rng.choice(user_ids)
+            task_owners[task_id] = owner
+            yield {
+                'id': task_id,
+                'title': f'Task {task_id}',
+                'description': f'Synthetic task {task_id} owned by user{owner}',
+                'status': rng.choice(statuses),
+                'user_id': owner,
+                'timestamp': START + timedelta(seconds=task_id),
+            }
+    for batch in batched(task_rows()):
+        db.session.execute(insert(Task), batch)
+
+    expected_shares = share_density * (users - 1)
+    shares = 0
+    def permission_rows():
+        nonlocal shares
+        for task_id, owner in task_owners.items():
+            count = int(expected_shares) + (rng.random() < expected_shares % 1)
+            for user_id in rng.sample(user_ids, min(count + 1, users)):
+                if user_id == owner or count == 0:
+                    continue
+                count -= 1
+                shares += 1
+                yield {'user_id': user_id, 'task_id': task_id, 'can_view': True, 'can_view_status': rng.random() < 0.8}
+    for batch in batched(permission_rows()):
+        db.session.execute(insert(Permission), batch)
+
+    db.session.commit()
+    return {'users': users, 'tasks': tasks, 'permissions': shares}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', required=True, help='SQLite file to create or extend.')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--share-density', type=float, default=0.002)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    app = create_app(make_config(os.path.abspath(args.db)))
+    with app.app_context():
+        started = time.perf_counter()
+        counts = seed(args.users, args.tasks, args.share_density, random.Random(args.seed))
+        counts['seconds'] = round(time.perf_counter() - started, 2)
+        password_hasher.shutdown()
+    print(json.dumps(counts))
+
+if __name__ == '__main__':
+    main()
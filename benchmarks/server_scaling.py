@@ -0,0 +1,110 @@
+# Throughput of the production server (gunicorn, gunicorn.conf.py) as the worker count grows.
+#
+#   python -m benchmarks.server_scaling --workers 1 2 4 8 --concurrency 16 --requests 2000
+#
+# Seeds one database, then for each worker count starts `gunicorn -c gunicorn.conf.py wsgi:app`
+# on it and replays the chosen benchmarks.run scenarios over HTTP. Throughput should grow with
+# the worker count until it reaches the number of cores.
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from app import create_app, password_hasher
+from .common import make_config
+from .run import HTTPSession, SCENARIOS, git_commit, load_workload, run_scenario
+from .seed import seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_up(url, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup.')
+        try:
+            urllib.request.urlopen(url + '/login').read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start in time.')
+
+# `settings` are extra environment variables for the server, e.g. RATELIMIT_ENABLED='true'
+def start_server(path, workers, args, **settings):
+    port = free_port()
+    env = dict(
+        os.environ,
+        SECRET_KEY='benchmark',
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}',
+        WEB_CONCURRENCY=str(workers),
+        GUNICORN_THREADS=str(args.threads),
+        GUNICORN_BIND=f'127.0.0.1:{port}',
+        GUNICORN_ACCESS_LOG='/dev/null',
+        RATELIMIT_ENABLED='false',
+    )
+    env.update(settings)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f'http://127.0.0.1:{port}'
+    try:
+        wait_until_up(url, process)
+    except RuntimeError:
+        process.kill()
+        raise
+    return process, url
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=['tasks_listing', 'admin_listing'])
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario.')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        app = create_app(make_config(path))
+        with app.app_context():
+            seed(args.users, args.tasks, 0.01, random.Random(args.seed))
+            password_hasher.shutdown()
+        workload = load_workload(app, args.concurrency)
+
+        results = {}
+        for workers in args.workers:
+            process, url = start_server(path, workers, args)
+            try:
+                results[workers] = {
+                    name: run_scenario(name, lambda: HTTPSession(url), workload, args)
+                    for name in args.scenarios
+                }
+            finally:
+                process.terminate()
+                process.wait()
+
+    print(json.dumps({
+        'commit': git_commit(),
+        'cpu_count': os.cpu_count(),
+        'threads': args.threads,
+        'concurrency': args.concurrency,
+        'dataset': workload[2],
+        'workers': results,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Cold start: import time, create_app time and the latency of the first requests, each measured
+# in a fresh interpreter.
+#
+#   python -m benchmarks.startup --runs 10
+#
+# Compares startup with AUTO_CREATE_TABLES on (the create_all check on every start) and off (the
+# schema left to migrations). benchmarks.run includes the "off" numbers in its report.
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+from app import create_app, db, password_hasher
+from .common import make_config
+from .seed import seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter; prints the timings in milliseconds as JSON
+PROBE = '''
+import json, sys, time
+from benchmarks.common import make_config
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app(make_config(sys.argv[1], AUTO_CREATE_TABLES=sys.argv[2] == '1'))
+created = time.perf_counter()
+client = application.test_client()
+client.get('/login')
+first_request = time.perf_counter()
+with client.session_transaction() as session: # Logged in as user2 without paying for a password check
+    session['_user_id'] = '2'
+client.get('/tasks')
+first_db_request = time.perf_counter()
+ms = lambda a, b: round((b - a) * 1000, 2)
+print(json.dumps({
+    'import_ms': ms(started, imported),
+    'create_app_ms': ms(imported, created),
+    'first_request_ms': ms(created, first_request),
+    'first_db_request_ms': ms(first_request, first_db_request),
+    'total_ms': ms(started, first_db_request),
+}))
+'''
+
+def probe(path, create_tables):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE, path, '1' if create_tables else '0'],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# Median of each timing over `runs` fresh interpreters, against an already seeded database
+def measure_startup(path, runs=5, create_tables=False):
+    samples = [probe(path, create_tables) for _ in range(runs)]
+    return {key: round(statistics.median(sample[key] for sample in samples), 2) for key in samples[0]}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--tasks', type=int, default=5000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        app = create_app(make_config(path))
+        with app.app_context():
+            seed(args.users, args.tasks, 0.01, random.Random(1), password_hash='x')
+            password_hasher.shutdown()
+            db.engine.dispose()
+        print(json.dumps({
+            'create_tables_on_startup': measure_startup(path, args.runs, create_tables=True),
+            'schema_from_migrations': measure_startup(path, args.runs, create_tables=False),
+        }, indent=2))
+
+if __name__ == '__main__':
+    main()
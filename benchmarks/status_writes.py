@@ -0,0 +1,104 @@
+# Status update throughput with a commit per request and with the write-behind buffer
+# (app/writebehind.py), acknowledged after the flush and after buffering.
+#
+#   python -m benchmarks.status_writes --writers 16 --seconds 10 --synchronous FULL
+#
+# Writers post status changes to their own tasks through the test client, all at once, for a fixed
+# time. Reports the acknowledged writes per second, their latency, the number of flushes the
+# buffer needed for them and whether the database ended up with every task's last status.
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from sqlalchemy import select
+from app import create_app, db, password_hasher, status_writes
+from app.models import Task, TaskStatus
+from .common import make_config, latency_summary
+from .run import TestClientSession, fetch, log_in
+from .seed import seed
+
+MODES = {
+    'per_request': {'STATUS_WRITE_BEHIND': False},
+    'write_behind_flushed': {'STATUS_WRITE_BEHIND': True, 'STATUS_WRITE_ACK': 'flushed'},
+    'write_behind_buffered': {'STATUS_WRITE_BEHIND': True, 'STATUS_WRITE_ACK': 'buffered'},
+}
+
+def measure(overrides, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = dict(
+            PASSWORD_HASH_METHOD='pbkdf2:sha256:1000',
+            PASSWORD_HASH_WORKERS=0,
+            PROPAGATE_EXCEPTIONS=False,
+            **overrides,
+        )
+        if args.interval is not None:
+            settings['STATUS_FLUSH_INTERVAL'] = args.interval
+        if args.synchronous:
+            settings['SQLITE_SYNCHRONOUS'] = args.synchronous
+        app = create_app(make_config(os.path.join(tmp, 'bench.db'), **settings))
+        with app.app_context():
+            seed(args.writers + 1, args.tasks, 0.01, random.Random(1))
+            owned = {
+                user_id: list(db.session.scalars(select(Task.id).where(Task.user_id == user_id)))
+                for user_id in range(2, args.writers + 2)
+            }
+            db.session.remove()
+
+        statuses = [status.name for status in TaskStatus]
+        ok, failed, last = [], [], {}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + args.seconds
+
+        def worker(user_id):
+            rng = random.Random(user_id)
+            session = TestClientSession(app)
+            log_in(session, user_id)
+            # A few hot tasks per user, like someone clicking through the status select
+            hot = owned[user_id][:args.hot_tasks]
+            while hot and time.perf_counter() < deadline:
+                task_id, status = rng.choice(hot), rng.choice(statuses)
+                started = time.perf_counter()
+                code = fetch(session, 'POST', f'/task/update_status/{task_id}', {'status': status})
+                elapsed = time.perf_counter() - started
+                with lock:
+                    (ok if code < 400 else failed).append(elapsed)
+                    last[task_id] = status
+
+        threads = [threading.Thread(target=worker, args=(2 + i,)) for i in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with app.app_context():
+            status_writes.shutdown()
+            flushes = status_writes.stats()['flushes']
+            stored = dict(db.session.execute(select(Task.id, Task.status).where(Task.id.in_(list(last)))).all())
+            password_hasher.shutdown()
+            db.session.remove()
+            db.engine.dispose()
+
+    return {
+        'writes_per_second': round(len(ok) / args.seconds, 1),
+        'errors': len(failed),
+        'flushes': flushes if overrides['STATUS_WRITE_BEHIND'] else None,
+        'last_status_stored': all(stored[task_id].name == status for task_id, status in last.items()),
+        **latency_summary(ok),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--hot-tasks', type=int, default=5, help='Tasks each writer keeps changing.')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--interval', type=float, help='STATUS_FLUSH_INTERVAL in seconds (config default otherwise).')
+    parser.add_argument('--synchronous', help='SQLITE_SYNCHRONOUS, e.g. FULL for an fsync per commit (config default otherwise).')
+    parser.add_argument('--mode', choices=list(MODES), action='append', help='Repeatable; all modes by default.')
+    args = parser.parse_args()
+    print(json.dumps({mode: measure(MODES[mode], args) for mode in args.mode or MODES}, indent=2))
+
+if __name__ == '__main__':
+    main()
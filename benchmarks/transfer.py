@@ -0,0 +1,108 @@
+# Streaming export and import of tasks on a large dataset.
+#
+#   python -m benchmarks.transfer --tasks 1000000 --users 1000
+#
+# Seeds a database, exports every task as CSV and NDJSON (export_chunks, the code behind
+# GET /api/v1/tasks/export and `flask export-tasks`), then imports each file into a fresh
+# database holding only the users (import_tasks). Each step is timed, then repeated under
+# tracemalloc to report its peak Python memory, which should stay flat as --tasks grows.
+# --baseline adds the same export done by loading every task through the ORM first.
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from app import create_app, db, password_hasher
+from app.models import Task, Permission
+from app.transfer import FIELDS, export_chunks, import_tasks
+from .common import make_config
+from .seed import seed
+
+def export_file(path, fmt):
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        for chunk in export_chunks(fmt, 'all'):
+            out.write(chunk)
+
+# What the export would look like without streaming: every task loaded at once
+def export_file_unbatched(path):
+    tasks = Task.query.all()
+    with open(path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.DictWriter(out, FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for task in tasks:
+            writer.writerow({'id': task.id, 'title': task.title, 'description': task.description,
+                             'status': task.status.name, 'owner': task.owner.username,
+                             'timestamp': task.timestamp.isoformat()})
+
+def import_file(path, fmt):
+    with open(path, newline='', encoding='utf-8') as stream:
+        return import_tasks(stream, fmt).as_dict()
+
+# Runs `step` twice: once for the wall time, once under tracemalloc for the peak memory.
+# `reset` restores the starting state between the two runs.
+def measure(step, rows, reset=None, trace_memory=True):
+    started = time.perf_counter()
+    outcome = step()
+    seconds = time.perf_counter() - started
+    result = {'seconds': round(seconds, 2), 'rows_per_second': round(rows / seconds)}
+    if trace_memory:
+        if reset:
+            reset()
+        tracemalloc.start()
+        step()
+        result['peak_memory_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    if isinstance(outcome, dict):
+        result['outcome'] = outcome
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=1000000)
+    parser.add_argument('--share-density', type=float, default=0.001)
+    parser.add_argument('--batch-size', type=int, default=1000, help='EXPORT_BATCH_SIZE and IMPORT_BATCH_SIZE.')
+    parser.add_argument('--baseline', action='store_true', help='Also time the export without streaming.')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc runs.')
+    args = parser.parse_args()
+    trace_memory = not args.no_memory
+    settings = dict(EXPORT_BATCH_SIZE=args.batch_size, IMPORT_BATCH_SIZE=args.batch_size, TASK_EVENTS_ENABLED=False)
+    report = {'tasks': args.tasks, 'users': args.users, 'batch_size': args.batch_size}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = create_app(make_config(os.path.join(tmp, 'source.db'), **settings))
+        with source.app_context():
+            report['seed'] = seed(args.users, args.tasks, args.share_density, random.Random(1), password_hash='x')
+            for fmt in ('csv', 'ndjson'):
+                path = os.path.join(tmp, f'tasks.{fmt}')
+                report[f'export_{fmt}'] = measure(lambda: export_file(path, fmt), args.tasks, trace_memory=trace_memory)
+                report[f'export_{fmt}']['megabytes'] = round(os.path.getsize(path) / 2 ** 20, 1)
+            if args.baseline:
+                path = os.path.join(tmp, 'unbatched.csv')
+                report['export_csv_unbatched'] = measure(
+                    lambda: export_file_unbatched(path), args.tasks, trace_memory=trace_memory
+                )
+            db.session.remove()
+            db.engine.dispose()
+
+        for fmt in ('csv', 'ndjson'):
+            target = create_app(make_config(os.path.join(tmp, f'target-{fmt}.db'), **settings))
+            with target.app_context():
+                seed(args.users, 0, password_hash='x')
+                def reset():
+                    db.session.execute(db.delete(Permission))
+                    db.session.execute(db.delete(Task))
+                    db.session.commit()
+                path = os.path.join(tmp, f'tasks.{fmt}')
+                report[f'import_{fmt}'] = measure(lambda: import_file(path, fmt), args.tasks, reset, trace_memory)
+                db.session.remove()
+                db.engine.dispose()
+                password_hasher.shutdown()
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
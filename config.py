@@ -0,0 +1,79 @@
+import os
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    return value.lower() in ('1', 'true', 'yes', 'on') if value not in (None, '') else default
+
+def database_uri():
+    uri = os.getenv('SQLALCHEMY_DATABASE_URI') or os.getenv('DATABASE_URL')
+    # Some hosts hand out postgres:// URLs, which SQLAlchemy no longer accepts
+    if uri and uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+# Base configuration, read from the environment (and .env). Select a class with APP_CONFIG,
+# e.g. APP_CONFIG=config.ProductionConfig; create_app defaults to config.Config.
+class Config:
+    SECRET_KEY = os.getenv('SECRET_KEY')
+    SQLALCHEMY_DATABASE_URI = database_uri()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Create missing tables on every startup. Turn off to leave the schema to `flask db upgrade`
+    # or `flask init-db`, which keeps the database out of worker startup.
+    AUTO_CREATE_TABLES = env_bool('AUTO_CREATE_TABLES', True)
+
+    # Connection pool for server databases (PostgreSQL, MySQL); not used for SQLite
+    DB_POOL_SIZE = env_int('DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 20)
+    DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 30)
+    DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+    DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+
+    # Pragmas applied to every SQLite connection
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_MMAP_SIZE = env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+
+    # Databases to spread tasks and their shares over by owner (see app/sharding.py), comma separated
+    TASK_SHARDS = os.getenv('TASK_SHARDS')
+
+    # Buffer task status changes and write them in batches (see app/writebehind.py)
+    STATUS_WRITE_BEHIND = env_bool('STATUS_WRITE_BEHIND', False)
+    STATUS_WRITE_ACK = os.getenv('STATUS_WRITE_ACK', 'flushed')
+
+    # How the task page follows changes made by others: 'poll', 'stream' (a server thread per open page) or 'off'
+    LIVE_UPDATES = os.getenv('LIVE_UPDATES', 'poll')
+    FEED_CLIENT_POLL_INTERVAL = env_int('FEED_CLIENT_POLL_INTERVAL', 10)
+
+    # Token bucket limits on login, registration, form posts and API writes (see app/ratelimit.py)
+    RATELIMIT_ENABLED = env_bool('RATELIMIT_ENABLED', True)
+    RATELIMIT_BACKEND = os.getenv('RATELIMIT_BACKEND', 'memory')
+    RATELIMIT_REDIS_URL = os.getenv('RATELIMIT_REDIS_URL')
+
+    # Compiled templates shared by every worker on the host, relative to the instance folder unless
+    # absolute (set it empty to compile in memory only)
+    JINJA_BYTECODE_CACHE_DIR = os.getenv('JINJA_BYTECODE_CACHE_DIR', 'jinja')
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+class ProductionConfig(Config):
+    DEBUG = False
+    AUTO_CREATE_TABLES = env_bool('AUTO_CREATE_TABLES', False)
+
+class TestConfig:
+    SECRET_KEY = 'test'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    TESTING = True
+    AUTO_CREATE_TABLES = False # The fixtures create the tables
+    # Cheap hashes on the request thread keep the suite fast; the hashing tests turn the pool on
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:2000'
+    PASSWORD_HASH_WORKERS = 0
+    JOB_WORKERS = 0 # Tests run queued jobs explicitly with job_queue.run_pending()
+    RATELIMIT_ENABLED = False # Every test logs in from the same address; the rate limit tests turn it on
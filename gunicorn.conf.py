@@ -0,0 +1,64 @@
+# Gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+# Every setting can be overridden with the environment variable next to it.
+import multiprocessing
+import os
+
+def env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# One process per core plus one, each with a small thread pool: processes use every core,
+# threads overlap the time requests spend waiting on the database
+workers = env_int('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1)
+threads = env_int('GUNICORN_THREADS', 4)
+worker_class = 'gthread'
+
+# Build the app (and run the db.create_all() check) once in the master, then fork the workers
+preload_app = os.getenv('GUNICORN_PRELOAD', '1').lower() not in ('0', 'false', 'no', 'off')
+
+# Replace each worker after about this many requests (jittered so they do not restart together),
+# letting it finish in-flight requests for up to graceful_timeout seconds
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+graceful_timeout = env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+timeout = env_int('GUNICORN_TIMEOUT', 60)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# With the app preloaded, the master writes the precompressed static files and compiles the
+# templates into the bytecode cache before forking (`flask build-assets` does the same)
+def on_starting(server):
+    if server.cfg.preload_app and os.getenv('GUNICORN_BUILD_ASSETS', '1').lower() not in ('0', 'false', 'no', 'off'):
+        from wsgi import app
+        from app.delivery import build_assets
+        build_assets(app)
+
+# Connections opened in the master must not be shared with the forked workers. Each worker
+# then starts its own background job threads (JOB_WORKERS), splits the cores with the other
+# workers' password hashing pools and, with several workers and CACHE_BACKEND=memory, turns
+# off the caches that only its own process could invalidate.
+def post_fork(server, worker):
+    from wsgi import app
+    from app import job_queue, password_hasher
+    from app.cache import disable_process_caches
+    if server.cfg.preload_app:
+        from app.database import dispose_engines
+        dispose_engines(app)
+    password_hasher.share_host(app, server.cfg.workers)
+    disabled = disable_process_caches(app, server.cfg.workers)
+    if disabled:
+        server.log.warning('%d workers with CACHE_BACKEND=memory: turned off %s; set CACHE_BACKEND=redis to keep them.',
+                           server.cfg.workers, ', '.join(disabled))
+    job_queue.start(app)
+
+def worker_exit(server, worker):
+    from wsgi import app
+    from app import password_hasher, job_queue, status_writes
+    with app.app_context():
+        job_queue.shutdown(timeout=graceful_timeout) # Lets the running jobs finish
+        status_writes.shutdown(timeout=graceful_timeout) # Writes the buffered status changes
+        password_hasher.shutdown()
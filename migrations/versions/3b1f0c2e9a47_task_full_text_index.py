@@ -0,0 +1,53 @@
+"""task full-text index
+
+Revision ID: 3b1f0c2e9a47
+Revises: d834a25721b4
+Create Date: 2026-10-17 19:05:41.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1f0c2e9a47'
+down_revision = 'd834a25721b4'
+branch_labels = None
+depends_on = None
+
+# Same DDL as app/search.py, which creates it for databases built with db.create_all()
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS task_fts USING fts5("
+    "title, description, content='task', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ad AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_au AFTER UPDATE OF title, description ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO task_fts(task_fts) VALUES ('rebuild')", # Index the tasks that already exist
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS task_fts_ai",
+    "DROP TRIGGER IF EXISTS task_fts_ad",
+    "DROP TRIGGER IF EXISTS task_fts_au",
+    "DROP TABLE IF EXISTS task_fts",
+]
+POSTGRES_UPGRADE = [
+    "CREATE INDEX IF NOT EXISTS ix_task_fts ON task USING gin "
+    "(to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '')))",
+]
+POSTGRES_DOWNGRADE = ["DROP INDEX IF EXISTS ix_task_fts"]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE}.get(dialect, []):
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE}.get(dialect, []):
+        op.execute(statement)
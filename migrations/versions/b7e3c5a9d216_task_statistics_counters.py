@@ -0,0 +1,149 @@
+"""task statistics counters
+
+Revision ID: b7e3c5a9d216
+Revises: 8d4a6f1e2c93
+Create Date: 2026-10-18 09:41:27.503611
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c5a9d216'
+down_revision = '8d4a6f1e2c93'
+branch_labels = None
+depends_on = None
+
+# Same DDL as app/stats.py, which creates it for databases built with db.create_all()
+SQLITE_UPGRADE = [
+    "CREATE TRIGGER IF NOT EXISTS task_stats_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_status_count(user_id, status, count) VALUES (new.user_id, new.status, 1) "
+    "ON CONFLICT(user_id, status) DO UPDATE SET count = count + 1; "
+    "INSERT INTO task_daily_count(day, count) SELECT date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL "
+    "ON CONFLICT(day) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS task_stats_ad AFTER DELETE ON task BEGIN "
+    "UPDATE task_status_count SET count = count - 1 WHERE user_id = old.user_id AND status = old.status; "
+    "UPDATE task_daily_count SET count = count - 1 WHERE day = date(old.timestamp); "
+    "DELETE FROM task_share_count WHERE task_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS task_stats_au AFTER UPDATE OF user_id, status, timestamp ON task "
+    "WHEN old.user_id IS NOT new.user_id OR old.status IS NOT new.status OR old.timestamp IS NOT new.timestamp BEGIN "
+    "UPDATE task_status_count SET count = count - 1 WHERE user_id = old.user_id AND status = old.status; "
+    "UPDATE task_daily_count SET count = count - 1 WHERE day = date(old.timestamp); "
+    "INSERT INTO task_status_count(user_id, status, count) VALUES (new.user_id, new.status, 1) "
+    "ON CONFLICT(user_id, status) DO UPDATE SET count = count + 1; "
+    "INSERT INTO task_daily_count(day, count) SELECT date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL "
+    "ON CONFLICT(day) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS permission_stats_ai AFTER INSERT ON permission WHEN new.can_view BEGIN "
+    "INSERT INTO task_share_count(task_id, count) VALUES (new.task_id, 1) "
+    "ON CONFLICT(task_id) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS permission_stats_ad AFTER DELETE ON permission WHEN old.can_view BEGIN "
+    "UPDATE task_share_count SET count = count - 1 WHERE task_id = old.task_id; END",
+    "CREATE TRIGGER IF NOT EXISTS permission_stats_au AFTER UPDATE OF task_id, can_view ON permission "
+    "WHEN old.task_id IS NOT new.task_id OR old.can_view IS NOT new.can_view BEGIN "
+    "UPDATE task_share_count SET count = count - 1 WHERE task_id = old.task_id AND old.can_view; "
+    "INSERT INTO task_share_count(task_id, count) SELECT new.task_id, 1 WHERE new.can_view "
+    "ON CONFLICT(task_id) DO UPDATE SET count = count + 1; END",
+    # Count the tasks and shares that already exist
+    "INSERT INTO task_status_count(user_id, status, count) SELECT user_id, status, count(*) FROM task GROUP BY user_id, status",
+    "INSERT INTO task_daily_count(day, count) "
+    "SELECT date(timestamp), count(*) FROM task WHERE timestamp IS NOT NULL GROUP BY date(timestamp)",
+    "INSERT INTO task_share_count(task_id, count) SELECT task_id, count(*) FROM permission WHERE can_view GROUP BY task_id",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS task_stats_ai",
+    "DROP TRIGGER IF EXISTS task_stats_ad",
+    "DROP TRIGGER IF EXISTS task_stats_au",
+    "DROP TRIGGER IF EXISTS permission_stats_ai",
+    "DROP TRIGGER IF EXISTS permission_stats_ad",
+    "DROP TRIGGER IF EXISTS permission_stats_au",
+]
+POSTGRES_UPGRADE = [
+    """CREATE OR REPLACE FUNCTION task_stats() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE task_status_count SET count = count - 1 WHERE user_id = OLD.user_id AND status = OLD.status::text;
+        UPDATE task_daily_count SET count = count - 1 WHERE day = OLD."timestamp"::date;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM task_share_count WHERE task_id = OLD.id;
+        RETURN NULL;
+    END IF;
+    INSERT INTO task_status_count AS c (user_id, status, count) VALUES (NEW.user_id, NEW.status::text, 1)
+        ON CONFLICT (user_id, status) DO UPDATE SET count = c.count + 1;
+    IF NEW."timestamp" IS NOT NULL THEN
+        INSERT INTO task_daily_count AS c (day, count) VALUES (NEW."timestamp"::date, 1)
+            ON CONFLICT (day) DO UPDATE SET count = c.count + 1;
+    END IF;
+    RETURN NULL;
+END $$""",
+    """CREATE OR REPLACE FUNCTION permission_stats() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.can_view THEN
+        UPDATE task_share_count SET count = count - 1 WHERE task_id = OLD.task_id;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.can_view THEN
+        INSERT INTO task_share_count AS c (task_id, count) VALUES (NEW.task_id, 1)
+            ON CONFLICT (task_id) DO UPDATE SET count = c.count + 1;
+    END IF;
+    RETURN NULL;
+END $$""",
+    "LOCK TABLE task, permission IN SHARE MODE", # No writes between the backfill and the triggers
+    "DROP TRIGGER IF EXISTS task_stats ON task",
+    "CREATE TRIGGER task_stats AFTER INSERT OR DELETE OR UPDATE OF user_id, status, timestamp ON task "
+    "FOR EACH ROW EXECUTE FUNCTION task_stats()",
+    "DROP TRIGGER IF EXISTS permission_stats ON permission",
+    "CREATE TRIGGER permission_stats AFTER INSERT OR DELETE OR UPDATE OF task_id, can_view ON permission "
+    "FOR EACH ROW EXECUTE FUNCTION permission_stats()",
+    "INSERT INTO task_status_count(user_id, status, count) SELECT user_id, status::text, count(*) FROM task GROUP BY user_id, status",
+    "INSERT INTO task_daily_count(day, count) "
+    "SELECT \"timestamp\"::date, count(*) FROM task WHERE \"timestamp\" IS NOT NULL GROUP BY \"timestamp\"::date",
+    "INSERT INTO task_share_count(task_id, count) SELECT task_id, count(*) FROM permission WHERE can_view GROUP BY task_id",
+]
+POSTGRES_DOWNGRADE = [
+    "DROP FUNCTION IF EXISTS task_stats() CASCADE",
+    "DROP FUNCTION IF EXISTS permission_stats() CASCADE",
+]
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('task_daily_count',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day')
+    )
+    op.create_table('task_share_count',
+    sa.Column('task_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('task_id')
+    )
+    with op.batch_alter_table('task_share_count', schema=None) as batch_op:
+        batch_op.create_index('ix_task_share_count_count_task_id', ['count', 'task_id'], unique=False)
+
+    op.create_table('task_status_count',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('user_id', 'status')
+    )
+    # ### end Alembic commands ###
+
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE}.get(dialect, []):
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE}.get(dialect, []):
+        op.execute(statement)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('task_status_count')
+    with op.batch_alter_table('task_share_count', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_share_count_count_task_id')
+
+    op.drop_table('task_share_count')
+    op.drop_table('task_daily_count')
+    # ### end Alembic commands ###
@@ -0,0 +1,67 @@
+"""task timestamp not null
+
+Revision ID: c6e1f7a93b25
+Revises: a2d5e8f41c07
+Create Date: 2026-10-20 10:16:48.302517
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6e1f7a93b25'
+down_revision = 'a2d5e8f41c07'
+branch_labels = None
+depends_on = None
+
+# Keyset pagination orders by (timestamp, id), so rows without a timestamp get the migration time.
+# On SQLite the batch operation rebuilds the task table, which drops its triggers: the full-text
+# and statistics triggers (copies of app/search.py and app/stats.py) are created again.
+SQLITE_TASK_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_ad AFTER DELETE ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_fts_au AFTER UPDATE OF title, description ON task BEGIN "
+    "INSERT INTO task_fts(task_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO task_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS task_stats_ai AFTER INSERT ON task BEGIN "
+    "INSERT INTO task_status_count(user_id, status, count) VALUES (new.user_id, new.status, 1) "
+    "ON CONFLICT(user_id, status) DO UPDATE SET count = count + 1; "
+    "INSERT INTO task_daily_count(day, count) SELECT date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL "
+    "ON CONFLICT(day) DO UPDATE SET count = count + 1; END",
+    "CREATE TRIGGER IF NOT EXISTS task_stats_ad AFTER DELETE ON task BEGIN "
+    "UPDATE task_status_count SET count = count - 1 WHERE user_id = old.user_id AND status = old.status; "
+    "UPDATE task_daily_count SET count = count - 1 WHERE day = date(old.timestamp); "
+    "DELETE FROM task_share_count WHERE task_id = old.id; END",
+    "CREATE TRIGGER IF NOT EXISTS task_stats_au AFTER UPDATE OF user_id, status, timestamp ON task "
+    "WHEN old.user_id IS NOT new.user_id OR old.status IS NOT new.status OR old.timestamp IS NOT new.timestamp BEGIN "
+    "UPDATE task_status_count SET count = count - 1 WHERE user_id = old.user_id AND status = old.status; "
+    "UPDATE task_daily_count SET count = count - 1 WHERE day = date(old.timestamp); "
+    "INSERT INTO task_status_count(user_id, status, count) VALUES (new.user_id, new.status, 1) "
+    "ON CONFLICT(user_id, status) DO UPDATE SET count = count + 1; "
+    "INSERT INTO task_daily_count(day, count) SELECT date(new.timestamp), 1 WHERE new.timestamp IS NOT NULL "
+    "ON CONFLICT(day) DO UPDATE SET count = count + 1; END",
+]
+
+
+def set_timestamp_nullable(nullable):
+    for table in ('task', 'archived_task'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('timestamp', existing_type=sa.DateTime(), nullable=nullable)
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in SQLITE_TASK_TRIGGERS:
+            op.execute(statement)
+
+
+def upgrade():
+    now = sa.bindparam('now', datetime.utcnow(), type_=sa.DateTime())
+    for table in ('task', 'archived_task'):
+        op.execute(sa.text(f'UPDATE {table} SET timestamp = :now WHERE timestamp IS NULL').bindparams(now))
+    set_timestamp_nullable(False)
+
+
+def downgrade():
+    set_timestamp_nullable(True)
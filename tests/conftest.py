@@ -1,5 +1,8 @@
 import pytest
-from app import create_app, db
+from contextlib import contextmanager
+from flask import g
+from sqlalchemy import event
+from app import create_app, db, password_hasher
 from app.models import User, Task
 
 @pytest.fixture(scope='function')
@@ -7,11 +10,19 @@ def app():
     app = create_app('config.TestConfig')
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     app.config['TESTING'] = True
+
+    # The fixture keeps one app context alive across requests, so Flask-Login would keep
+    # the user memoized on `g`; drop it after each request as a fresh context would.
+    @app.teardown_request
+    def forget_login_user(exc):
+        g.pop('_login_user', None)
+
     with app.app_context():
         db.create_all()
         yield app
         db.session.remove()
         db.drop_all()
+        password_hasher.shutdown()
 
 @pytest.fixture(scope='function')
 def client(app):
@@ -37,4 +48,29 @@ def logged_in_user(client, init_database):
 def logged_in_admin(client, init_database):
     _, admin, _ = init_database
     client.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
-    return admin
\ No newline at end of file
+    return admin
+
+@pytest.fixture(scope='function')
+def count_queries(app):
+    # Usage: `with count_queries() as queries: ...` then check len(queries)
+    @contextmanager
+    def counter():
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    return counter
+
+@pytest.fixture(scope='function')
+def fake_redis(monkeypatch):
+    # Every redis client the app creates talks to one in-process server, as every worker of a
+    # deployment would talk to the same Redis
+    fakeredis = pytest.importorskip('fakeredis')
+    import redis
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', lambda url, **kwargs: fakeredis.FakeRedis(server=server))
+    return server
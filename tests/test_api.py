@@ -0,0 +1,87 @@
+from app import db
+from app.models import User, Task, Permission, TaskStatus
+
+def test_api_requires_login(client):
+    response = client.get('/api/v1/tasks')
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Unauthorized'}
+
+def test_batch_create_and_list(logged_in_user, client):
+    response = client.post('/api/v1/tasks/batch', json={'tasks': [
+        {'title': f'Bulk {i}', 'description': 'via API'} for i in range(25)
+    ]})
+    assert response.status_code == 201
+    created = response.get_json()['created']
+    assert len(created) == 25
+    assert Task.query.filter(Task.id.in_(created), Task.user_id == logged_in_user.id).count() == 25
+
+    listing = client.get('/api/v1/tasks?per_page=10').get_json()
+    assert len(listing['tasks']) == 10
+    assert listing['next']
+
+def test_batch_create_rejects_invalid_rows(logged_in_user, client):
+    response = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'ok'}, {'title': ''}]})
+    assert response.status_code == 400
+    assert Task.query.filter_by(title='ok').count() == 0
+
+    response = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'ok'}, {'title': 'bad', 'description': {'a': 1}}]})
+    assert response.status_code == 400
+    assert 'description' in response.get_json()['error']
+    assert Task.query.filter_by(title='ok').count() == 0
+
+def test_batch_status_update(logged_in_user, client):
+    created = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'a'}, {'title': 'b'}]}).get_json()['created']
+    response = client.patch('/api/v1/tasks/status', json={'ids': created, 'status': 'COMPLETED'})
+    assert response.get_json() == {'updated': 2}
+    db.session.expire_all()
+    assert {task.status for task in Task.query.filter(Task.id.in_(created))} == {TaskStatus.COMPLETED}
+
+def test_batch_rejected_as_a_whole_when_any_task_is_not_owned(logged_in_user, client):
+    other = User(username='other', password='otherpassword')
+    db.session.add(other)
+    db.session.commit()
+    foreign = Task(title='Not yours', user_id=other.id)
+    db.session.add(foreign)
+    db.session.commit()
+    own = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'mine'}]}).get_json()['created']
+
+    response = client.patch('/api/v1/tasks/status', json={'ids': own + [foreign.id], 'status': 'COMPLETED'})
+    assert response.status_code == 403
+    assert response.get_json()['ids'] == [foreign.id]
+    db.session.expire_all()
+    assert db.session.get(Task, own[0]).status == TaskStatus.NOT_STARTED
+
+def test_batch_delete_removes_permissions(logged_in_user, client, init_database):
+    _, admin, task = init_database
+    db.session.add(Permission(user_id=admin.id, task_id=task.id, can_view=True))
+    db.session.commit()
+
+    response = client.delete('/api/v1/tasks', json={'ids': [task.id]})
+    assert response.get_json() == {'deleted': 1}
+    assert db.session.get(Task, task.id) is None
+    assert Permission.query.filter_by(task_id=task.id).count() == 0
+
+def test_batch_size_is_limited(logged_in_user, client, app):
+    app.config['API_MAX_BATCH'] = 3
+    response = client.delete('/api/v1/tasks', json={'ids': [1, 2, 3, 4]})
+    assert response.status_code == 413
+
+def test_list_hides_status_of_tasks_shared_without_it(client, init_database):
+    user, _, task = init_database
+    other = User(username='other', password='otherpassword')
+    db.session.add(other)
+    db.session.commit()
+    hidden = Task(title='Hidden status', user_id=user.id, status=TaskStatus.COMPLETED)
+    db.session.add(hidden)
+    db.session.commit()
+    db.session.add_all([
+        Permission(user_id=other.id, task_id=task.id, can_view=True, can_view_status=True),
+        Permission(user_id=other.id, task_id=hidden.id, can_view=True, can_view_status=False),
+    ])
+    db.session.commit()
+    client.post('/login', data={'username': 'other', 'password': 'otherpassword'})
+
+    for url in ('/api/v1/tasks', '/api/v1/tasks?include_archived=1'):
+        listed = {item['id']: item for item in client.get(url).get_json()['tasks']}
+        assert listed[task.id]['status'] == 'NOT_STARTED'
+        assert 'status' not in listed[hidden.id]
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+from app import db, job_queue
+from app.archive import archive_tasks, restore_tasks
+from app.models import User, Task, Permission, TaskStatus, ArchivedTask, ArchivedPermission, TaskEvent, TaskStatusCount
+
+def old_tasks(user, count, days=200, status=TaskStatus.COMPLETED):
+    tasks = [
+        Task(title=f'Old {number}', user_id=user.id, status=status, timestamp=datetime.utcnow() - timedelta(days=days, minutes=number))
+        for number in range(count)
+    ]
+    db.session.add_all(tasks)
+    db.session.commit()
+    return tasks
+
+def test_archive_moves_old_tasks_in_batches_and_restores_them(app, init_database, count_queries):
+    user, admin, task = init_database
+    archived = old_tasks(user, 5)
+    kept = old_tasks(user, 1, status=TaskStatus.IN_PROGRESS) + old_tasks(user, 1, days=10)
+    db.session.add(Permission(user_id=admin.id, task_id=archived[0].id, can_view=True, can_view_status=False))
+    db.session.commit()
+    archived_ids = [t.id for t in archived]
+    app.config['ARCHIVE_AFTER_DAYS'] = 90
+
+    with count_queries() as queries:
+        assert archive_tasks(batch_size=2) == {'tasks': 5, 'permissions': 1}
+    assert sum(statement.startswith('DELETE FROM task ') for statement in queries) == 3
+    db.session.expire_all()
+    assert {t.id for t in Task.query} == {task.id} | {t.id for t in kept}
+    assert Permission.query.count() == 0
+    assert sorted(t.id for t in ArchivedTask.query) == archived_ids
+    share = ArchivedPermission.query.one()
+    assert (share.user_id, share.task_id, share.can_view_status) == (admin.id, archived_ids[0], False)
+    assert db.session.get(TaskStatusCount, (user.id, 'COMPLETED')).count == 1 # Counters cover live tasks only
+    assert TaskEvent.query.filter_by(user_id=admin.id, task_id=archived_ids[0]).count() == 1 # Gone for the audience
+
+    # With the tasks above it deleted, SQLite hands an archived id out again: that task comes back
+    # under a new id, the others keep theirs
+    db.session.execute(db.delete(Task).where(Task.id.in_([t.id for t in kept])))
+    db.session.commit()
+    newer = Task(title='Newer', user_id=user.id)
+    db.session.add(newer)
+    db.session.commit()
+    assert newer.id == archived_ids[0]
+
+    restored = restore_tasks([archived_ids[0], archived_ids[-1]])
+    assert restored == {archived_ids[0]: archived_ids[-1] + 1, archived_ids[-1]: archived_ids[-1]}
+    db.session.expire_all()
+    assert db.session.get(Task, archived_ids[0]).title == 'Newer'
+    moved = db.session.get(Task, archived_ids[-1] + 1)
+    assert moved.title == 'Old 0' and moved.status == TaskStatus.COMPLETED
+    assert Permission.query.filter_by(task_id=moved.id, user_id=admin.id).one().can_view_status is False
+    assert ArchivedTask.query.count() == 3 and ArchivedPermission.query.count() == 0
+
+def test_archive_routes_and_job(client, logged_in_user, init_database):
+    user, admin, task = init_database
+    old = [t.id for t in old_tasks(user, 2)]
+    db.session.add_all([Task(title='Newest', user_id=user.id), User(username='other', password='otherpassword')])
+    db.session.commit()
+    archive_tasks()
+
+    response = client.get('/tasks/archived')
+    assert b'Old 0' in response.data and b'Old 1' in response.data
+    assert b'Old 0' not in client.get('/tasks').data
+    assert client.post(f'/task/restore/{old[0]}', follow_redirects=True).status_code == 200
+    assert db.session.get(Task, old[0]) is not None
+
+    client.get('/logout')
+    client.post('/login', data={'username': 'other', 'password': 'otherpassword'})
+    assert b'Old 1' not in client.get('/tasks/archived').data
+    response = client.post(f'/task/restore/{old[1]}', follow_redirects=True)
+    assert b'You do not have permission to restore this task.' in response.data
+    assert db.session.get(ArchivedTask, old[1]) is not None
+
+    # Admins archive through a background job
+    client.get('/logout')
+    client.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
+    assert b'being archived' in client.post('/admin/archive', follow_redirects=True).data
+    assert job_queue.run_pending() == 1
+    assert db.session.get(ArchivedTask, old[0]) is not None
+
+def test_api_lists_archived_tasks_on_request(client, logged_in_user, init_database):
+    user, admin, task = init_database
+    old = [t.id for t in old_tasks(user, 3)]
+    live = [t.id for t in old_tasks(user, 2, days=199, status=TaskStatus.IN_PROGRESS)]
+    archive_tasks()
+    client.application.config['TASKS_PER_PAGE'] = 2
+
+    listed = client.get('/api/v1/tasks?per_page=10').get_json()['tasks']
+    assert [item['id'] for item in listed] == [task.id] + live
+    items, after = [], ''
+    while True:
+        body = client.get(f'/api/v1/tasks?include_archived=1&after={after}').get_json()
+        items += body['tasks']
+        after = body['next']
+        if not after:
+            break
+    assert [item['id'] for item in items] == [task.id] + live + old
+    assert [item['archived'] for item in items] == [False] * 3 + [True] * 3
+
+    response = client.post('/api/v1/tasks/restore', json={'ids': [old[0], task.id]})
+    assert response.status_code == 403 and response.get_json()['ids'] == [task.id]
+    assert client.post('/api/v1/tasks/restore', json={'ids': [old[0]]}).get_json() == {'restored': {str(old[0]): old[0]}}
@@ -0,0 +1,101 @@
+from app import db, access_control, job_queue
+from app.models import User, Task, Permission
+
+def test_rules_answered_in_one_query_per_request(app, init_database, count_queries):
+    user, admin, task = init_database
+    other = User(username='other', password='x')
+    db.session.add(other)
+    db.session.commit()
+    shared = Task(title='Shared', user_id=other.id)
+    hidden = Task(title='Status hidden', user_id=other.id)
+    db.session.add_all([shared, hidden])
+    db.session.commit()
+    db.session.add_all([
+        Permission(user_id=user.id, task_id=shared.id, can_view=True, can_view_status=True),
+        Permission(user_id=user.id, task_id=hidden.id, can_view=True, can_view_status=False),
+    ])
+    db.session.commit()
+    ids = [task.id, shared.id, hidden.id, 999]
+    user.id # Reloaded after the commits, outside the counted block
+
+    with app.test_request_context(), count_queries() as queries:
+        allowed = access_control.permissions(user, ids)
+        access_control.can(user, 'edit', ids) # Served from the request's memo
+    assert len(queries) == 1
+    assert allowed['view'] == {task.id: True, shared.id: True, hidden.id: True, 999: False}
+    assert allowed['view_status'] == {task.id: True, shared.id: True, hidden.id: False, 999: False}
+    for action in ('update_status', 'edit', 'share', 'delete'):
+        assert {i for i, ok in allowed[action].items() if ok} == {task.id}
+
+    with app.test_request_context():
+        assert access_control.allowed(admin, 'edit', ids) == {task.id, shared.id, hidden.id}
+        assert access_control.allowed(admin, 'update_status', ids) == set() # Only owners change status
+        assert access_control.allowed(admin, 'view_status', ids) == {task.id, shared.id, hidden.id}
+
+def test_routes_and_list_follow_the_rules(client, init_database):
+    user, admin, task = init_database
+    db.session.add(Permission(user_id=admin.id, task_id=task.id, can_view=True, can_view_status=True))
+    db.session.commit()
+
+    client.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
+    page = client.get('/tasks').get_data(as_text=True)
+    assert 'Status: Not Started' in page and 'name="status"' not in page # Admins see the status but cannot set it
+    assert f'/task/edit/{task.id}' in page
+    client.post(f'/task/update_status/{task.id}', data={'status': 'COMPLETED'})
+    client.post(f'/task/edit/{task.id}', data={'title': 'Renamed by admin', 'description': ''})
+    db.session.expire_all()
+    assert task.title == 'Renamed by admin' and task.status.name == 'NOT_STARTED'
+
+    client.get('/logout')
+    client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    client.post(f'/task/update_status/{task.id}', data={'status': 'COMPLETED'})
+    db.session.expire_all()
+    assert task.status.name == 'COMPLETED'
+    client.post(f'/task/delete/{task.id}')
+    assert db.session.get(Task, task.id) is None
+
+def test_access_index_follows_shares_and_deletes(app, client, init_database, count_queries):
+    user, admin, task = init_database
+    app.extensions['access_index']['enabled'] = True
+    other = User(username='other', password='x')
+    db.session.add(other)
+    db.session.commit()
+
+    with app.test_request_context():
+        assert access_control.can(other, 'view', [task.id]) == {task.id: False}
+    with app.test_request_context(), count_queries() as queries:
+        assert access_control.can(other, 'view', [task.id]) == {task.id: False}
+    assert queries == [] # A new request, answered from the index
+
+    client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    client.post(f'/task/share/{task.id}', data={'username': 'other'})
+    with app.test_request_context():
+        assert access_control.can(other, 'view', [task.id]) == {task.id: True}
+
+    client.post(f'/admin/delete_user/{other.id}') # Not an admin: refused
+    client.get('/logout')
+    client.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
+    client.post(f'/admin/delete_user/{other.id}')
+    job_queue.run_pending()
+    assert access_control.stats()['size'] == 0 # The user's shares were dropped from the index
+
+def test_view_condition_matches_the_view_rule(app, init_database):
+    user, admin, task = init_database
+    other = User(username='other', password='x')
+    db.session.add(other)
+    db.session.commit()
+    tasks = [Task(title=f'Task {number}', user_id=other.id) for number in range(3)]
+    db.session.add_all(tasks)
+    db.session.commit()
+    db.session.add_all([
+        Permission(user_id=user.id, task_id=tasks[0].id, can_view=True),
+        Permission(user_id=user.id, task_id=tasks[1].id, can_view=False, can_view_status=True),
+    ])
+    db.session.commit()
+    ids = [task.id] + [t.id for t in tasks]
+
+    with app.test_request_context():
+        for viewer in (user, admin, other):
+            condition = access_control.view_condition(viewer, Task, Permission)
+            query = Task.query if condition is None else Task.query.filter(condition)
+            assert {t.id for t in query} == access_control.allowed(viewer, 'view', ids)
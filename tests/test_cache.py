@@ -0,0 +1,121 @@
+import time
+import pytest
+from flask import g
+from app import create_app, db, password_hasher, user_cache, task_list_cache
+from app.cache import LRUCache, RedisCache, disable_process_caches
+from app.models import User
+from app.signals import notify_tasks_changed
+from config import TestConfig
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+    assert len(cache) == 2
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+def test_user_loader_skips_query_on_hit(logged_in_user, client, count_queries):
+    client.get('/tasks') # Warm the cache
+    db.session.expire_all()
+    with count_queries() as queries:
+        client.get('/tasks')
+    assert not any('FROM user \nWHERE user.id' in statement for statement in queries)
+    assert user_cache.stats()['hits'] >= 1
+
+def test_admin_revocation_applies_immediately(app, init_database):
+    user, admin, _ = init_database
+    user.is_admin = True
+    db.session.commit()
+
+    user_client = app.test_client()
+    user_client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    assert user_client.get('/admin/users').status_code == 200 # Now cached as an admin
+
+    admin_client = app.test_client()
+    admin_client.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
+    admin_client.post(f'/admin/toggle_admin/{user.id}')
+
+    assert user_client.get('/admin/users').status_code == 403
+
+def test_cache_stats_endpoint(logged_in_admin, client):
+    response = client.get('/admin/cache_stats')
+    assert response.status_code == 200
+    assert set(response.get_json()['user_cache']) >= {'hits', 'misses', 'backend'}
+
+def test_redis_cache_round_trips_json_and_clears_its_prefix(fake_redis):
+    users = RedisCache('redis://cache', prefix='user:', ttl=60)
+    lists = RedisCache('redis://cache', prefix='tasklist:', ttl=60)
+    users.set('1', {'id': 1, 'username': 'alice', 'is_admin': False})
+    lists.set('version:1', 'v1', ttl=5)
+    assert users.get('1') == {'id': 1, 'username': 'alice', 'is_admin': False}
+    assert 0 < users.client.ttl('user:1') <= 60 and 0 < lists.client.ttl('tasklist:version:1') <= 5
+
+    users.clear()
+    assert users.get('1') is None and lists.get('version:1') == 'v1'
+    lists.delete('version:1')
+    assert lists.get('version:1') is None
+
+# Two apps on one database and one Redis stand in for two worker processes
+@pytest.fixture
+def workers(tmp_path, fake_redis):
+    config = type('Config', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "app.db"}', 'CACHE_BACKEND': 'redis',
+    })
+    apps = [create_app(config), create_app(config)]
+    for app in apps:
+        app.teardown_request(lambda exc: g.pop('_login_user', None))
+    with apps[0].app_context():
+        db.create_all()
+        db.session.add_all([
+            User(username='alice', password='alicepassword', is_admin=True),
+            User(username='admin', password='adminpassword', is_admin=True),
+        ])
+        db.session.commit()
+        db.session.remove()
+    yield apps
+    for app in apps:
+        with app.app_context():
+            password_hasher.shutdown()
+
+def test_redis_backend_shares_invalidation_between_workers(workers):
+    first, second = workers
+    alice = first.test_client()
+    alice.post('/login', data={'username': 'alice', 'password': 'alicepassword'})
+    assert alice.get('/admin/users').status_code == 200 # Cached as an admin
+
+    # Revoked through the other worker: the next request anywhere sees it
+    admin = second.test_client()
+    admin.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
+    admin.post('/admin/toggle_admin/1')
+    assert alice.get('/admin/users').status_code == 403
+
+    # A task list version bumped by one worker is gone for the other as well
+    with first.app_context():
+        user = db.session.get(User, 1)
+        version = task_list_cache.version(user)
+        db.session.remove()
+    with second.app_context():
+        user = db.session.get(User, 1)
+        assert task_list_cache.version(user) == version
+        notify_tasks_changed({1})
+        db.session.remove()
+    with first.app_context():
+        assert task_list_cache.version(db.session.get(User, 1)) != version
+        db.session.remove()
+
+def test_memory_caches_are_turned_off_for_several_processes(app):
+    assert disable_process_caches(app, 1) == []
+    assert disable_process_caches(app, 4) == ['user_cache', 'task_list_cache']
+    assert not user_cache._state['enabled'] and not task_list_cache.enabled
+    app.config['CACHE_BACKEND'] = 'redis'
+    app.extensions['user_cache']['enabled'] = True
+    assert disable_process_caches(app, 4) == [] and user_cache._state['enabled']
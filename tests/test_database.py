@@ -0,0 +1,56 @@
+from sqlalchemy import inspect, text
+from app import create_app, db, password_hasher, init_migrate
+from app.database import configure_engine_options, sqlite_pragmas
+
+class FileConfig:
+    SECRET_KEY = 'test'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    PASSWORD_HASH_WORKERS = 0
+
+def test_sqlite_connections_get_pragmas(tmp_path):
+    FileConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "app.db"}'
+    app = create_app(FileConfig)
+    with app.app_context():
+        pragma = lambda name: db.session.execute(text(f'PRAGMA {name}')).scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1 # NORMAL
+        assert pragma('busy_timeout') == 5000
+        assert pragma('mmap_size') == 256 * 1024 * 1024
+        db.session.remove()
+        password_hasher.shutdown()
+
+def test_pragmas_can_be_turned_off(app):
+    app.config['SQLITE_JOURNAL_MODE'] = None
+    assert not any('journal_mode' in statement for statement in sqlite_pragmas(app))
+
+def test_server_databases_get_pool_options(app):
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://localhost/tasks'
+    app.config['DB_POOL_SIZE'] = 5
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_recycle': 60}
+    configure_engine_options(app)
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['pool_size'] == 5
+    assert options['max_overflow'] == 20
+    assert options['pool_pre_ping'] is True
+    assert options['pool_recycle'] == 60 # Explicit engine options win
+
+def test_sqlite_keeps_default_engine_options(app):
+    configure_engine_options(app)
+    assert 'pool_size' not in app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+
+def test_startup_leaves_schema_alone_when_asked(tmp_path):
+    FileConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "app.db"}'
+    FileConfig.AUTO_CREATE_TABLES = False
+    try:
+        app = create_app(FileConfig)
+    finally:
+        del FileConfig.AUTO_CREATE_TABLES
+    assert 'migrate' not in app.extensions # Only set up for the CLI
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+
+        init_migrate(app)
+        result = app.test_cli_runner().invoke(args=['init-db'])
+        assert 'Database initialized.' in result.output
+        assert {'user', 'task', 'permission', 'alembic_version'} <= set(inspect(db.engine).get_table_names())
+        db.engine.dispose()
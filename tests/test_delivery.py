@@ -0,0 +1,73 @@
+import gzip
+import os
+import shutil
+import stat
+from flask import url_for
+from app import create_app, db
+from app.delivery import precompress_static
+from app.models import Task
+
+def test_responses_compressed_above_threshold(logged_in_user, client, init_database):
+    db.session.add_all([Task(title=f'Task {n}', description='Some description ' * 5, user_id=logged_in_user.id) for n in range(20)])
+    db.session.commit()
+
+    plain = client.get('/tasks')
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+    response = client.get('/tasks', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == plain.data
+    assert int(response.headers['Content-Length']) < len(plain.data) / 3
+
+    client.application.config['EXPORT_BATCH_SIZE'] = 5
+    assert 'Content-Encoding' not in client.get('/api/v1/tasks/export', headers={'Accept-Encoding': 'gzip'}).headers # Streamed
+    response = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'x'}]}, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers # Below COMPRESS_MIN_SIZE
+
+def test_static_urls_hashed_and_precompressed(app, client, tmp_path):
+    shutil.copytree(app.static_folder, tmp_path, dirs_exist_ok=True)
+    app.static_folder = str(tmp_path)
+    with app.test_request_context():
+        url = url_for('static', filename='tasks.js')
+    assert url.startswith('/static/tasks.') and url.endswith('.js') and url != '/static/tasks.js'
+
+    response = client.get(url)
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert 'Content-Encoding' not in response.headers
+    plain = response.data
+    assert 'immutable' not in client.get('/static/tasks.000000000000.js').headers.get('Cache-Control', '')
+
+    assert precompress_static(str(tmp_path)) == ['tasks.js.gz'] # style.css is under the threshold
+    response = client.get(url, headers={'Accept-Encoding': 'br;q=1.0, gzip;q=0.5'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/javascript'
+    assert gzip.decompress(response.data) == plain
+    response.close()
+
+def test_template_bytecode_cache(tmp_path):
+    cached = create_app(type('Config', (), {
+        'SECRET_KEY': 'test', 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'AUTO_CREATE_TABLES': False,
+        'JINJA_BYTECODE_CACHE_DIR': str(tmp_path / 'jinja'),
+    }))
+    shutil.copytree(cached.static_folder, tmp_path / 'static')
+    cached.static_folder = str(tmp_path / 'static')
+    result = cached.test_cli_runner().invoke(args=['build-assets'])
+    assert result.exit_code == 0
+    compiled = len(cached.jinja_env.list_templates())
+    assert f'"templates_compiled": {compiled}' in result.output
+    assert len(list((tmp_path / 'jinja').glob('__jinja2_*.cache'))) == compiled
+
+def test_bytecode_cache_is_private_to_the_app_user(tmp_path):
+    def make(cache_dir):
+        return create_app(type('Config', (), {
+            'SECRET_KEY': 'test', 'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'AUTO_CREATE_TABLES': False,
+            'JINJA_BYTECODE_CACHE_DIR': str(cache_dir),
+        }))
+    private = tmp_path / 'private' / 'jinja'
+    assert make(private).jinja_env.bytecode_cache.directory == str(private)
+    assert stat.S_IMODE(os.stat(private).st_mode) == 0o700
+
+    # A directory others can write to is not trusted with compiled code
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+    assert make(shared).jinja_env.bytecode_cache is None
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import User, Permission, TaskEvent
+
+def share(app, init_database, can_view_status=True):
+    _, _, task = init_database
+    other = User(username='other', password='otherpassword')
+    db.session.add(other)
+    db.session.commit()
+    db.session.add(Permission(user_id=other.id, task_id=task.id, can_view=True, can_view_status=can_view_status))
+    db.session.commit()
+    owner_client = app.test_client()
+    owner_client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    other_client = app.test_client()
+    other_client.post('/login', data={'username': 'other', 'password': 'otherpassword'})
+    return task, owner_client, other_client
+
+def test_json_status_update_reaches_collaborators(app, init_database):
+    task, owner_client, other_client = share(app, init_database)
+    cursor = other_client.get('/api/v1/events').get_json()['cursor']
+
+    response = owner_client.patch(f'/api/v1/tasks/{task.id}/status', json={'status': 'COMPLETED'})
+    assert response.status_code == 204
+
+    feed = other_client.get(f'/api/v1/events?since={cursor}').get_json()
+    assert [event['type'] for event in feed['events']] == ['updated']
+    assert feed['events'][0]['task']['status'] == 'COMPLETED'
+    assert feed['cursor'] == feed['events'][0]['cursor'] > cursor
+    # Nothing new after the returned cursor
+    assert other_client.get(f'/api/v1/events?since={feed["cursor"]}').get_json()['events'] == []
+
+def test_feed_hides_status_without_permission(app, init_database):
+    task, owner_client, other_client = share(app, init_database, can_view_status=False)
+    owner_client.patch(f'/api/v1/tasks/{task.id}/status', json={'status': 'IN_PROGRESS'})
+    events = other_client.get('/api/v1/events?since=0').get_json()['events']
+    assert 'status' not in events[-1]['task']
+
+def test_deleted_task_is_reported_as_removed(app, init_database):
+    task, owner_client, other_client = share(app, init_database)
+    owner_client.post(f'/task/delete/{task.id}')
+    events = other_client.get('/api/v1/events?since=0').get_json()['events']
+    assert events[-1] == {'cursor': events[-1]['cursor'], 'type': 'removed', 'task_id': task.id}
+
+def test_bulk_delete_records_events_only_for_each_tasks_audience(app, logged_in_user, client):
+    others = [User(username=f'reader{n}', password='x') for n in range(3)]
+    db.session.add_all(others)
+    db.session.commit()
+    task_ids = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': str(n)} for n in range(3)]}).get_json()['created']
+    db.session.add_all(Permission(user_id=other.id, task_id=task_id) for other, task_id in zip(others, task_ids))
+    db.session.commit()
+    db.session.execute(db.delete(TaskEvent))
+    db.session.commit()
+
+    client.delete('/api/v1/tasks', json={'ids': task_ids})
+    events = set(db.session.execute(db.select(TaskEvent.user_id, TaskEvent.task_id)))
+    owner = logged_in_user.id
+    assert events == {(owner, task_id) for task_id in task_ids} | {(other.id, task_id) for other, task_id in zip(others, task_ids)}
+
+def test_json_status_update_requires_ownership(app, init_database):
+    task, _, other_client = share(app, init_database)
+    response = other_client.patch(f'/api/v1/tasks/{task.id}/status', json={'status': 'COMPLETED'})
+    assert response.status_code == 403
+
+def test_long_poll_times_out_without_changes(logged_in_user, client, app):
+    app.config['FEED_POLL_INTERVAL'] = 0.01
+    feed = client.get('/api/v1/events?since=0&wait=0.05').get_json()
+    assert feed == {'events': [], 'cursor': 0}
+
+def test_stream_sends_events(app, init_database):
+    app.config['FEED_STREAM_SECONDS'] = 0.1
+    task, owner_client, other_client = share(app, init_database)
+    owner_client.patch(f'/api/v1/tasks/{task.id}/status', json={'status': 'COMPLETED'})
+    response = other_client.get('/api/v1/events/stream?since=0')
+    assert response.mimetype == 'text/event-stream'
+    body = response.get_data(as_text=True)
+    assert 'id: ' in body
+    assert '"status": "COMPLETED"' in body
+
+def test_prune_task_events(app):
+    db.session.add_all([
+        TaskEvent(user_id=1, task_id=1, timestamp=datetime.utcnow() - timedelta(days=30)),
+        TaskEvent(user_id=1, task_id=2),
+    ])
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['prune-task-events', '--days', '7'])
+    assert 'Deleted 1 events.' in result.output
+    assert TaskEvent.query.count() == 1
+
+def test_task_page_polls_the_feed_unless_streaming_is_turned_on(app, client, logged_in_user):
+    page = client.get('/tasks').data
+    assert b'data-live-updates="poll"' in page and b'data-poll-interval="10"' in page
+    app.config['LIVE_UPDATES'] = 'stream'
+    assert b'data-live-updates="stream"' in client.get('/tasks').data
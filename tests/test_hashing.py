@@ -0,0 +1,62 @@
+import os
+import signal
+import threading
+from werkzeug.security import generate_password_hash
+from app import db, password_hasher
+from app.models import User
+
+def test_hash_and_verify_through_pool(app):
+    app.extensions['password_hasher']['workers'] = 1
+    pwhash = password_hasher.hash('secret')
+    assert password_hasher.verify(pwhash, 'secret')
+    assert not password_hasher.verify(pwhash, 'wrong')
+    assert app.extensions['password_hasher']['pool'] is not None
+
+def test_broken_pool_is_replaced(app):
+    state = app.extensions['password_hasher']
+    state['workers'] = 1
+    pwhash = password_hasher.hash('secret')
+    broken = state['pool']
+    for process in list(broken._processes.values()):
+        os.kill(process.pid, signal.SIGKILL) # e.g. the OOM killer
+        process.join()
+
+    assert password_hasher.verify(pwhash, 'secret')
+    assert state['pool'] is not broken
+
+def test_login_rehashes_outdated_hash(client, app):
+    user = User(username='legacy', _password=generate_password_hash('legacypassword', 'pbkdf2:sha256:1000'))
+    db.session.add(user)
+    db.session.commit()
+    assert user.password_needs_rehash()
+
+    response = client.post('/login', data={'username': 'legacy', 'password': 'legacypassword'})
+    assert response.status_code == 302
+    db.session.refresh(user)
+    assert not user.password_needs_rehash()
+    assert user.verify_password('legacypassword')
+
+def test_login_returns_503_when_hashing_is_saturated(client, app, init_database):
+    state = app.extensions['password_hasher']
+    state['workers'] = 1
+    state['slots'] = threading.BoundedSemaphore(1)
+    state['timeout'] = 0.01
+    state['slots'].acquire() # Another request holds the only slot
+    try:
+        response = client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    finally:
+        state['slots'].release()
+    assert response.status_code == 503
+    assert b'The server is busy' in response.data
+
+def test_pools_split_the_cores_between_server_workers(app, monkeypatch):
+    state = app.extensions['password_hasher']
+    password_hasher.share_host(app, 3)
+    assert state['workers'] == 0 # PASSWORD_HASH_WORKERS is set by the test config
+
+    del app.config['PASSWORD_HASH_WORKERS']
+    monkeypatch.setattr('os.cpu_count', lambda: 8)
+    password_hasher.share_host(app, 3)
+    assert state['workers'] == 2 and state['slots']._initial_value == 4
+    password_hasher.share_host(app, 9)
+    assert state['workers'] == 1
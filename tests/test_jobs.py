@@ -0,0 +1,109 @@
+import time
+from datetime import datetime
+import pytest
+from app import create_app, db, job_queue, password_hasher
+from app.jobs import handlers, job
+from app.models import User, Task, Permission, Job
+
+@pytest.fixture
+def flaky_job():
+    calls = []
+
+    @job('flaky')
+    def flaky(fail_times):
+        calls.append(1)
+        if len(calls) <= fail_times:
+            raise RuntimeError('try again')
+        return {'calls': len(calls)}
+
+    yield calls
+    del handlers['flaky']
+
+def test_delete_user_runs_as_set_based_job(logged_in_admin, client, init_database, count_queries):
+    user, admin, task = init_database
+    other = Task(title='Admin task', user_id=admin.id)
+    db.session.add_all([Task(title=f'Task {number}', user_id=user.id) for number in range(5)] + [other])
+    db.session.flush()
+    db.session.add_all([
+        Permission(user_id=admin.id, task_id=task.id, can_view=True),
+        Permission(user_id=user.id, task_id=other.id, can_view=True), # Shared with the deleted user
+    ])
+    db.session.commit()
+    user_id = user.id
+    client.application.config['JOB_DELETE_BATCH'] = 2
+
+    response = client.post(f'/admin/delete_user/{user_id}', follow_redirects=True)
+    assert b'is being deleted' in response.data
+    assert db.session.get(User, user_id) is not None # Nothing deleted inside the request
+
+    with count_queries() as queries:
+        assert job_queue.run_pending() == 1
+    # Whole batches of rows per DELETE, never one statement per task or permission
+    assert sum(statement.startswith('DELETE FROM task ') for statement in queries) == 3
+    db.session.expire_all()
+    assert db.session.get(User, user_id) is None
+    assert Task.query.filter_by(user_id=user_id).count() == 0
+    assert Permission.query.count() == 0
+    assert db.session.get(Task, other.id) is not None
+
+    job_id = Job.query.one().id
+    status = client.get(f'/admin/jobs/{job_id}').get_json()
+    assert status['status'] == 'succeeded'
+    assert status['result'] == {'tasks': 6}
+
+def test_user_is_disabled_as_soon_as_the_deletion_is_queued(app, init_database):
+    user, admin, task = init_database
+    user_client = app.test_client()
+    user_client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    assert user_client.get('/tasks').status_code == 200 # Now in the user cache
+    admin_client = app.test_client()
+    admin_client.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
+    admin_client.post(f'/admin/delete_user/{user.id}')
+
+    # Before the job runs: the session is no longer valid and the password no longer works
+    assert user_client.get('/tasks').status_code == 302
+    assert user_client.post('/task/new', data={'title': 'Late', 'description': ''}).status_code == 302
+    assert Task.query.filter_by(title='Late').count() == 0
+    response = app.test_client().post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    assert b'Invalid username or password' in response.data
+    assert job_queue.run_pending() == 1
+
+def test_failed_job_is_retried_with_backoff(app, flaky_job):
+    app.extensions['job_queue']['retry_delay'] = 0
+    queued = job_queue.enqueue('flaky', max_attempts=2, fail_times=1)
+    job_queue.run_pending()
+    assert queued.status == 'succeeded' and queued.attempts == 2
+    assert queued.error is None
+
+    app.extensions['job_queue']['retry_delay'] = 60
+    failing = job_queue.enqueue('flaky', max_attempts=2, fail_times=10)
+    assert job_queue.run_pending() == 1
+    assert failing.status == 'queued' and failing.error == 'RuntimeError: try again'
+    assert failing.run_after > datetime.utcnow() # Not due again yet
+    failing.run_after = datetime.utcnow()
+    db.session.commit()
+    job_queue.run_pending()
+    assert failing.status == 'failed' and failing.attempts == 2
+
+def test_worker_threads_run_enqueued_jobs(tmp_path, flaky_job):
+    class ThreadedConfig:
+        SECRET_KEY = 'test'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "jobs.db"}'
+        PASSWORD_HASH_WORKERS = 0
+        JOB_WORKERS = 1
+        JOB_POLL_INTERVAL = 0.05
+    app = create_app(ThreadedConfig)
+    with app.app_context():
+        try:
+            queued = job_queue.enqueue('flaky', fail_times=0)
+            deadline = time.time() + 5
+            while queued.status != 'succeeded' and time.time() < deadline:
+                time.sleep(0.05)
+                db.session.expire_all()
+            assert queued.status == 'succeeded'
+            assert flaky_job == [1]
+        finally:
+            job_queue.shutdown(timeout=5)
+            db.session.remove()
+            db.engine.dispose()
+            password_hasher.shutdown()
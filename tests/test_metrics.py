@@ -0,0 +1,37 @@
+import logging
+import pytest
+from app import create_app, db, password_hasher
+
+class MetricsConfig:
+    SECRET_KEY = 'test'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    TESTING = True
+    METRICS_ENABLED = True
+    SLOW_QUERY_THRESHOLD_MS = 0 # Log every statement
+
+@pytest.fixture
+def metrics_client():
+    app = create_app(MetricsConfig)
+    with app.app_context():
+        db.create_all()
+    yield app.test_client()
+    with app.app_context():
+        password_hasher.shutdown()
+
+def test_metrics_disabled_by_default(client):
+    assert client.get('/metrics').status_code == 404
+    assert 'metrics' not in client.application.extensions
+
+def test_metrics_record_endpoints(metrics_client, caplog):
+    metrics_client.post('/register', data={'username': 'metrics', 'password': 'metricspassword'})
+    with caplog.at_level(logging.WARNING, logger='app.slow_queries'):
+        metrics_client.post('/login', data={'username': 'metrics', 'password': 'metricspassword'})
+        metrics_client.get('/tasks')
+
+    body = metrics_client.get('/metrics').get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{endpoint="main.tasks"} 1' in body
+    assert 'db_statements_total{endpoint="main.tasks"}' in body
+    assert 'template_render_seconds_total{endpoint="main.tasks"}' in body
+    assert 'password_hash_seconds_total{endpoint="main.login"} 0.0' not in body # Verification was timed
+    assert 'endpoint="metrics"' not in body
+    assert any('Slow query' in record.getMessage() for record in caplog.records)
@@ -0,0 +1,59 @@
+import os
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import upgrade, downgrade
+from sqlalchemy import inspect
+from app import db, init_migrate
+from app.search import include_name
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+
+@pytest.fixture(autouse=True)
+def migrate(app):
+    init_migrate(app) # Only the CLI sets Flask-Migrate up by itself
+
+def test_migrations_match_models(app):
+    db.drop_all()
+    upgrade(directory=MIGRATIONS_DIR)
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={'render_as_batch': True, 'include_name': include_name})
+        assert compare_metadata(context, db.metadata) == []
+
+def test_index_migration_downgrades_cleanly(app):
+    db.drop_all()
+    upgrade(directory=MIGRATIONS_DIR)
+    downgrade(directory=MIGRATIONS_DIR, revision='8f575bc77805')
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes('task')}
+    assert 'ix_task_user_id_timestamp' not in indexes
+
+def test_timestamp_migration_backfills_and_keeps_the_triggers(app):
+    db.drop_all()
+    upgrade(directory=MIGRATIONS_DIR, revision='a2d5e8f41c07')
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO user (id, username, password, is_admin) VALUES (1, 'old', 'x', 0)")
+        connection.exec_driver_sql("INSERT INTO task (id, title, status, user_id) VALUES (1, 'Undated task', 'NOT_STARTED', 1)")
+    upgrade(directory=MIGRATIONS_DIR)
+    with db.engine.begin() as connection:
+        assert connection.exec_driver_sql('SELECT count(*) FROM task WHERE timestamp IS NULL').scalar() == 0
+        connection.exec_driver_sql("INSERT INTO task (id, title, status, user_id, timestamp) VALUES (2, 'Dated', 'COMPLETED', 1, '2026-01-01 00:00:00')")
+        assert connection.exec_driver_sql("SELECT rowid FROM task_fts WHERE task_fts MATCH 'dated'").scalars().all() == [2]
+        assert connection.exec_driver_sql("SELECT count FROM task_status_count WHERE status = 'COMPLETED'").scalar() == 1
+    downgrade(directory=MIGRATIONS_DIR, revision='a2d5e8f41c07')
+    columns = {column['name']: column for column in inspect(db.engine).get_columns('task')}
+    assert columns['timestamp']['nullable']
+
+def test_duplicate_shares_are_merged_before_the_unique_constraint(app):
+    db.drop_all()
+    upgrade(directory=MIGRATIONS_DIR, revision='8f575bc77805')
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO user (id, username, password) VALUES (1, 'owner', 'x'), (2, 'other', 'x')")
+        connection.exec_driver_sql("INSERT INTO task (id, title, status, user_id) VALUES (1, 'Shared', 'NOT_STARTED', 1)")
+        connection.exec_driver_sql(
+            'INSERT INTO permission (id, user_id, task_id, can_view, can_view_status) VALUES '
+            '(1, 2, 1, 0, 0), (2, 2, 1, 1, 0), (3, 2, 1, 0, 1)'
+        )
+    upgrade(directory=MIGRATIONS_DIR, revision='d834a25721b4')
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql('SELECT id, can_view, can_view_status FROM permission').all()
+    assert rows == [(1, 1, 1)]
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from app import db
+from app.models import User, Task, Permission
+from app.pagination import keyset_page, visible_tasks_query, encode_cursor, decode_cursor
+
+def make_tasks(user, count, same_timestamp=False):
+    base = datetime(2024, 1, 1)
+    tasks = []
+    for i in range(count):
+        timestamp = base if same_timestamp else base + timedelta(minutes=i)
+        tasks.append(Task(title=f'Task {i}', user_id=user.id, timestamp=timestamp))
+    db.session.add_all(tasks)
+    db.session.commit()
+    return tasks
+
+def walk_forward(query, per_page):
+    seen = []
+    page = keyset_page(query, per_page)
+    seen.extend(page.items)
+    while page.has_next:
+        page = keyset_page(query, per_page, after=page.next_cursor)
+        seen.extend(page.items)
+    return seen, page
+
+def test_cursor_round_trip(app, init_database):
+    _, _, task = init_database
+    assert decode_cursor(encode_cursor(task)) == (task.timestamp, task.id)
+    assert decode_cursor('not-a-cursor') is None
+
+def test_keyset_walk_covers_every_task_once(app, init_database):
+    user, _, _ = init_database
+    make_tasks(user, 7, same_timestamp=True) # Ties on timestamp are broken by id
+    make_tasks(user, 5)
+    query = Task.query.filter_by(user_id=user.id)
+
+    seen, last_page = walk_forward(query, 3)
+    assert len(seen) == query.count()
+    assert len({task.id for task in seen}) == len(seen)
+    keys = [(task.timestamp, task.id) for task in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    # Walking back from the last page returns the page before it
+    prev_page = keyset_page(query, 3, before=last_page.prev_cursor)
+    assert [task.id for task in prev_page] == [task.id for task in seen[-len(last_page) - 3:-len(last_page)]]
+
+def test_visible_tasks_query_includes_shared_once(app, init_database):
+    user, admin, task = init_database
+    other = User(username='other', password='otherpassword')
+    db.session.add(other)
+    db.session.commit()
+    own = make_tasks(other, 2)
+    db.session.add(Permission(user_id=other.id, task_id=task.id, can_view=True))
+    db.session.commit()
+
+    visible = visible_tasks_query(other).all()
+    assert {t.id for t in visible} == {own[0].id, own[1].id, task.id}
+    assert visible_tasks_query(admin).count() == Task.query.count()
+
+def test_tasks_page_links_to_next_page(logged_in_user, client):
+    with client.application.app_context():
+        make_tasks(db.session.get(User, logged_in_user.id), 4)
+    response = client.get('/tasks?per_page=2')
+    assert response.status_code == 200
+    assert b'Next' in response.data
+    assert b'after=' in response.data
@@ -0,0 +1,61 @@
+from app import db
+from app.models import User, Task, Permission
+
+def add_shared_tasks(owner, viewer, count):
+    tasks = [Task(title=f'Shared {i}', user_id=owner.id) for i in range(count)]
+    db.session.add_all(tasks)
+    db.session.flush()
+    db.session.add_all([
+        Permission(user_id=viewer.id, task_id=task.id, can_view=True, can_view_status=i % 2 == 0)
+        for i, task in enumerate(tasks)
+    ])
+    db.session.commit()
+
+def page_query_count(client, count_queries, url):
+    client.get(url) # Warm the user cache so only the page's own queries are counted
+    db.session.expire_all() # Measure every page from the same cold identity map
+    with count_queries() as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+def test_tasks_page_query_count_is_constant(logged_in_user, client, app, count_queries):
+    app.extensions['task_list_cache']['enabled'] = False # Measure rendering, not cache hits
+    owner = User(username='owner', password='ownerpassword')
+    db.session.add(owner)
+    db.session.commit()
+    viewer = db.session.get(User, logged_in_user.id)
+
+    add_shared_tasks(owner, viewer, 2)
+    small = page_query_count(client, count_queries, '/tasks')
+    add_shared_tasks(owner, viewer, 20)
+    large = page_query_count(client, count_queries, '/tasks')
+    assert small == large
+
+def test_admin_tasks_page_query_count_is_constant(logged_in_admin, client, app, count_queries):
+    small = page_query_count(client, count_queries, '/admin/tasks')
+    owner = User(username='owner', password='ownerpassword')
+    db.session.add(owner)
+    db.session.commit()
+    db.session.add_all([Task(title=f'Task {i}', user_id=owner.id) for i in range(20)])
+    db.session.commit()
+    large = page_query_count(client, count_queries, '/admin/tasks')
+    assert small == large
+
+def test_shared_status_respects_can_view_status(logged_in_user, client, app):
+    owner = User(username='owner', password='ownerpassword')
+    db.session.add(owner)
+    db.session.commit()
+    viewer = db.session.get(User, logged_in_user.id)
+    visible = Task(title='Visible status', user_id=owner.id)
+    hidden = Task(title='Hidden status', user_id=owner.id)
+    db.session.add_all([visible, hidden])
+    db.session.flush()
+    db.session.add_all([
+        Permission(user_id=viewer.id, task_id=visible.id, can_view=True, can_view_status=True),
+        Permission(user_id=viewer.id, task_id=hidden.id, can_view=True, can_view_status=False),
+    ])
+    db.session.commit()
+
+    body = client.get('/tasks').get_data(as_text=True)
+    assert body.count('Status: Not Started') == 1
@@ -0,0 +1,99 @@
+import threading
+import pytest
+from app.models import User
+from app.ratelimit import MemoryBuckets, RedisBuckets, parse_limit
+
+@pytest.fixture
+def limits(app):
+    state = app.extensions['rate_limiter']
+    state['enabled'] = True
+    def configure(endpoint=None, write_limit=None, **rules):
+        if endpoint:
+            state['limits'][endpoint] = [(key, *parse_limit(limit)) for key, limit in rules.items()]
+        if write_limit:
+            state['write_limit'] = parse_limit(write_limit)
+        return state
+    return configure
+
+def test_login_flood_rejected_before_queries_and_hashing(client, init_database, limits, count_queries, monkeypatch):
+    limits('main.login', ip='5/minute', username='2/minute')
+    verified = []
+    monkeypatch.setattr(User, 'verify_password', lambda self, password: verified.append(password) or False)
+
+    statuses = [client.post('/login', data={'username': 'testuser', 'password': 'guess'}).status_code for _ in range(2)]
+    with count_queries() as queries:
+        response = client.post('/login', data={'username': 'TestUser', 'password': 'guess'})
+    assert statuses == [200, 200]
+    assert response.status_code == 429
+    assert 1 <= int(response.headers['Retry-After']) <= 30
+    assert queries == [] and len(verified) == 2
+
+    # Other usernames are only held back by the per-address limit, 3 of whose 5 tokens are spent
+    statuses = [client.post('/login', data={'username': f'other{n}', 'password': 'x'}).status_code for n in range(3)]
+    assert statuses == [200, 200, 429]
+    assert client.get('/login').status_code == 200 # Only posts are limited
+
+def test_write_limit_is_per_user(app, client, init_database, limits):
+    limits(write_limit='2/minute')
+    user, admin, task = init_database
+    client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    statuses = [client.post(f'/task/update_status/{task.id}', data={'status': 'COMPLETED'}).status_code for _ in range(3)]
+    assert statuses == [302, 302, 429]
+
+    # A second user from the same address has a bucket of their own
+    client.get('/logout')
+    client.post('/login', data={'username': 'admin', 'password': 'adminpassword'})
+    assert client.post(f'/task/update_status/{task.id}', data={'status': 'IN_PROGRESS'}).status_code != 429
+
+    stats = client.get('/admin/ratelimit_stats').get_json()
+    assert stats['rejected'] == {'main.update_task_status:user': 1}
+    assert stats['checked'] == 6 # Including the two logins
+
+def test_write_limit_covers_the_api(app, client, logged_in_user, limits):
+    limits(write_limit='2/minute')
+    statuses = [client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'a'}]}).status_code for _ in range(3)]
+    assert statuses == [201, 201, 429]
+    response = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'a'}]})
+    assert response.get_json()['error'].startswith('Too many requests')
+    assert client.get('/api/v1/tasks').status_code == 200
+
+def test_memory_buckets_refill(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr('app.ratelimit.time.monotonic', lambda: clock[0])
+    buckets = MemoryBuckets(maxsize=2)
+    capacity, rate = parse_limit('2/minute')
+    assert [buckets.take('a', capacity, rate)[0] for _ in range(3)] == [True, True, False]
+    assert buckets.take('a', capacity, rate) == (False, 30.0)
+    clock[0] += 30
+    assert buckets.take('a', capacity, rate)[0]
+    buckets.take('b', capacity, rate)
+    buckets.take('c', capacity, rate)
+    assert len(buckets) == 2 # 'a' was evicted and starts over from a full bucket
+    assert buckets.take('a', capacity, rate) == (True, 0.0)
+    with pytest.raises(ValueError):
+        parse_limit('often')
+
+def test_redis_buckets_refill_and_report_retry_after(fake_redis):
+    buckets = RedisBuckets('redis://limits')
+    assert [buckets.take('ip:1', 2, 1 / 60)[0] for _ in range(3)] == [True, True, False]
+    allowed, retry_after = buckets.take('ip:1', 2, 1 / 60)
+    assert not allowed and 0 < retry_after <= 60
+    assert buckets.take('ip:2', 2, 1 / 60) == (True, 0.0) # Buckets are per key
+    assert 0 < buckets.client.ttl('taskmanager:ratelimit:ip:1') <= 121
+
+    buckets.clear()
+    assert buckets.take('ip:1', 2, 1 / 60)[0]
+
+def test_redis_take_is_atomic_across_clients(fake_redis):
+    # Each thread has its own client, like separate worker processes sharing one Redis
+    results, start = [], threading.Barrier(8)
+    def take():
+        buckets = RedisBuckets('redis://limits')
+        start.wait()
+        results.extend(buckets.take('user:1', 5, 1 / 3600)[0] for _ in range(5))
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 5 and len(results) == 40
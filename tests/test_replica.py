@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import insert, select
+from app import create_app, db, password_hasher
+from app.models import User, Task
+
+@pytest.fixture
+def replica_app(tmp_path):
+    class ReplicaConfig:
+        SECRET_KEY = 'test'
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "primary.db"}'
+        REPLICA_DATABASE_URI = f'sqlite:///{tmp_path / "replica.db"}'
+        TESTING = True
+        PASSWORD_HASH_METHOD = 'pbkdf2:sha256:2000'
+        PASSWORD_HASH_WORKERS = 0
+        TASK_LIST_CACHE_ENABLED = False
+
+    app = create_app(ReplicaConfig)
+    with app.app_context():
+        replica = db.engines['replica']
+        db.metadata.create_all(replica)
+        # The same user on both sides, and one task that only each side has (replication lag)
+        user = User(username='reader', password='readerpassword')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(Task(title='Primary only', user_id=user.id))
+        db.session.commit()
+        with replica.begin() as conn:
+            conn.execute(insert(User), [{'id': user.id, 'username': 'reader', 'password': user._password, 'is_admin': False}])
+            conn.execute(insert(Task), [{'title': 'Replica only', 'user_id': user.id}])
+    yield app
+    with app.app_context():
+        password_hasher.shutdown()
+    # The bind's (empty) metadata is registered on the shared `db`; later apps have no such bind
+    db.metadatas.pop('replica', None)
+
+def test_get_reads_from_replica(replica_app):
+    replica_app.config['REPLICA_STICKY_SECONDS'] = 0
+    client = replica_app.test_client()
+    client.post('/login', data={'username': 'reader', 'password': 'readerpassword'})
+    response = client.get('/tasks')
+    assert b'Replica only' in response.data
+    assert b'Primary only' not in response.data
+
+def test_reads_stick_to_primary_after_a_write(replica_app):
+    client = replica_app.test_client()
+    client.post('/login', data={'username': 'reader', 'password': 'readerpassword'})
+    response = client.get('/tasks')
+    assert b'Primary only' in response.data
+    assert b'Replica only' not in response.data
+
+def test_writes_go_to_primary(replica_app):
+    replica_app.config['REPLICA_STICKY_SECONDS'] = 0
+    client = replica_app.test_client()
+    client.post('/login', data={'username': 'reader', 'password': 'readerpassword'})
+    client.post('/task/new', data={'title': 'Written', 'description': ''})
+    with replica_app.app_context():
+        assert db.session.scalar(select(Task.id).where(Task.title == 'Written')) is not None
+        with db.engines['replica'].connect() as conn:
+            assert conn.execute(select(Task.id).where(Task.title == 'Written')).first() is None
+
+def test_user_cache_is_filled_from_the_primary(replica_app):
+    replica_app.config['REPLICA_STICKY_SECONDS'] = 0
+    with replica_app.app_context(), db.engines['replica'].begin() as conn:
+        conn.execute(User.__table__.update().values(is_admin=True)) # Not yet replicated demotion
+    client = replica_app.test_client()
+    client.post('/login', data={'username': 'reader', 'password': 'readerpassword'})
+    backend = replica_app.extensions['user_cache']['backend']
+    backend.clear()
+    assert client.get('/tasks').status_code == 200
+    assert backend.get('1')['is_admin'] is False
@@ -0,0 +1,74 @@
+from app import db
+from app.models import User, Task, Permission, TaskStatus
+from app.search import search_tasks, fts_query
+
+def add_tasks(user, *titles):
+    tasks = [Task(title=title, description=f'About {title.lower()}', user_id=user.id) for title in titles]
+    db.session.add_all(tasks)
+    db.session.commit()
+    return tasks
+
+def test_fts_query_quotes_user_input():
+    assert fts_query('quarterly "report" OR') == '"quarterly" "report" "OR"*'
+    assert fts_query('  ***  ') is None
+
+def test_search_is_ranked_and_limited_to_visible_tasks(app, init_database):
+    user, _, _ = init_database
+    other = User(username='other', password='otherpassword')
+    db.session.add(other)
+    db.session.commit()
+    add_tasks(user, 'Budget review', 'Budget budget planning', 'Groceries')
+    hidden, shared = add_tasks(other, 'Budget secret', 'Budget shared')
+    db.session.add(Permission(user_id=user.id, task_id=shared.id, can_view=True))
+    db.session.commit()
+
+    results, has_more = search_tasks(user, 'budget')
+    titles = [task.title for task in results]
+    assert 'Budget secret' not in titles
+    assert set(titles) == {'Budget review', 'Budget budget planning', 'Budget shared'}
+    assert titles[0] == 'Budget budget planning' # More occurrences rank higher
+    assert not has_more
+
+def test_search_index_follows_edits_and_deletes(app, init_database):
+    user, _, task = init_database
+    assert [t.id for t in search_tasks(user, 'test')[0]] == [task.id]
+
+    task.title = 'Renamed chore'
+    task.description = ''
+    db.session.commit()
+    assert search_tasks(user, 'test')[0] == []
+    assert [t.id for t in search_tasks(user, 'chore')[0]] == [task.id]
+
+    db.session.delete(task)
+    db.session.commit()
+    assert search_tasks(user, 'chore')[0] == []
+
+def test_search_pages(app, init_database):
+    user, _, _ = init_database
+    add_tasks(user, *[f'Invoice {i}' for i in range(5)])
+    first, has_more = search_tasks(user, 'invoice', page=1, per_page=3)
+    second, more_after = search_tasks(user, 'invoice', page=2, per_page=3)
+    assert has_more and not more_after
+    assert len({task.id for task in first + second}) == 5
+
+def test_search_route(logged_in_user, client):
+    client.post('/task/new', data={'title': 'Dentist appointment', 'description': ''})
+    response = client.get('/tasks/search?q=dentist')
+    assert response.status_code == 200
+    assert b'Dentist appointment' in response.data
+
+def test_search_hides_status_of_tasks_shared_without_it(client, init_database):
+    user, _, _ = init_database
+    other = User(username='other', password='otherpassword')
+    db.session.add(other)
+    db.session.commit()
+    task, = add_tasks(user, 'Budget hidden')
+    task.status = TaskStatus.COMPLETED
+    db.session.add(Permission(user_id=other.id, task_id=task.id, can_view=True, can_view_status=False))
+    db.session.commit()
+    client.post('/login', data={'username': 'other', 'password': 'otherpassword'})
+
+    response = client.get('/tasks/search?q=budget')
+    assert b'Budget hidden' in response.data and b'Completed' not in response.data
+    result, = client.get('/api/v1/tasks/search?q=budget').get_json()['tasks']
+    assert result['id'] == task.id and 'status' not in result
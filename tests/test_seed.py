@@ -0,0 +1,21 @@
+import random
+from app import db
+from app.models import User, Task, Permission
+from benchmarks.seed import seed, PASSWORD
+
+def test_seed_generates_users_tasks_and_shares(app):
+    counts = seed(10, 200, share_density=0.25, rng=random.Random(3), password_hash=User(password=PASSWORD)._password)
+    assert counts['users'] == User.query.count() == 10
+    assert counts['tasks'] == Task.query.count() == 200
+    assert counts['permissions'] == Permission.query.count()
+    # About density * (users - 1) shares per task, never with the owner
+    assert 200 * 9 * 0.15 < counts['permissions'] < 200 * 9 * 0.35
+    assert not Permission.query.join(Task).filter(Task.user_id == Permission.user_id).count()
+    assert db.session.get(User, 1).is_admin
+    assert db.session.get(User, 2).verify_password(PASSWORD)
+
+def test_seed_appends_to_existing_rows(app):
+    seed(3, 5, password_hash='x')
+    seed(3, 5, password_hash='x')
+    assert User.query.count() == 6
+    assert Task.query.count() == 10
@@ -0,0 +1,273 @@
+import json
+import threading
+import time
+from datetime import datetime
+import pytest
+from flask import g
+from sqlalchemy import select
+from app import create_app, db, job_queue, password_hasher, store, task_shards
+from app.models import User, Task, TaskLocation, TaskStatus, ArchivedTask
+from app.sharding import shard_tables
+from app.stats import dashboard_stats
+from config import TestConfig
+
+def sharded_app(tmp_path, shards):
+    app = create_app(type('Config', (TestConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "main.db"}',
+        'TASK_SHARDS': [f'sqlite:///{tmp_path / f"shard{number}.db"}' for number in range(shards)],
+    }))
+
+    @app.teardown_request
+    def forget_login_user(exc):
+        g.pop('_login_user', None)
+    return app
+
+def close(app):
+    db.session.remove()
+    task_shards.shutdown()
+    password_hasher.shutdown()
+    # The binds' (empty) metadata is registered on the shared `db`; later apps have no such binds
+    for number in range(task_shards.count):
+        db.metadatas.pop(f'shard{number}', None)
+
+@pytest.fixture
+def sharded(tmp_path):
+    app = sharded_app(tmp_path, 2)
+    with app.app_context():
+        db.create_all()
+        task_shards.create_all()
+        db.session.add_all([User(username=f'user{number}', password='password') for number in range(1, 4)])
+        db.session.commit()
+        yield app
+        close(app)
+
+def login(app, number):
+    client = app.test_client()
+    client.post('/login', data={'username': f'user{number}', 'password': 'password'})
+    return client
+
+def shard_rows(shard, table):
+    with task_shards.engine(shard).connect() as connection:
+        return connection.execute(select(table)).mappings().all()
+
+def test_task_writes_go_to_the_owners_shard(sharded):
+    task, _ = shard_tables()
+    client = login(sharded, 2)
+    client.post('/task/new', data={'title': 'Sharded', 'description': 'On shard 0'})
+    location = TaskLocation.query.one()
+    assert (location.user_id, location.shard) == (2, 0)
+    assert db.session.scalar(select(Task.id)) is None # Nothing in the global task table
+    assert [row['title'] for row in shard_rows(0, task)] == ['Sharded'] and shard_rows(1, task) == []
+
+    client.post(f'/task/edit/{location.id}', data={'title': 'Renamed', 'description': ''})
+    client.post(f'/task/update_status/{location.id}', data={'status': 'IN_PROGRESS'})
+    assert b'Renamed' in client.get('/tasks').data
+    assert store.get_task(location.id).status == TaskStatus.IN_PROGRESS
+
+    # Other users neither see nor change it
+    assert b'Renamed' not in login(sharded, 3).get('/tasks').data
+    login(sharded, 3).post(f'/task/delete/{location.id}')
+    assert store.get_task(location.id) is not None
+    client.post(f'/task/delete/{location.id}')
+    assert store.get_task(location.id) is None and TaskLocation.query.count() == 0 and shard_rows(0, task) == []
+
+def test_listing_merges_owned_and_shared_tasks_across_shards(sharded):
+    owned = [store.create_task(2, f'Mine {number}', None) for number in range(3)]
+    shared = [store.create_task(1, f'Shared {number}', None) for number in range(2)]
+    hidden = store.create_task(3, 'Hidden', None)
+    for task_id in shared:
+        store.share_task(task_id, 2)
+    assert store.share_task(shared[0], 2) is False # Already shared: updated in place
+
+    client = login(sharded, 2)
+    ids, after = [], ''
+    while True:
+        body = client.get(f'/api/v1/tasks?per_page=2&after={after}').get_json()
+        ids += [item['id'] for item in body['tasks']]
+        after = body['next']
+        if not after:
+            break
+    assert ids == sorted(owned + shared, reverse=True)
+    assert hidden not in ids
+
+    # Status changes on the other shard reach the collaborator's feed
+    cursor = client.get('/api/v1/events').get_json()['cursor']
+    login(sharded, 1).patch(f'/api/v1/tasks/{shared[1]}/status', json={'status': 'COMPLETED'})
+    events = client.get(f'/api/v1/events?since={cursor}').get_json()['events']
+    assert [(event['task_id'], event['task']['status']) for event in events] == [(shared[1], 'COMPLETED')]
+
+def test_search_gathers_matches_from_every_shard(sharded):
+    mine = store.create_task(2, 'Quarterly report', 'draft')
+    shared = store.create_task(1, 'Report review', None)
+    store.create_task(1, 'Unshared report', None)
+    store.share_task(shared, 2)
+    store.update_tasks([mine], title='Quarterly report v2') # Reindexed by the shard's triggers
+
+    client = login(sharded, 2)
+    body = client.get('/api/v1/tasks/search?q=report&per_page=1').get_json()
+    assert body['has_more'] and len(body['tasks']) == 1
+    found = body['tasks'] + client.get('/api/v1/tasks/search?q=report&per_page=1&page=2').get_json()['tasks']
+    assert sorted(item['id'] for item in found) == sorted([mine, shared])
+    assert [item['title'] for item in client.get('/api/v1/tasks/search?q=v2').get_json()['tasks']] == ['Quarterly report v2']
+    assert login(sharded, 3).get('/api/v1/tasks/search?q=report').get_json()['tasks'] == []
+
+def test_dashboard_sums_the_counters_of_every_shard(sharded):
+    shared = store.create_task(1, 'Popular', None)
+    store.create_task(2, 'Mine', None)
+    store.update_tasks([store.create_task(2, 'Done', None)], status=TaskStatus.COMPLETED)
+    store.share_task(shared, 2)
+    store.share_task(shared, 3)
+    db.session.execute(db.update(User).where(User.id == 1).values(is_admin=True))
+    db.session.commit()
+
+    stats = login(sharded, 1).get('/admin/dashboard')
+    assert stats.status_code == 200 and 'Popular' in stats.get_data(as_text=True)
+    stats = dashboard_stats()
+    assert stats['totals'] == {'NOT_STARTED': 2, 'IN_PROGRESS': 0, 'COMPLETED': 1} and stats['total'] == 3
+    assert [entry['total'] for entry in stats['users']] == [1, 2, 0]
+    assert [count for _, count in stats['daily']] == [3]
+    assert [(task_id, owner, count) for task_id, _, owner, count in stats['most_shared']] == [(shared, 'user1', 2)]
+
+    result = sharded.test_cli_runner().invoke(args=['rebuild-task-stats'])
+    assert '"task_status_count": 3' in result.output
+
+def test_archiving_is_refused(sharded):
+    result = sharded.test_cli_runner().invoke(args=['archive-tasks', '--enqueue'])
+    assert result.exit_code == 2 and 'not available with TASK_SHARDS' in result.output
+
+    # Tasks archived before the tasks were sharded stay in the archive
+    db.session.add(ArchivedTask(id=99, title='Old', status=TaskStatus.COMPLETED, user_id=2, timestamp=datetime(2024, 1, 1)))
+    db.session.commit()
+    response = login(sharded, 2).post('/api/v1/tasks/restore', json={'ids': [99]})
+    assert response.status_code == 400 and 'TASK_SHARDS' in response.get_json()['error']
+    assert db.session.get(ArchivedTask, 99) is not None
+
+def test_rebalance_moves_tasks_to_added_shards(tmp_path):
+    task, permission = shard_tables()
+    app = sharded_app(tmp_path, 1)
+    with app.app_context():
+        db.create_all()
+        task_shards.create_all()
+        db.session.add_all([User(username=f'user{number}', password='password') for number in range(1, 4)])
+        db.session.commit()
+        ids = {user_id: [store.create_task(user_id, f'Task {user_id}.{number}', None) for number in range(3)] for user_id in (1, 2, 3)}
+        store.share_task(ids[1][0], 2)
+        close(app)
+
+    app = sharded_app(tmp_path, 2)
+    with app.app_context():
+        result = app.test_cli_runner().invoke(args=['rebalance-task-shards', '--batch-size', '2'])
+        assert result.exit_code == 0 and '"moved": 6' in result.output
+        assert sorted(row['user_id'] for row in shard_rows(0, task)) == [2] * 3
+        assert [(row['task_id'], row['user_id']) for row in shard_rows(1, permission)] == [(ids[1][0], 2)]
+        assert {location.shard for location in TaskLocation.query.filter_by(user_id=3)} == {1}
+
+        body = login(app, 2).get('/api/v1/tasks').get_json()
+        assert sorted(item['id'] for item in body['tasks']) == sorted(ids[2] + [ids[1][0]])
+
+        # Deleting a user clears their tasks and shares on every shard
+        job_queue.enqueue('delete-user', user_id=1)
+        job_queue.run_pending()
+        assert [row['user_id'] for row in shard_rows(1, task)] == [3] * 3 and shard_rows(1, permission) == []
+        close(app)
+
+def test_writes_during_a_move_land_on_the_new_shard(tmp_path, monkeypatch):
+    task, permission = shard_tables()
+    app = sharded_app(tmp_path, 1)
+    with app.app_context():
+        db.create_all()
+        task_shards.create_all()
+        db.session.add_all([User(username=f'user{number}', password='password') for number in range(1, 3)])
+        db.session.commit()
+        task_id = store.create_task(1, 'Moving', None)
+        close(app)
+
+    app = sharded_app(tmp_path, 2)
+    with app.app_context():
+        task_shards.create_all()
+        gather = task_shards.gather
+        writers = []
+        def write():
+            with app.app_context():
+                store.update_tasks([task_id], status=TaskStatus.COMPLETED)
+                store.share_task(task_id, 2)
+                db.session.remove()
+        def copy_then_let_writers_in(calls):
+            # The task is copied to shard 1 while a writer that found it on shard 0 waits
+            if set(calls) == {1} and not writers:
+                writers.append(threading.Thread(target=write))
+                writers[0].start()
+                time.sleep(0.2)
+            return gather(calls)
+        monkeypatch.setattr(task_shards, 'gather', copy_then_let_writers_in)
+        assert task_shards.rebalance() == 1
+        writers[0].join(10)
+        monkeypatch.undo()
+
+        assert shard_rows(0, task) == [] and shard_rows(0, permission) == []
+        assert [(row['id'], row['status']) for row in shard_rows(1, task)] == [(task_id, TaskStatus.COMPLETED)]
+        assert [(row['task_id'], row['user_id']) for row in shard_rows(1, permission)] == [(task_id, 2)]
+        close(app)
+
+def test_batch_api_and_bulk_share_write_to_the_shards(sharded):
+    task, permission = shard_tables()
+    client = login(sharded, 2)
+    response = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': f'Batch {n}'} for n in range(3)]})
+    ids = response.get_json()['created']
+    assert response.status_code == 201 and db.session.scalar(select(Task.id)) is None
+    assert sorted(row['id'] for row in shard_rows(0, task)) == sorted(ids)
+
+    assert client.patch('/api/v1/tasks/status', json={'ids': ids[:2], 'status': 'COMPLETED'}).get_json() == {'updated': 2}
+    assert [store.get_task(task_id).status for task_id in ids] == [TaskStatus.COMPLETED] * 2 + [TaskStatus.NOT_STARTED]
+
+    # Shared through the API and the bulk form: user3 sees them, and the shares live on shard 0
+    body = client.post('/api/v1/tasks/share', json={'ids': ids[:2], 'usernames': ['user3']}).get_json()
+    assert (body['created'], body['denied_tasks']) == (2, [])
+    client.post('/tasks/share', data={'task_ids': ids, 'usernames': 'user1, user3'})
+    assert sorted((row['task_id'], row['user_id']) for row in shard_rows(0, permission)) == sorted(
+        [(task_id, 3) for task_id in ids] + [(task_id, 1) for task_id in ids]
+    )
+    assert sorted(item['id'] for item in login(sharded, 3).get('/api/v1/tasks').get_json()['tasks']) == sorted(ids)
+    assert login(sharded, 3).post('/api/v1/tasks/share', json={'ids': ids, 'usernames': ['user1']}).status_code == 403
+
+    assert client.delete('/api/v1/tasks', json={'ids': ids[1:]}).get_json() == {'deleted': 2}
+    assert [row['id'] for row in shard_rows(0, task)] == ids[:1]
+    assert [row['task_id'] for row in shard_rows(0, permission)] == ids[:1] * 2
+
+def test_import_goes_to_the_shards_and_export_is_refused(sharded):
+    task, permission = shard_tables()
+    records = [
+        {'title': 'Imported', 'owner': 'user1', 'shared_with': ['user2']},
+        {'title': 'Other shard', 'owner': 'user2'},
+    ]
+    body = '\n'.join(json.dumps(record) for record in records)
+    admin = db.session.get(User, 1)
+    admin.is_admin = True
+    db.session.commit()
+    client = login(sharded, 1)
+    result = client.post('/api/v1/tasks/import?keep_owners=1', data=body, content_type='application/x-ndjson').get_json()
+    assert (result['created'], result['shared']) == (2, 1)
+    assert [row['title'] for row in shard_rows(1, task)] == ['Imported']
+    assert [row['title'] for row in shard_rows(0, task)] == ['Other shard']
+    assert [row['user_id'] for row in shard_rows(1, permission)] == [2]
+
+    response = client.get('/api/v1/tasks/export?scope=all')
+    assert response.status_code == 400 and 'TASK_SHARDS' in response.get_json()['error']
+    result = sharded.test_cli_runner().invoke(args=['export-tasks'])
+    assert result.exit_code != 0 and 'TASK_SHARDS' in result.output
+
+def test_admin_task_pages_use_the_shards(sharded):
+    task, _ = shard_tables()
+    ids = [store.create_task(user_id, f'Task of {user_id}', None) for user_id in (2, 3)]
+    admin = db.session.get(User, 1)
+    admin.is_admin = True
+    db.session.commit()
+    client = login(sharded, 1)
+    page = client.get('/admin/tasks').data
+    assert b'Task of 2' in page and b'Task of 3' in page
+
+    assert b'Task of 2' in client.get(f'/admin/edit_task/{ids[0]}').data
+    client.post(f'/admin/edit_task/{ids[0]}', data={'title': 'Edited', 'description': 'By admin'})
+    assert (store.get_task(ids[0]).title, store.get_task(ids[0]).description) == ('Edited', 'By admin')
+    client.post(f'/admin/delete_task/{ids[1]}')
+    assert store.get_task(ids[1]) is None and shard_rows(1, task) == []
@@ -0,0 +1,55 @@
+from app import db
+from app.models import User, Task, Permission
+from app.sharing import bulk_share
+
+def make_users(*names):
+    users = [User(username=name, password='password') for name in names]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+def test_bulk_share_counts(app, init_database):
+    owner, _, task = init_database
+    alice, bob = make_users('alice', 'bob')
+    second = Task(title='Second', user_id=owner.id)
+    db.session.add(second)
+    db.session.add(Permission(user_id=alice.id, task_id=task.id, can_view=True, can_view_status=True))
+    db.session.add(Permission(user_id=bob.id, task_id=task.id, can_view=False, can_view_status=False))
+    db.session.commit()
+
+    result = bulk_share([task.id, second.id], ['alice', 'bob', 'testuser', 'ghost'])
+    assert result.as_dict() == {
+        'created': 2, # alice and bob on the second task
+        'updated': 1, # bob regains access to the first task
+        'skipped': 3, # alice already had access, the owner needs none (twice)
+        'unknown_users': ['ghost'],
+        'denied_tasks': [],
+    }
+    db.session.expire_all()
+    assert Permission.query.filter_by(can_view=True, can_view_status=True).count() == 4
+    assert Permission.query.count() == 4
+
+def test_bulk_share_respects_ownership(app, init_database):
+    owner, _, task = init_database
+    alice, bob = make_users('alice', 'bob')
+    foreign = Task(title='Alice owns this', user_id=alice.id)
+    db.session.add(foreign)
+    db.session.commit()
+
+    result = bulk_share([task.id, foreign.id], ['bob'], actor=owner)
+    assert result.denied_tasks == [foreign.id]
+    assert result.created == 1
+    assert Permission.query.filter_by(task_id=foreign.id).count() == 0
+
+def test_bulk_share_route(logged_in_user, client, init_database):
+    _, _, task = init_database
+    make_users('alice', 'bob')
+    response = client.post('/tasks/share', data={'task_ids': [task.id], 'usernames': 'alice, bob'}, follow_redirects=True)
+    assert b'Sharing done: 2 created, 0 updated, 0 unchanged.' in response.data
+
+def test_share_tasks_cli(app, init_database):
+    _, _, task = init_database
+    make_users('alice')
+    result = app.test_cli_runner().invoke(args=['share-tasks', '--task', str(task.id), '--user', 'alice'])
+    assert result.exit_code == 0
+    assert '"created": 1' in result.output
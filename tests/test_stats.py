@@ -0,0 +1,69 @@
+from datetime import datetime
+from app import db, job_queue
+from app.models import Task, Permission, TaskStatus, TaskStatusCount, TaskDailyCount, TaskShareCount
+from app.stats import rebuild_stats
+
+def counters():
+    db.session.expire_all()
+    return (
+        {(row.user_id, row.status): row.count for row in TaskStatusCount.query if row.count},
+        {row.day: row.count for row in TaskDailyCount.query if row.count},
+        {row.task_id: row.count for row in TaskShareCount.query if row.count},
+    )
+
+# The triggers must leave the counters exactly where a rebuild from scratch would
+def assert_counters_match_rebuild():
+    incremental = counters()
+    rebuild_stats()
+    assert counters() == incremental
+    return incremental
+
+def test_counters_follow_every_write_path(logged_in_admin, client, init_database):
+    user, admin, task = init_database
+    tasks = [Task(title=f'Task {number}', user_id=user.id, timestamp=datetime(2024, 5, number + 1)) for number in range(3)]
+    db.session.add_all(tasks)
+    db.session.commit()
+    statuses, daily, _ = assert_counters_match_rebuild()
+    assert statuses[(user.id, 'NOT_STARTED')] == 4
+    assert daily[datetime(2024, 5, 1).date()] == 1
+
+    created = client.post('/api/v1/tasks/batch', json={'tasks': [{'title': 'a'}, {'title': 'b', 'status': 'COMPLETED'}]}).get_json()['created']
+    client.patch('/api/v1/tasks/status', json={'ids': created, 'status': 'IN_PROGRESS'})
+    client.post('/api/v1/tasks/share', json={'ids': [task.id, created[0]], 'usernames': ['testuser', 'admin']})
+    db.session.add(Permission(user_id=admin.id, task_id=tasks[0].id, can_view=False)) # Not a share yet
+    db.session.commit()
+    statuses, _, shares = assert_counters_match_rebuild()
+    assert statuses[(admin.id, 'IN_PROGRESS')] == 2
+    assert shares == {task.id: 1, created[0]: 1}
+
+    client.delete('/api/v1/tasks', json={'ids': [created[0]]})
+    client.post(f'/admin/delete_user/{user.id}')
+    job_queue.run_pending()
+    statuses, daily, shares = assert_counters_match_rebuild()
+    assert statuses == {(admin.id, 'IN_PROGRESS'): 1}
+    assert shares == {}
+
+def test_dashboard_reads_counters_only(logged_in_admin, client, init_database, count_queries):
+    user, admin, task = init_database
+    db.session.add(Task(title='Done', user_id=admin.id, status=TaskStatus.COMPLETED))
+    db.session.add(Permission(user_id=admin.id, task_id=task.id, can_view=True))
+    db.session.commit()
+
+    with count_queries() as queries:
+        response = client.get('/admin/dashboard')
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert 'Test Task' in page # Most shared
+    assert not any('FROM task' in statement and 'GROUP BY' in statement for statement in queries)
+
+    client.get('/logout')
+    client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    assert client.get('/admin/dashboard').status_code == 403
+
+def test_rebuild_command_repairs_drift(app, init_database):
+    user, _, _ = init_database
+    db.session.execute(db.update(TaskStatusCount).values(count=99))
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['rebuild-task-stats'])
+    assert '"task_status_count": 1' in result.output
+    assert counters()[0] == {(user.id, 'NOT_STARTED'): 1}
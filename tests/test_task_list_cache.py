@@ -0,0 +1,49 @@
+from app import db
+from app.models import User
+
+def test_etag_round_trip_returns_304(logged_in_user, client):
+    first = client.get('/tasks')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+
+    second = client.get('/tasks', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert second.data == b''
+
+def test_write_invalidates_cached_list(logged_in_user, client):
+    client.get('/tasks')
+    etag = client.get('/tasks').headers['ETag']
+    client.post('/task/new', data={'title': 'Fresh Task', 'description': ''})
+
+    response = client.get('/tasks', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'Fresh Task' in response.data
+
+def test_status_change_invalidates_users_it_is_shared_with(app, init_database):
+    user, _, task = init_database
+    other = User(username='other', password='otherpassword')
+    db.session.add(other)
+    db.session.commit()
+
+    owner_client = app.test_client()
+    owner_client.post('/login', data={'username': 'testuser', 'password': 'testpassword'})
+    owner_client.post(f'/task/share/{task.id}', data={'username': 'other'})
+
+    other_client = app.test_client()
+    other_client.post('/login', data={'username': 'other', 'password': 'otherpassword'})
+    other_client.get('/tasks')
+    cached = other_client.get('/tasks')
+    assert b'Status: Not Started' in cached.data
+
+    owner_client.post(f'/task/update_status/{task.id}', data={'status': 'COMPLETED'})
+    response = other_client.get('/tasks', headers={'If-None-Match': cached.headers['ETag']})
+    assert response.status_code == 200
+    assert b'Status: Completed' in response.data
+
+def test_flashed_page_is_not_conditional(logged_in_user, client, init_database):
+    _, _, task = init_database
+    client.post(f'/task/update_status/{task.id}', data={'status': 'BOGUS'})
+    response = client.get('/tasks') # Carries the "Invalid status." flash
+    assert b'Invalid status.' in response.data
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
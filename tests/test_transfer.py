@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+from app import db
+from app.models import User, Task, Permission, TaskStatus
+from app.transfer import export_chunks, import_tasks
+
+def share(task, user, can_view_status=True):
+    db.session.add(Permission(user_id=user.id, task_id=task.id, can_view=True, can_view_status=can_view_status))
+    db.session.commit()
+
+def test_export_streams_owned_and_shared_tasks(logged_in_user, client, init_database):
+    user, admin, task = init_database
+    task.status = TaskStatus.COMPLETED
+    hidden = Task(title='Status hidden', user_id=admin.id, status=TaskStatus.IN_PROGRESS)
+    private = Task(title='Private', user_id=admin.id)
+    db.session.add_all([hidden, private])
+    db.session.commit()
+    share(task, admin)
+    share(hidden, user, can_view_status=False)
+    client.application.config['EXPORT_BATCH_SIZE'] = 1
+
+    response = client.get('/api/v1/tasks/export')
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(row['title'], row['status'], row['owner'], row['shared_with']) for row in rows] == [
+        ('Test Task', 'COMPLETED', 'testuser', ['admin']),
+        ('Status hidden', None, 'admin', []), # Neither the status nor the other shares of a shared task
+    ]
+
+    response = client.get('/api/v1/tasks/export?format=csv&scope=owned')
+    assert response.headers['Content-Disposition'] == 'attachment; filename=tasks-owned.csv'
+    records = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(record['id'], record['shared_with']) for record in records] == [(str(task.id), 'admin')]
+
+    assert client.get('/api/v1/tasks/export?scope=all').status_code == 403
+
+def test_export_then_import_round_trip(app, init_database):
+    user, admin, task = init_database
+    db.session.add_all([Task(title=f'Task {number}', description='x', user_id=admin.id) for number in range(4)])
+    db.session.commit()
+    share(task, admin)
+    exports = {fmt: ''.join(export_chunks(fmt, 'all')) for fmt in ('csv', 'ndjson')}
+    for fmt, exported in exports.items():
+        before = Task.query.count()
+        result = import_tasks(io.StringIO(exported), fmt, batch_size=2)
+        assert result.as_dict() == {'created': 5, 'shared': 1, 'skipped': 0, 'unknown_users': [], 'errors': []}
+        assert Task.query.count() == before + 5
+    assert Task.query.filter_by(user_id=admin.id, title='Task 3').count() == 3
+    assert Permission.query.filter_by(user_id=admin.id).count() == 3
+
+def test_import_reports_bad_records(logged_in_user, client, init_database):
+    body = '\n'.join([
+        json.dumps({'title': 'Good', 'status': 'In Progress', 'shared_with': ['admin', 'ghost']}),
+        'not json',
+        json.dumps({'title': ''}),
+        json.dumps({'title': 'Bad status', 'status': 'DONE'}),
+        json.dumps({'title': 'Bad description', 'description': ['a', 'b']}),
+    ])
+    response = client.post('/api/v1/tasks/import', data=body, content_type='application/x-ndjson')
+    assert response.get_json() == {
+        'created': 1,
+        'shared': 1,
+        'skipped': 4,
+        'unknown_users': ['ghost'],
+        'errors': [
+            'line 2: invalid JSON', 'line 3: title is required', "line 4: invalid status 'DONE'",
+            'line 5: description must be a string',
+        ],
+    }
+    created = Task.query.filter_by(title='Good').one()
+    assert created.user_id == logged_in_user.id and created.status == TaskStatus.IN_PROGRESS
+
+    response = client.post('/api/v1/tasks/import?keep_owners=1', data=body)
+    assert response.status_code == 403 # Only admins may import for other users
+
+def test_cli_export_and_import(app, init_database, tmp_path):
+    runner = app.test_cli_runner()
+    path = tmp_path / 'tasks.csv'
+    result = runner.invoke(args=['export-tasks', '--output', str(path)])
+    assert result.exit_code == 0
+    assert path.read_text().startswith('id,title,description,status,owner,timestamp,shared_with')
+
+    result = runner.invoke(args=['import-tasks', str(path), '--owner', 'admin'])
+    assert json.loads(result.output)['created'] == 1
+    assert Task.query.filter_by(user_id=db.session.scalar(db.select(User.id).filter_by(username='admin'))).count() == 1
@@ -0,0 +1,127 @@
+import threading
+import pytest
+from flask import g
+from sqlalchemy import event
+from app import create_app, db, password_hasher, status_writes, store
+from app.models import User, Task, TaskStatus, TaskEvent
+from config import TestConfig
+
+# The flusher thread opens its own session, so the database is a file rather than in memory
+@pytest.fixture
+def buffered_app(tmp_path):
+    def make(**settings):
+        app = create_app(type('Config', (TestConfig,), dict(
+            {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "app.db"}', 'STATUS_WRITE_BEHIND': True}, **settings
+        )))
+
+        @app.teardown_request
+        def forget_login_user(exc):
+            g.pop('_login_user', None)
+        apps.append(app)
+        return app
+    apps = []
+    yield make
+    for app in apps:
+        with app.app_context():
+            status_writes.shutdown()
+            db.session.remove()
+            password_hasher.shutdown()
+
+def setup(app, tasks=2):
+    with app.app_context():
+        db.create_all()
+        owner = User(username='owner', password='ownerpassword')
+        db.session.add(owner)
+        db.session.commit()
+        db.session.add_all([Task(title=f'Task {number}', user_id=owner.id) for number in range(tasks)])
+        db.session.commit()
+        task_ids = [task.id for task in Task.query.order_by(Task.id)]
+        db.session.remove()
+    client = app.test_client()
+    client.post('/login', data={'username': 'owner', 'password': 'ownerpassword'})
+    return client, task_ids
+
+def statuses(app):
+    with app.app_context():
+        result = {task.id: task.status for task in Task.query}
+        db.session.remove()
+        return result
+
+def test_buffered_changes_coalesce_into_one_commit(buffered_app):
+    app = buffered_app(STATUS_WRITE_ACK='buffered', STATUS_FLUSH_INTERVAL=60)
+    client, (first, second) = setup(app)
+    for status in ('IN_PROGRESS', 'COMPLETED', 'IN_PROGRESS'):
+        client.post(f'/task/update_status/{first}', data={'status': status})
+    client.patch(f'/api/v1/tasks/{second}/status', json={'status': 'COMPLETED'})
+    assert set(statuses(app).values()) == {TaskStatus.NOT_STARTED} # Acknowledged, not written yet
+
+    with app.app_context():
+        assert status_writes.stats()['waiting'] == 2
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        assert status_writes.flush() == 2
+        assert sum(statement.startswith('UPDATE task SET status') for statement in statements) == 2 # One per status
+        assert status_writes.stats() == {'flushes': 1, 'writes': 2, 'waiting': 0}
+        assert TaskEvent.query.filter_by(task_id=first).count() == 1
+        db.session.remove()
+    assert statuses(app) == {first: TaskStatus.IN_PROGRESS, second: TaskStatus.COMPLETED}
+
+    # Shutting down writes what is still buffered
+    client.post(f'/task/update_status/{second}', data={'status': 'NOT_STARTED'})
+    with app.app_context():
+        status_writes.shutdown()
+    assert statuses(app)[second] == TaskStatus.NOT_STARTED
+
+def test_flushed_acknowledgement_waits_for_a_shared_commit(buffered_app):
+    app = buffered_app(STATUS_FLUSH_INTERVAL=60, STATUS_FLUSH_BATCH=4)
+    _, task_ids = setup(app, tasks=4)
+    returned = []
+
+    def write(task_id):
+        with app.app_context():
+            status_writes.write(task_id, TaskStatus.COMPLETED)
+            returned.append(task_id)
+    threads = [threading.Thread(target=write, args=(task_id,)) for task_id in task_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    # The fourth change filled the batch: all four returned after one commit, long before the interval
+    assert sorted(returned) == task_ids
+    assert set(statuses(app).values()) == {TaskStatus.COMPLETED}
+    with app.app_context():
+        assert status_writes.stats() == {'flushes': 1, 'writes': 4, 'waiting': 0}
+
+def test_failed_flush_is_reported_to_waiting_requests(buffered_app, monkeypatch):
+    app = buffered_app(STATUS_FLUSH_INTERVAL=0.01)
+    client, (task_id, _) = setup(app)
+    def fail(statuses):
+        raise RuntimeError('disk full')
+    monkeypatch.setattr(store, 'set_statuses', fail)
+
+    response = client.post(f'/task/update_status/{task_id}', data={'status': 'COMPLETED'}, follow_redirects=True)
+    assert b'The task status could not be saved.' in response.data
+    response = client.patch(f'/api/v1/tasks/{task_id}/status', json={'status': 'COMPLETED'})
+    assert response.status_code == 503
+    assert statuses(app)[task_id] == TaskStatus.NOT_STARTED
+
+def test_batch_status_api_goes_through_the_buffer(buffered_app):
+    app = buffered_app(STATUS_WRITE_ACK='buffered', STATUS_FLUSH_INTERVAL=60)
+    client, (first, second) = setup(app)
+    client.patch(f'/api/v1/tasks/{first}/status', json={'status': 'IN_PROGRESS'})
+    assert client.patch('/api/v1/tasks/status', json={'ids': [first, second], 'status': 'COMPLETED'}).status_code == 200
+    with app.app_context():
+        status_writes.flush()
+    # The older buffered change did not overwrite the batch update
+    assert statuses(app) == {first: TaskStatus.COMPLETED, second: TaskStatus.COMPLETED}
+
+def test_timed_out_change_is_not_saved_later(buffered_app):
+    app = buffered_app(STATUS_FLUSH_INTERVAL=60, STATUS_ACK_TIMEOUT=0.05)
+    client, (task_id, _) = setup(app)
+    response = client.patch(f'/api/v1/tasks/{task_id}/status', json={'status': 'COMPLETED'})
+    assert response.status_code == 503
+    with app.app_context():
+        assert status_writes.stats()['waiting'] == 0
+        assert status_writes.flush() == 0
+    assert statuses(app)[task_id] == TaskStatus.NOT_STARTED